@@ -0,0 +1,488 @@
+"""
+Load benchmark for the Wasp Sensor integration.
+
+Synthetic motion and door traffic is generated for a number of boxes and fed
+through the integration, reporting events per second, the time to dispatch an
+event, the event to decision latency, timer lag, pending timer and task counts
+and peak memory as JSON.
+
+The event to decision latency includes the sensor change delay and is taken from
+the same latency histogram as the metrics of the integration, the dispatch time
+only covers handing the event to the boxes.
+
+Two modes are available:
+
+- engine: the engine and the timer wheel only, runs without Home Assistant
+- stack: the coordinator, the binary sensor entities, the engine and the timer
+  wheel against an in-process fake of hass.states, the event bus and
+  async_track_state_change_event, this needs Home Assistant to be importable
+
+Usage:
+
+    python -m benchmarks.bench --mode engine --boxes 1 10 100 1000 10000
+    python -m benchmarks.bench --output new.json --compare old.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+import gc
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any
+
+from .core import PACKAGE_DIR, load_module
+from .fake_hass import FakeHomeAssistant
+
+CONF_WASP_SENSORS = "wasp_sensors"
+CONF_WASP_INV_SENSORS = "wasp_inv_sensors"
+CONF_BOX_SENSORS = "box_sensors"
+CONF_BOX_INV_SENSORS = "box_inv_sensors"
+
+# Boxes sharing a hallway motion sensor
+HALLWAY_GROUP_SIZE = 8
+
+
+@dataclass
+class Scenario:
+    """Parameters of a benchmark run."""
+
+    mode: str
+    boxes: int
+    events: int
+    timeout: float
+    sensor_change_delay: float
+    batch: int
+    seed: int
+
+
+@dataclass
+class Stats:
+    """Measurements collected during a benchmark run."""
+
+    dispatch_ns: list[int] = field(default_factory=list)
+    # Latency histogram of the metrics of the integration
+    latency: Any = None
+    timer_lags_ms: list[float] = field(default_factory=list)
+    state_writes: int = 0
+    peak_pending_timers: int = 0
+    peak_pending_tasks: int = 0
+
+
+def box_config(index: int) -> dict[str, list[str]]:
+    """Return the sensors of a synthetic box."""
+    return {
+        CONF_WASP_SENSORS: [
+            f"binary_sensor.motion_{index}_a",
+            f"binary_sensor.motion_{index}_b",
+            f"binary_sensor.hallway_{index // HALLWAY_GROUP_SIZE}",
+        ],
+        CONF_WASP_INV_SENSORS: [],
+        CONF_BOX_SENSORS: [f"binary_sensor.door_{index}"],
+        CONF_BOX_INV_SENSORS: [],
+    }
+
+
+def generate_traffic(scenario: Scenario) -> tuple[dict[str, str], list[str]]:
+    """Return the initial sensor states and the order in which sensors toggle."""
+    rng = random.Random(scenario.seed)
+    states: dict[str, str] = {}
+    sensors_per_box = []
+    for index in range(scenario.boxes):
+        config = box_config(index)
+        sensors = [entity_id for role in config.values() for entity_id in role]
+        sensors_per_box.append(sensors)
+        for entity_id in sensors:
+            states[entity_id] = "off"
+
+    toggles = [
+        rng.choice(sensors_per_box[rng.randrange(scenario.boxes)])
+        for _ in range(scenario.events)
+    ]
+    return states, toggles
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Return a percentile by nearest rank."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[
+        min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    ]
+
+
+class EngineBox:
+    """Minimal adapter of the engine onto the timer wheel, like the entity."""
+
+    __slots__ = (
+        "engine",
+        "wheel",
+        "timers",
+        "fired",
+        "states",
+        "stats",
+        "timeout_key",
+    )
+
+    def __init__(
+        self, engine, wheel, states: dict[str, str], stats: Stats, timeout_key: str
+    ) -> None:
+        self.engine = engine
+        self.wheel = wheel
+        self.timers: dict[str, Any] = {}
+        # Loop time the events waiting for a sensor change delay were fired
+        self.fired: dict[str, float] = {}
+        self.states = states
+        self.stats = stats
+        self.timeout_key = timeout_key
+
+    def dispatch(self, entity_id: str, role: str, state: str, fired: float) -> None:
+        """Handle a state change of one of the sensors of this box."""
+        if role in (CONF_WASP_SENSORS, CONF_WASP_INV_SENSORS):
+            decision = self.engine.wasp_sensor_changed(entity_id, role)
+        else:
+            decision = self.engine.box_sensor_changed(entity_id, role, state)
+        self.apply(decision)
+
+        if decision.schedule is not None and decision.schedule.key != self.timeout_key:
+            self.fired[decision.schedule.key] = fired
+        else:
+            self.stats.latency.record(self.engine.clock() - fired)
+
+    def deadline_reached(self, deadline) -> None:
+        """Handle a deadline of the engine."""
+        self.stats.timer_lags_ms.append((self.engine.clock() - deadline.when) * 1000.0)
+        del self.timers[deadline.key]
+        if deadline.key == self.timeout_key:
+            self.apply(self.engine.deadline_reached(deadline, None))
+            return
+
+        state = self.states.get(deadline.key)
+        self.apply(self.engine.deadline_reached(deadline, state))
+        if (fired := self.fired.pop(deadline.key, None)) is not None:
+            self.stats.latency.record(self.engine.clock() - fired)
+
+    def apply(self, decision) -> None:
+        """Act upon a decision of the engine."""
+        if decision.cancel is not None:
+            self.fired.pop(decision.cancel, None)
+            if (timer := self.timers.pop(decision.cancel, None)) is not None:
+                timer.cancel()
+        if (deadline := decision.schedule) is not None:
+            self.timers[deadline.key] = self.wheel.schedule_at(
+                deadline.when, self.deadline_reached, deadline, owner=self
+            )
+        if decision.write:
+            self.stats.state_writes += 1
+
+
+async def run_engine(scenario: Scenario, stats: Stats) -> tuple[int, float]:
+    """Run a scenario against the engine, return the events and duration."""
+    engine_module = load_module("engine")
+    models = load_module("models")
+    timer_module = load_module("timer")
+    loop = asyncio.get_running_loop()
+    stats.latency = load_module("metrics").LatencyHistogram()
+
+    states, toggles = generate_traffic(scenario)
+    wheel = timer_module.TimerWheel(loop)
+
+    index: dict[str, list[tuple[EngineBox, str]]] = {}
+    for box_index in range(scenario.boxes):
+        config = box_config(box_index)
+        engine = engine_module.WaspBoxEngine(
+            models.BoxConfig.from_config(
+                {
+                    "name": f"box {box_index}",
+                    "timeout": scenario.timeout,
+                    "sensor_change_delay": scenario.sensor_change_delay,
+                    **config,
+                }
+            ),
+            clock=loop.time,
+        )
+        engine.rescan(states.get)
+        box = EngineBox(engine, wheel, states, stats, engine_module.TIMEOUT)
+        for role, entity_ids in config.items():
+            for entity_id in entity_ids:
+                index.setdefault(entity_id, []).append((box, role))
+
+    def fire(entity_id: str) -> None:
+        state = states[entity_id] = "on" if states[entity_id] == "off" else "off"
+        fired = loop.time()
+        for box, role in index[entity_id]:
+            box.dispatch(entity_id, role, state, fired)
+
+    return await _drive(scenario, stats, toggles, fire, lambda: len(wheel))
+
+
+async def run_stack(scenario: Scenario, stats: Stats) -> tuple[int, float]:
+    """Run a scenario against the binary sensor entities and the coordinator."""
+    # pylint: disable=import-outside-toplevel
+    from homeassistant.components.binary_sensor import BinarySensorEntityDescription
+    from homeassistant.helpers import entity_registry as er
+
+    from custom_components.wasp_sensor import (
+        binary_sensor,
+        coordinator,
+        metrics,
+        models,
+    )
+
+    from . import fake_hass
+
+    coordinator.async_track_state_change_event = (
+        fake_hass.async_track_state_change_event
+    )
+
+    class BenchWaspBinarySensor(binary_sensor.WaspBinarySensor):
+        """Entity that counts state writes instead of writing state."""
+
+        def async_write_ha_state(self) -> None:
+            stats.state_writes += 1
+
+        def _deadline_reached(self, deadline, this_state=None) -> None:
+            stats.timer_lags_ms.append((self.hass.loop.time() - deadline.when) * 1000.0)
+            super()._deadline_reached(deadline, this_state)
+
+    loop = asyncio.get_running_loop()
+    hass = FakeHomeAssistant(loop)
+    # The boxes look up which of their sensors are groups when they start
+    hass.data[er.DATA_REGISTRY] = fake_hass.FakeEntityRegistry()
+    states, toggles = generate_traffic(scenario)
+    for entity_id, state in states.items():
+        hass.states.async_set(entity_id, state)
+
+    wasp_coordinator = coordinator.async_get_coordinator(hass)
+    entities = []
+    for box_index in range(scenario.boxes):
+        config = models.BoxConfig.from_config(
+            {
+                "name": f"box {box_index}",
+                "timeout": scenario.timeout,
+                "sensor_change_delay": scenario.sensor_change_delay,
+                **box_config(box_index),
+            }
+        )
+        entity = BenchWaspBinarySensor(
+            BinarySensorEntityDescription(key="occupancy", name=config.name),
+            f"bench_{box_index}",
+            hass,
+            config,
+        )
+        entity.entity_id = f"binary_sensor.wasp_box_{box_index}"
+        entity._coordinator = wasp_coordinator  # pylint: disable=protected-access
+        wasp_coordinator.async_add_box(entity)
+        entities.append(entity)
+
+    # Let the coordinator start the boxes and install its subscription
+    await asyncio.sleep(0)
+
+    def fire(entity_id: str) -> None:
+        state = states[entity_id] = "on" if states[entity_id] == "off" else "off"
+        hass.states.async_set(entity_id, state)
+
+    result = await _drive(
+        scenario, stats, toggles, fire, lambda: len(wasp_coordinator.timers)
+    )
+    stats.latency = metrics.Metrics.total(entity.metrics for entity in entities).latency
+    return result
+
+
+async def _drive(scenario, stats, toggles, fire, pending_timers) -> tuple[int, float]:
+    """Fire the events, yielding to the loop every batch so timers can run."""
+    dispatches = stats.dispatch_ns
+    perf_counter_ns = time.perf_counter_ns
+    batch = scenario.batch
+
+    start = time.perf_counter()
+    for count, entity_id in enumerate(toggles, 1):
+        fired = perf_counter_ns()
+        fire(entity_id)
+        dispatches.append(perf_counter_ns() - fired)
+
+        if count % batch == 0:
+            stats.peak_pending_timers = max(stats.peak_pending_timers, pending_timers())
+            stats.peak_pending_tasks = max(
+                stats.peak_pending_tasks, len(asyncio.all_tasks()) - 1
+            )
+            await asyncio.sleep(0)
+    duration = time.perf_counter() - start
+
+    # Let the pending deadlines fire
+    await asyncio.sleep(scenario.timeout + scenario.sensor_change_delay + 0.05)
+
+    return len(toggles), duration
+
+
+async def run_scenario(scenario: Scenario, trace_memory: bool) -> dict[str, Any]:
+    """Run a scenario and return the results."""
+    stats = Stats()
+    runner = run_engine if scenario.mode == "engine" else run_stack
+
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        events, duration = await runner(scenario, stats)
+        peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    dispatches_us = [dispatch / 1000.0 for dispatch in stats.dispatch_ns]
+    return {
+        **asdict(scenario),
+        "events_per_sec": round(events / duration, 1) if duration else None,
+        "dispatch_us": {
+            "p50": round(percentile(dispatches_us, 0.50), 2),
+            "p99": round(percentile(dispatches_us, 0.99), 2),
+            "max": round(max(dispatches_us, default=0.0), 2),
+        },
+        "latency_ms": stats.latency.as_dict(),
+        "timer_lag_ms": {
+            "p50": round(percentile(stats.timer_lags_ms, 0.50), 3),
+            "p99": round(percentile(stats.timer_lags_ms, 0.99), 3),
+        },
+        "timers_fired": len(stats.timer_lags_ms),
+        "state_writes": stats.state_writes,
+        "peak_pending_timers": stats.peak_pending_timers,
+        "peak_pending_tasks": stats.peak_pending_tasks,
+        "peak_memory_kib": (
+            round(peak_memory / 1024, 1) if peak_memory is not None else None
+        ),
+    }
+
+
+def metadata() -> dict[str, Any]:
+    """Return information to tell benchmark runs apart."""
+    with open(PACKAGE_DIR / "manifest.json", encoding="utf-8") as manifest:
+        version = json.load(manifest)["version"]
+
+    return {
+        "version": version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any], tolerance: float):
+    """Print the difference with a baseline, return the number of regressions."""
+    previous = {(run["mode"], run["boxes"]): run for run in baseline["results"]}
+    regressions = 0
+    for run in current["results"]:
+        if (old := previous.get((run["mode"], run["boxes"]))) is None:
+            continue
+
+        checks = (
+            ("events_per_sec", run["events_per_sec"], old["events_per_sec"], 1),
+            (
+                "dispatch p99",
+                run["dispatch_us"]["p99"],
+                old.get("dispatch_us", {}).get("p99"),
+                -1,
+            ),
+            (
+                "latency p99",
+                run["latency_ms"]["p99_ms"],
+                old.get("latency_ms", {}).get("p99_ms"),
+                -1,
+            ),
+        )
+        for name, new_value, old_value, direction in checks:
+            if not old_value or not new_value:
+                continue
+            change = (new_value - old_value) / old_value
+            regressed = direction * change < -tolerance
+            regressions += regressed
+            print(
+                f"{run['mode']:>6} {run['boxes']:>6} boxes {name:>14}: "
+                f"{old_value:>12} -> {new_value:>12} ({change:+.1%})"
+                f"{'  REGRESSION' if regressed else ''}"
+            )
+
+    return regressions
+
+
+def main() -> int:
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=("engine", "stack"), default="engine")
+    parser.add_argument(
+        "--boxes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000]
+    )
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--timeout", type=float, default=0.05)
+    parser.add_argument("--sensor-change-delay", type=float, default=0.005)
+    parser.add_argument(
+        "--batch", type=int, default=100, help="events between loop iterations"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="skip the separate run that measures peak memory",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare with the results in this file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative change that counts as a regression",
+    )
+    args = parser.parse_args()
+
+    results = []
+    for boxes in args.boxes:
+        scenario = Scenario(
+            args.mode,
+            boxes,
+            args.events,
+            args.timeout,
+            args.sensor_change_delay,
+            args.batch,
+            args.seed,
+        )
+        result = asyncio.run(run_scenario(scenario, trace_memory=False))
+        if not args.no_memory:
+            # Tracing memory slows everything down, measure it in a separate run
+            traced = asyncio.run(run_scenario(scenario, trace_memory=True))
+            result["peak_memory_kib"] = traced["peak_memory_kib"]
+        results.append(result)
+        print(
+            f"{args.mode} {boxes} boxes: {result['events_per_sec']} events/s, "
+            f"dispatch p99 {result['dispatch_us']['p99']} us, "
+            f"latency p99 {result['latency_ms']['p99_ms']} ms",
+            file=sys.stderr,
+        )
+
+    report = {"metadata": metadata(), "results": results}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare(baseline, report, args.tolerance):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+"""Import the integration modules that do not depend on Home Assistant."""
+
+import importlib
+from pathlib import Path
+import sys
+import types
+
+PACKAGE_DIR = (
+    Path(__file__).resolve().parent.parent / "custom_components" / "wasp_sensor"
+)
+PACKAGE_NAME = "wasp_sensor_core"
+
+
+def load_module(name: str) -> types.ModuleType:
+    """
+    Import a module of the integration without running its __init__.
+
+    The package __init__ imports Home Assistant, the engine and the timer wheel
+    do not, so these can be used without a Home Assistant install.
+    """
+    if PACKAGE_NAME not in sys.modules:
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [str(PACKAGE_DIR)]
+        sys.modules[PACKAGE_NAME] = package
+
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
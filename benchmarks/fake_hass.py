@@ -0,0 +1,166 @@
+"""
+Lightweight in-process stand-in for the Home Assistant state machine and bus.
+
+Only the parts the integration uses are implemented: hass.states, hass.bus,
+hass.data, hass.loop, async_track_state_change_event and an empty entity
+registry. State changes are dispatched synchronously, like Home Assistant
+does for callbacks.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Callable, Iterable
+from typing import Any
+
+EVENT_STATE_CHANGED = "state_changed"
+
+
+class FakeState:
+    """State of an entity."""
+
+    __slots__ = ("entity_id", "state", "attributes")
+
+    def __init__(
+        self, entity_id: str, state: str, attributes: dict[str, Any] | None = None
+    ) -> None:
+        self.entity_id = entity_id
+        self.state = state
+        self.attributes = attributes or {}
+
+    def __repr__(self) -> str:
+        return f"<FakeState {self.entity_id}={self.state}>"
+
+
+class FakeEvent:
+    """An event on the bus."""
+
+    __slots__ = ("event_type", "data", "time_fired_timestamp")
+
+    def __init__(
+        self, event_type: str, data: dict[str, Any], time_fired_timestamp: float
+    ):
+        self.event_type = event_type
+        self.data = data
+        self.time_fired_timestamp = time_fired_timestamp
+
+
+class FakeBus:
+    """Event bus, with an index of state change listeners per entity_id."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._listeners: dict[str, list[Callable[[FakeEvent], Any]]] = {}
+        self.state_listeners: dict[str, list[Callable[[FakeEvent], Any]]] = {}
+        self.events_fired = 0
+
+    def async_listen(
+        self, event_type: str, listener: Callable[[FakeEvent], Any]
+    ) -> Callable[[], None]:
+        """Listen for events of a type."""
+        self._listeners.setdefault(event_type, []).append(listener)
+
+        def _remove() -> None:
+            self._listeners[event_type].remove(listener)
+
+        return _remove
+
+    def async_listen_once(
+        self, event_type: str, listener: Callable[[FakeEvent], Any]
+    ) -> Callable[[], None]:
+        """Listen for the next event of a type."""
+        remove: Callable[[], None]
+
+        def _once(event: FakeEvent) -> Any:
+            remove()
+            return listener(event)
+
+        remove = self.async_listen(event_type, _once)
+        return remove
+
+    def async_fire(self, event_type: str, data: dict[str, Any]) -> None:
+        """Fire an event and call the listeners."""
+        event = FakeEvent(event_type, data, time.time())
+        self.events_fired += 1
+
+        if event_type == EVENT_STATE_CHANGED:
+            for listener in self.state_listeners.get(data["entity_id"], ()):
+                listener(event)
+
+        for listener in list(self._listeners.get(event_type, ())):
+            result = listener(event)
+            if asyncio.iscoroutine(result):
+                self._loop.create_task(result)
+
+
+class FakeStateMachine:
+    """The state of all entities."""
+
+    def __init__(self, bus: FakeBus) -> None:
+        self._bus = bus
+        self._states: dict[str, FakeState] = {}
+
+    def get(self, entity_id: str) -> FakeState | None:
+        """Return the state of an entity."""
+        return self._states.get(entity_id)
+
+    def async_set(
+        self,
+        entity_id: str,
+        new_state: str,
+        attributes: dict[str, Any] | None = None,
+    ) -> None:
+        """Set the state of an entity and fire a state changed event."""
+        old_state = self._states.get(entity_id)
+        state = self._states[entity_id] = FakeState(entity_id, new_state, attributes)
+        self._bus.async_fire(
+            EVENT_STATE_CHANGED,
+            {"entity_id": entity_id, "old_state": old_state, "new_state": state},
+        )
+
+
+class FakeEntityRegistry:
+    """An entity registry without entries, none of the sensors is a group."""
+
+    def async_get(self, entity_id: str) -> None:
+        """Return the registry entry of an entity."""
+        return None
+
+
+class FakeHomeAssistant:
+    """The parts of HomeAssistant used by the integration."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self.bus = FakeBus(loop)
+        self.states = FakeStateMachine(self.bus)
+        self.data: dict[str, Any] = {}
+        self.is_running = True
+
+    def async_create_task(self, target: Any, name: str | None = None) -> asyncio.Task:
+        """Create a task on the loop."""
+        return self.loop.create_task(target, name=name)
+
+
+def async_track_state_change_event(
+    hass: FakeHomeAssistant,
+    entity_ids: str | Iterable[str],
+    action: Callable[[FakeEvent], Any],
+) -> Callable[[], None]:
+    """Track state changes of entities, like the Home Assistant helper."""
+    if isinstance(entity_ids, str):
+        entity_ids = [entity_ids]
+    entity_ids = list(entity_ids)
+
+    listeners = hass.bus.state_listeners
+    for entity_id in entity_ids:
+        listeners.setdefault(entity_id, []).append(action)
+
+    def _remove() -> None:
+        for entity_id in entity_ids:
+            listeners[entity_id].remove(action)
+            if not listeners[entity_id]:
+                del listeners[entity_id]
+
+    return _remove
@@ -0,0 +1,513 @@
+"""
+Replay recorder history through the Wasp in a Box logic.
+
+The states of the wasp and box sensors of a box are read from the SQLite
+database of the recorder and fed in time order through the engine, on a
+virtual clock, like the binary sensor entity and the coordinator do. The
+resulting occupancy timeline can be compared with the recorded states of the
+real Wasp in a Box entity, to tune timeout and sensor_change_delay offline.
+
+The box is configured like in configuration.yaml, in a YAML or JSON file with
+one box or a list of boxes. Areas, labels, groups and child boxes need Home
+Assistant to be resolved and are not replayed, list the sensors instead.
+
+NumPy, when it is installed, is only used for the --compare timeline comparison
+and the occupancy summaries, the replay itself does not use it.
+
+Usage:
+
+    python -m benchmarks.replay --db home-assistant_v2.db --config office.yaml \\
+        --compare binary_sensor.office --start 2025-01-01 --timeout 120
+"""
+
+from __future__ import annotations
+
+import argparse
+from bisect import bisect_right
+from collections.abc import Iterable, Mapping, Sequence
+from datetime import datetime, timezone
+import heapq
+import itertools
+import json
+import sqlite3
+import sys
+import time
+from typing import Any
+
+from .core import load_module
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# (timestamp, entity_id, state)
+Event = tuple[float, str, str | None]
+
+const = load_module("const")
+engine_module = load_module("engine")
+models = load_module("models")
+
+
+class VirtualClock:
+    """Clock of the engine during a replay, set to the time of every event."""
+
+    __slots__ = ("now",)
+
+    def __init__(self, now: float) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Timeline:
+    """Occupancy as a step function, the times at which it changed."""
+
+    __slots__ = ("start", "end", "times", "values")
+
+    def __init__(self, start: float, value: bool) -> None:
+        self.start = start
+        self.end = start
+        self.times: list[float] = [start]
+        self.values: list[bool] = [value]
+
+    def record(self, when: float, value: bool) -> None:
+        """Add a change, a value that did not change is not recorded."""
+        if value != self.values[-1]:
+            self.times.append(when)
+            self.values.append(value)
+
+    def close(self, end: float) -> None:
+        """End the timeline."""
+        self.end = end
+
+    def value_at(self, when: float) -> bool:
+        """Return the value at a time."""
+        return self.values[max(0, bisect_right(self.times, when) - 1)]
+
+    def intervals(self) -> list[tuple[float, float]]:
+        """Return the start and end of every occupied interval."""
+        ends = self.times[1:] + [self.end]
+        return [
+            (start, end)
+            for start, end, value in zip(self.times, ends, self.values)
+            if value and end > start
+        ]
+
+
+def load_configs(path: str) -> list[dict[str, Any]]:
+    """Return the boxes in a YAML or JSON file with one box or a list of boxes."""
+    with open(path, encoding="utf-8") as file:
+        text = file.read()
+
+    try:
+        import yaml  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        config = json.loads(text)
+    else:
+        config = yaml.safe_load(text)
+
+    if isinstance(config, Mapping) and const.DOMAIN in config:
+        config = config[const.DOMAIN]
+
+    if isinstance(config, Mapping):
+        return [dict(config)]
+
+    return [dict(item) for item in config]
+
+
+def load_config(path: str, name: str | None = None) -> dict[str, Any]:
+    """Return a box from a YAML or JSON file with one box or a list of boxes."""
+    for item in load_configs(path):
+        if name is None or item.get(const.CONF_NAME) == name:
+            return item
+
+    raise SystemExit(f"No box named {name} in {path}")
+
+
+def parse_time(value: str | None) -> float | None:
+    """Return a timestamp for an ISO date and time, UTC unless given."""
+    if value is None:
+        return None
+
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+
+    return moment.timestamp()
+
+
+def format_time(timestamp: float) -> str:
+    """Return an ISO date and time for a timestamp."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(
+        timespec="milliseconds"
+    )
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open a recorder database read only."""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    if (
+        connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+            ("states_meta",),
+        ).fetchone()
+        is None
+    ):
+        raise SystemExit(
+            f"{path} is not a recorder database of Home Assistant 2023.4 or newer"
+        )
+
+    return connection
+
+
+def load_history(
+    connection: sqlite3.Connection,
+    entity_ids: Iterable[str],
+    start: float | None = None,
+    end: float | None = None,
+) -> tuple[dict[str, str | None], list[Event], float, float]:
+    """
+    Return the states of some entities from the recorder.
+
+    Returns the state of every entity at the start, the state changes in time
+    order and the start and end. Rows that only changed attributes are left
+    out, as the coordinator does.
+    """
+    entity_ids = list(entity_ids)
+    metadata_ids = dict(
+        connection.execute(
+            "SELECT entity_id, metadata_id FROM states_meta"
+            f" WHERE entity_id IN ({','.join('?' * len(entity_ids))})",
+            entity_ids,
+        ).fetchall()
+    )
+    for entity_id in entity_ids:
+        if entity_id not in metadata_ids:
+            print(f"No history of {entity_id}", file=sys.stderr)
+
+    entity_by_id = {
+        metadata_id: entity_id for entity_id, metadata_id in metadata_ids.items()
+    }
+    placeholders = ",".join("?" * len(entity_by_id))
+
+    if start is None:
+        start = connection.execute(
+            "SELECT MIN(last_updated_ts) FROM states"
+            f" WHERE metadata_id IN ({placeholders})",
+            list(entity_by_id),
+        ).fetchone()[0]
+    if end is None:
+        end = time.time()
+    if start is None:
+        return dict.fromkeys(entity_ids), [], end, end
+
+    initial: dict[str, str | None] = dict.fromkeys(entity_ids)
+    for metadata_id, entity_id in entity_by_id.items():
+        row = connection.execute(
+            "SELECT state FROM states WHERE metadata_id = ? AND last_updated_ts < ?"
+            " ORDER BY last_updated_ts DESC LIMIT 1",
+            (metadata_id, start),
+        ).fetchone()
+        if row is not None:
+            initial[entity_id] = row[0]
+
+    events: list[Event] = []
+    last = dict(initial)
+    for metadata_id, state, updated in connection.execute(
+        "SELECT metadata_id, state, last_updated_ts FROM states"
+        f" WHERE metadata_id IN ({placeholders})"
+        " AND last_updated_ts >= ? AND last_updated_ts < ?"
+        " ORDER BY last_updated_ts, state_id",
+        [*entity_by_id, start, end],
+    ):
+        entity_id = entity_by_id[metadata_id]
+        if state != last[entity_id]:
+            last[entity_id] = state
+            events.append((updated, entity_id, state))
+
+    return initial, events, start, end
+
+
+def replay(
+    config: Any,
+    initial: Mapping[str, str | None],
+    events: Sequence[Event],
+    start: float,
+    end: float,
+) -> Timeline:
+    """
+    Feed the state changes through the engine of a box, return its occupancy.
+
+    Deadlines are kept in a heap and handled in order between the events,
+    the virtual clock jumps from event to deadline to event.
+    """
+    clock = VirtualClock(start)
+    engine = engine_module.WaspBoxEngine(config, clock=clock)
+    timeout_key = engine_module.TIMEOUT
+    unchanged = engine_module.REASON_UNCHANGED
+    wasp_roles = const.WASP_ROLES
+    unavailable_states = const.UNAVAILABLE_STATES
+    sensor_roles = {
+        entity_id: tuple(role for role in roles if role not in const.CHILD_ROLES)
+        for entity_id, roles in config.sensor_roles.items()
+    }
+
+    states = dict(initial)
+    engine.rescan(states.get)
+    timeline = Timeline(start, engine.wasp_in_box)
+
+    heap: list[tuple[float, int, Any]] = []
+    pending: dict[str, Any] = {}
+    sequence = itertools.count()
+
+    def apply(decision) -> None:
+        if decision.cancel is not None:
+            pending.pop(decision.cancel, None)
+        if (deadline := decision.schedule) is not None:
+            pending[deadline.key] = deadline
+            heapq.heappush(heap, (deadline.when, next(sequence), deadline))
+        if decision.write:
+            timeline.record(clock.now, engine.wasp_in_box)
+
+    def run_until(when: float) -> None:
+        while heap and heap[0][0] <= when:
+            clock.now, _, deadline = heapq.heappop(heap)
+            if pending.get(deadline.key) is not deadline:
+                # Cancelled or replaced
+                continue
+            del pending[deadline.key]
+            state = None if deadline.key == timeout_key else states.get(deadline.key)
+            apply(engine.deadline_reached(deadline, state))
+
+    for when, entity_id, state in events:
+        if heap and heap[0][0] <= when:
+            run_until(when)
+        clock.now = when
+
+        old = states.get(entity_id)
+        if state == old:
+            continue
+        states[entity_id] = state
+
+        unusable = (
+            state is None
+            or state in unavailable_states
+            or old is None
+            or old in unavailable_states
+        )
+        for role in sensor_roles.get(entity_id, ()):
+            if unusable and not engine.accepts(entity_id, role, state):
+                continue
+            if role in wasp_roles:
+                decision = engine.wasp_sensor_changed(entity_id, role, when, state)
+            else:
+                decision = engine.box_sensor_changed(entity_id, role, state, when)
+            if decision.reason != unchanged:
+                apply(decision)
+
+    run_until(end)
+    clock.now = end
+    timeline.close(end)
+
+    return timeline
+
+
+def recorded_timeline(
+    initial: str | None, events: Iterable[Event], start: float, end: float
+) -> Timeline:
+    """Return the timeline of the recorded states of a Wasp in a Box entity."""
+    timeline = Timeline(start, initial == "on")
+    for when, _, state in events:
+        timeline.record(when, state == "on")
+    timeline.close(end)
+
+    return timeline
+
+
+def compare_timelines(replayed: Timeline, recorded: Timeline) -> dict[str, float]:
+    """
+    Return how long the timelines agree and disagree, in seconds.
+
+    false_on is the time the replay is occupied while the recorded entity is
+    not, false_off the other way around.
+    """
+    start = max(replayed.start, recorded.start)
+    end = min(replayed.end, recorded.end)
+    if end <= start:
+        return {"seconds": 0.0, "agreement": 1.0, "false_on": 0.0, "false_off": 0.0}
+
+    if np is not None:
+        times = np.union1d(replayed.times, recorded.times)
+        times = np.union1d(times[(times > start) & (times < end)], [start])
+        durations = np.diff(np.append(times, end))
+
+        def values_at(timeline: Timeline):
+            index = np.searchsorted(timeline.times, times, side="right") - 1
+            return np.asarray(timeline.values, dtype=bool)[np.maximum(index, 0)]
+
+        replayed_on = values_at(replayed)
+        recorded_on = values_at(recorded)
+        false_on = float(durations[replayed_on & ~recorded_on].sum())
+        false_off = float(durations[~replayed_on & recorded_on].sum())
+    else:
+        times = sorted(
+            {start}
+            | {when for when in replayed.times if start < when < end}
+            | {when for when in recorded.times if start < when < end}
+        )
+        false_on = false_off = 0.0
+        for begin, finish in zip(times, times[1:] + [end]):
+            replayed_on = replayed.value_at(begin)
+            recorded_on = recorded.value_at(begin)
+            if replayed_on and not recorded_on:
+                false_on += finish - begin
+            elif recorded_on and not replayed_on:
+                false_off += finish - begin
+
+    seconds = end - start
+    return {
+        "seconds": round(seconds, 3),
+        "agreement": round(1.0 - (false_on + false_off) / seconds, 6),
+        "false_on": round(false_on, 3),
+        "false_off": round(false_off, 3),
+    }
+
+
+def summarize(timeline: Timeline) -> dict[str, Any]:
+    """Return the occupied time and the number of occupied intervals."""
+    intervals = timeline.intervals()
+    if np is not None and intervals:
+        occupied = float(np.diff(np.asarray(intervals), axis=1).sum())
+    else:
+        occupied = sum(end - start for start, end in intervals)
+
+    return {
+        "occupied_seconds": round(occupied, 3),
+        "occupied_intervals": len(intervals),
+        "changes": len(timeline.times) - 1,
+    }
+
+
+def box_config(
+    config: Mapping[str, Any],
+    timeout: float | None = None,
+    sensor_change_delay: float | None = None,
+) -> Any:
+    """Return the configuration of a box, with an other timeout or delay."""
+    config = dict(config)
+    config.setdefault(const.CONF_NAME, "replay")
+    if timeout is not None:
+        config[const.CONF_TIMEOUT] = timeout
+    if sensor_change_delay is not None:
+        config[const.CONF_SENSOR_CHANGE_DELAY] = sensor_change_delay
+
+    ignored = [
+        key
+        for key in (
+            const.CONF_CHILD_BOXES,
+            const.CONF_WASP_AREAS,
+            const.CONF_WASP_LABELS,
+            const.CONF_BOX_AREAS,
+            const.CONF_BOX_LABELS,
+        )
+        if config.pop(key, None)
+    ]
+    if ignored:
+        print(f"Not replaying {', '.join(ignored)}", file=sys.stderr)
+
+    return models.BoxConfig.from_config(config)
+
+
+def sensor_entity_ids(config: Any) -> list[str]:
+    """Return the sensors of a box to replay."""
+    return [
+        entity_id
+        for entity_id, roles in config.sensor_roles.items()
+        if any(role not in const.CHILD_ROLES for role in roles)
+    ]
+
+
+def main() -> int:
+    """Replay a box."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", required=True, help="recorder SQLite database")
+    parser.add_argument("--config", required=True, help="YAML or JSON box config")
+    parser.add_argument("--name", help="the box to replay when there are several")
+    parser.add_argument("--start", help="ISO date and time, UTC unless given")
+    parser.add_argument("--end", help="ISO date and time, UTC unless given")
+    parser.add_argument("--timeout", type=float, help="override the timeout")
+    parser.add_argument(
+        "--sensor-change-delay", type=float, help="override the sensor change delay"
+    )
+    parser.add_argument(
+        "--compare", metavar="ENTITY_ID", help="recorded Wasp in a Box entity"
+    )
+    parser.add_argument(
+        "--timeline",
+        action="store_true",
+        help="include the occupied intervals in the output",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    config = box_config(
+        load_config(args.config, args.name), args.timeout, args.sensor_change_delay
+    )
+    entity_ids = sensor_entity_ids(config)
+    if args.compare:
+        entity_ids.append(args.compare)
+
+    connection = connect(args.db)
+    loaded = time.perf_counter()
+    initial, events, start, end = load_history(
+        connection, entity_ids, parse_time(args.start), parse_time(args.end)
+    )
+    connection.close()
+
+    replayed_events = [event for event in events if event[1] != args.compare]
+    started = time.perf_counter()
+    timeline = replay(config, initial, replayed_events, start, end)
+    finished = time.perf_counter()
+
+    report: dict[str, Any] = {
+        "box": config.name,
+        "timeout": config.timeout,
+        "sensor_change_delay": config.sensor_change_delay,
+        "start": format_time(start),
+        "end": format_time(end),
+        "events": len(replayed_events),
+        "load_seconds": round(started - loaded, 3),
+        "replay_seconds": round(finished - started, 3),
+        "replay": summarize(timeline),
+    }
+
+    if args.compare:
+        recorded = recorded_timeline(
+            initial[args.compare],
+            (event for event in events if event[1] == args.compare),
+            start,
+            end,
+        )
+        report["recorded"] = summarize(recorded)
+        report["comparison"] = compare_timelines(timeline, recorded)
+
+    if args.timeline:
+        report["timeline"] = [
+            [format_time(begin), format_time(finish)]
+            for begin, finish in timeline.intervals()
+        ]
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
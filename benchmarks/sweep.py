@@ -0,0 +1,281 @@
+"""
+Find the best timeout and sensor_change_delay of boxes from recorder history.
+
+Every combination of the given timeouts and sensor change delays is replayed
+over the recorder history of each box, in a pool of processes, and scored
+against a ground truth entity that is on while the room is really occupied,
+like an input_boolean kept by hand or a reliable presence sensor.
+
+A candidate is scored on:
+
+- false_vacancies: the box turned unoccupied while the truth is occupied
+- false_occupancies: the box was occupied while the truth was not, at all
+- missed: times the truth was occupied without the box ever noticing
+- latency: seconds from the truth turning occupied to the box following
+
+The recommendation has the fewest errors, false vacancies, false occupancies
+and missed together, then the lowest median latency and then the shortest
+timeout and delay. It is printed as options flow durations and as YAML.
+
+Usage:
+
+    python -m benchmarks.sweep --db home-assistant_v2.db --config boxes.yaml \\
+        --truth office=input_boolean.office_occupied \\
+        --timeouts 30 60 120 180 --delays 0 1 2 5
+"""
+
+from __future__ import annotations
+
+import argparse
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from functools import lru_cache
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any
+
+from .replay import (
+    Timeline,
+    box_config,
+    connect,
+    format_time,
+    load_configs,
+    load_history,
+    parse_time,
+    recorded_timeline,
+    replay,
+    sensor_entity_ids,
+)
+
+# A task replays some candidates of one box:
+# (db, box config, truth entity_id, start, end, [(timeout, delay), ...])
+Task = tuple[str, dict[str, Any], str, float | None, float | None, list]
+
+
+def score(replayed: Timeline, truth: Timeline) -> dict[str, Any]:
+    """Score the timeline of a candidate against the ground truth."""
+    times = replayed.times
+    latencies: list[float] = []
+    missed = 0
+    for start, end in truth.intervals():
+        if replayed.value_at(start):
+            latencies.append(0.0)
+            continue
+        # Timelines only record changes, the next change turns occupied
+        index = bisect_right(times, start)
+        if index < len(times) and times[index] < end:
+            latencies.append(times[index] - start)
+        else:
+            missed += 1
+
+    false_occupancies = 0
+    for start, end in replayed.intervals():
+        index = bisect_right(truth.times, start)
+        if not truth.value_at(start) and not (
+            index < len(truth.times) and truth.times[index] < end
+        ):
+            false_occupancies += 1
+
+    false_vacancies = sum(
+        1
+        for when, value in zip(times[1:], replayed.values[1:])
+        if not value and truth.value_at(when)
+    )
+
+    return {
+        "false_vacancies": false_vacancies,
+        "false_occupancies": false_occupancies,
+        "missed": missed,
+        "latency_median": round(statistics.median(latencies), 3) if latencies else None,
+        "latency_mean": round(statistics.fmean(latencies), 3) if latencies else None,
+    }
+
+
+def rank(result: dict[str, Any]) -> tuple:
+    """Return the sort key of a candidate, the best candidate sorts first."""
+    errors = result["false_vacancies"] + result["false_occupancies"] + result["missed"]
+    latency = result["latency_median"]
+    return (
+        errors,
+        latency if latency is not None else float("inf"),
+        result["timeout"],
+        result["sensor_change_delay"],
+    )
+
+
+@lru_cache(maxsize=4)
+def _history(
+    db: str, entity_ids: tuple[str, ...], start: float | None, end: float | None
+):
+    """Load the history once per worker process, for all its candidates of a box."""
+    connection = connect(db)
+    try:
+        return load_history(connection, entity_ids, start, end)
+    finally:
+        connection.close()
+
+
+def evaluate(task: Task) -> list[dict[str, Any]]:
+    """Replay and score candidates of a box, runs in a worker process."""
+    db, item, truth, start, end, candidates = task
+    config = box_config(item)
+    entity_ids = sensor_entity_ids(config)
+    initial, events, start, end = _history(
+        db, tuple(sorted(entity_ids + [truth])), start, end
+    )
+
+    truth_timeline = recorded_timeline(
+        initial[truth], (event for event in events if event[1] == truth), start, end
+    )
+    sensor_events = [event for event in events if event[1] != truth]
+
+    results = []
+    for timeout, delay in candidates:
+        candidate = replace(config, timeout=timeout, sensor_change_delay=delay)
+        timeline = replay(candidate, initial, sensor_events, start, end)
+        results.append(
+            {
+                "box": config.name,
+                "timeout": timeout,
+                "sensor_change_delay": delay,
+                **score(timeline, truth_timeline),
+            }
+        )
+
+    return results
+
+
+def _duration(seconds: float) -> dict[str, int]:
+    """Return a duration selector value."""
+    whole = int(seconds)
+    return {
+        "hours": whole // 3600,
+        "minutes": whole % 3600 // 60,
+        "seconds": whole % 60,
+        "milliseconds": round((seconds - whole) * 1000),
+    }
+
+
+def _seconds(seconds: float) -> float | int:
+    return int(seconds) if float(seconds).is_integer() else seconds
+
+
+def recommendation(results: list[dict[str, Any]]) -> dict[str, Any]:
+    """Return the best candidate of a box, ready for the options flow or YAML."""
+    best = min(results, key=rank)
+    return {
+        "score": {
+            key: value
+            for key, value in best.items()
+            if key not in ("box", "timeout", "sensor_change_delay")
+        },
+        "options": {
+            "timeout": _duration(best["timeout"]),
+            "sensor_change_delay": _duration(best["sensor_change_delay"]),
+        },
+        "yaml": {
+            "timeout": _seconds(best["timeout"]),
+            "sensor_change_delay": _seconds(best["sensor_change_delay"]),
+        },
+    }
+
+
+def _truths(values: list[str]) -> dict[str, str]:
+    truths = {}
+    for value in values:
+        name, separator, entity_id = value.partition("=")
+        if not separator:
+            raise SystemExit(f"--truth {value} is not NAME=ENTITY_ID")
+        truths[name] = entity_id
+
+    return truths
+
+
+def main() -> int:
+    """Sweep the boxes."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", required=True, help="recorder SQLite database")
+    parser.add_argument("--config", required=True, help="YAML or JSON box config")
+    parser.add_argument(
+        "--truth",
+        action="append",
+        default=[],
+        metavar="NAME=ENTITY_ID",
+        help="ground truth entity of a box, boxes without one are skipped",
+    )
+    parser.add_argument(
+        "--timeouts", type=float, nargs="+", default=[15, 30, 60, 120, 180, 300]
+    )
+    parser.add_argument("--delays", type=float, nargs="+", default=[0, 1, 2, 5, 10])
+    parser.add_argument("--start", help="ISO date and time, UTC unless given")
+    parser.add_argument("--end", help="ISO date and time, UTC unless given")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--all", action="store_true", help="include the scores of every candidate"
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    truths = _truths(args.truth)
+    start, end = parse_time(args.start), parse_time(args.end)
+    if end is None:
+        # The same end for every worker
+        end = time.time()
+
+    boxes = []
+    for item in load_configs(args.config):
+        if (truth := truths.get(item.get("name"))) is None:
+            print(f"No ground truth for {item.get('name')}, skipped", file=sys.stderr)
+            continue
+        boxes.append((item, truth))
+    if not boxes:
+        raise SystemExit("No boxes to sweep")
+
+    # Split the candidates of a box over several workers when there are
+    # fewer boxes than workers, each worker loads the history of a box once
+    grid = list(itertools.product(args.timeouts, args.delays))
+    chunks = max(1, min(len(grid), -(-args.workers // len(boxes))))
+    tasks: list[Task] = [
+        (args.db, item, truth, start, end, grid[index::chunks])
+        for item, truth in boxes
+        for index in range(chunks)
+    ]
+
+    started = time.perf_counter()
+    results: dict[str, list[dict[str, Any]]] = {}
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for task_results in executor.map(evaluate, tasks):
+            for result in task_results:
+                results.setdefault(result["box"], []).append(result)
+
+    report: dict[str, Any] = {
+        "start": format_time(start) if start is not None else None,
+        "end": format_time(end),
+        "candidates": len(grid),
+        "sweep_seconds": round(time.perf_counter() - started, 3),
+        "boxes": {
+            name: {
+                **recommendation(box_results),
+                **({"candidates": sorted(box_results, key=rank)} if args.all else {}),
+            }
+            for name, box_results in results.items()
+        },
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,141 +5,275 @@ For more details about this integration, please refer to
 https://github.com/rrooggiieerr/homeassistant-wasp
 """
 
+import asyncio
 import logging
-from typing import Dict, List
+import time
 
 from homeassistant import config as conf_util
-from homeassistant.components.binary_sensor import BinarySensorEntity
-from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
-from homeassistant.core_config import Config
+from homeassistant.config_entries import SOURCE_IMPORT, ConfigEntry
+from homeassistant.const import ATTR_ENTITY_ID, Platform
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+    callback,
+)
+from homeassistant.data_entry_flow import FlowResultType
 from homeassistant.exceptions import HomeAssistantError
-from homeassistant.helpers import discovery
+from homeassistant.helpers import entity_registry as er
 import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.json import save_json
+from homeassistant.helpers.typing import ConfigType
 from homeassistant.loader import async_get_integration
 import voluptuous as vol
 from voluptuous.schema_builder import ALLOW_EXTRA, PREVENT_EXTRA
 
 from .const import (
     BINARY_SENSOR,
+    CONF_ADAPTIVE_DELAY,
+    CONF_BOX_AREAS,
     CONF_BOX_INV_SENSORS,
+    CONF_BOX_LABELS,
     CONF_BOX_SENSORS,
+    CONF_CHILD_BOXES,
+    CONF_MIN_SENSOR_CHANGE_DELAY,
     CONF_NAME,
+    CONF_OPTIMISTIC,
     CONF_SENSOR_CHANGE_DELAY,
+    CONF_THRESHOLDS,
     CONF_TIMEOUT,
+    CONF_TRACE_SIZE,
+    CONF_UNAVAILABLE_POLICY,
+    CONF_UNRECORDED_ATTRIBUTES,
+    CONF_WASP_AREAS,
     CONF_WASP_INV_SENSORS,
+    CONF_WASP_LABELS,
     CONF_WASP_SENSORS,
+    DATA_YAML_BOXES,
+    DEFAULT_ADAPTIVE_DELAY,
+    DEFAULT_MIN_SENSOR_CHANGE_DELAY,
+    DEFAULT_OPTIMISTIC,
     DEFAULT_SENSOR_CHANGE_DELAY,
+    DEFAULT_TRACE_SIZE,
+    DEFAULT_UNAVAILABLE_POLICY,
+    DEFAULT_UNRECORDED_ATTRIBUTES,
     DEFAULT_WASP_TIMEOUT,
     DOMAIN,
+    MAX_TRACE_SIZE,
+    SERVICE_DUMP_TRACE,
     SERVICE_RELOAD,
     STARTUP_MESSAGE,
+    UNAVAILABLE_POLICIES,
 )
+from .coordinator import async_get_coordinator
+from .models import BoxConfig, EntryData
+from .schema import THRESHOLDS_SCHEMA, validate_thresholds
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
 PLATFORMS: list[Platform] = [
     Platform.BINARY_SENSOR,
+    Platform.SENSOR,
 ]
 
-ENTRY_SCHEMA = vol.Schema(
-    {
-        CONF_NAME: str,
-        vol.Optional(CONF_WASP_SENSORS, default=[]): cv.entity_ids,
-        vol.Optional(CONF_WASP_INV_SENSORS, default=[]): cv.entity_ids,
-        vol.Optional(CONF_BOX_SENSORS, default=[]): cv.entity_ids,
-        vol.Optional(CONF_BOX_INV_SENSORS, default=[]): cv.entity_ids,
-        vol.Optional(CONF_TIMEOUT, default=DEFAULT_WASP_TIMEOUT): vol.Coerce(int),
-        vol.Optional(
-            CONF_SENSOR_CHANGE_DELAY, default=DEFAULT_SENSOR_CHANGE_DELAY
-        ): vol.Coerce(int),
-    },
-    extra=PREVENT_EXTRA,
+ENTRY_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            CONF_NAME: str,
+            vol.Optional(CONF_WASP_SENSORS, default=[]): cv.entity_ids,
+            vol.Optional(CONF_WASP_INV_SENSORS, default=[]): cv.entity_ids,
+            vol.Optional(CONF_BOX_SENSORS, default=[]): cv.entity_ids,
+            vol.Optional(CONF_BOX_INV_SENSORS, default=[]): cv.entity_ids,
+            vol.Optional(CONF_CHILD_BOXES, default=[]): cv.entity_ids,
+            vol.Optional(CONF_WASP_AREAS, default=[]): vol.All(
+                cv.ensure_list, [cv.string]
+            ),
+            vol.Optional(CONF_WASP_LABELS, default=[]): vol.All(
+                cv.ensure_list, [cv.string]
+            ),
+            vol.Optional(CONF_BOX_AREAS, default=[]): vol.All(
+                cv.ensure_list, [cv.string]
+            ),
+            vol.Optional(CONF_BOX_LABELS, default=[]): vol.All(
+                cv.ensure_list, [cv.string]
+            ),
+            vol.Optional(CONF_TIMEOUT, default=DEFAULT_WASP_TIMEOUT): vol.Coerce(int),
+            vol.Optional(
+                CONF_SENSOR_CHANGE_DELAY, default=DEFAULT_SENSOR_CHANGE_DELAY
+            ): vol.Coerce(int),
+            vol.Optional(
+                CONF_ADAPTIVE_DELAY, default=DEFAULT_ADAPTIVE_DELAY
+            ): cv.boolean,
+            vol.Optional(
+                CONF_MIN_SENSOR_CHANGE_DELAY, default=DEFAULT_MIN_SENSOR_CHANGE_DELAY
+            ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Optional(
+                CONF_UNAVAILABLE_POLICY, default=DEFAULT_UNAVAILABLE_POLICY
+            ): vol.In(UNAVAILABLE_POLICIES),
+            vol.Optional(CONF_OPTIMISTIC, default=DEFAULT_OPTIMISTIC): cv.boolean,
+            vol.Optional(CONF_THRESHOLDS, default={}): THRESHOLDS_SCHEMA,
+            vol.Optional(CONF_TRACE_SIZE, default=DEFAULT_TRACE_SIZE): vol.All(
+                vol.Coerce(int), vol.Range(min=0, max=MAX_TRACE_SIZE)
+            ),
+            vol.Optional(
+                CONF_UNRECORDED_ATTRIBUTES, default=DEFAULT_UNRECORDED_ATTRIBUTES
+            ): cv.boolean,
+        },
+        extra=PREVENT_EXTRA,
+    ),
+    validate_thresholds,
 )
 
 CONFIG_SCHEMA = vol.Schema({DOMAIN: [ENTRY_SCHEMA]}, extra=ALLOW_EXTRA)
 
+ATTR_FILENAME = "filename"
 
-class EntityRegistry:
-    """Handle Registering Entities for later Destruction"""
-
-    def __init__(self) -> None:
-        self.registered_entities: List[BinarySensorEntity] = []
-
-    async def register_entities(self, entities: List[BinarySensorEntity]) -> None:
-        """Perform Entity Registration"""
-        for entity in entities:
-            self.registered_entities.append(entity)
-
-    async def shutdown(self):
-        """Destroy all Entities"""
-        for entity in self.registered_entities:
-            await entity.async_remove()
-
-        self.registered_entities = []
+DUMP_TRACE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_ENTITY_ID): cv.entity_ids,
+        vol.Optional(ATTR_FILENAME): cv.string,
+    }
+)
 
 
-async def async_setup(hass: HomeAssistant, hass_config: Config) -> bool:
+async def async_setup(hass: HomeAssistant, hass_config: ConfigType) -> bool:
     """Component setup."""
     if hass.data.get(DOMAIN) is None:
         _LOGGER.info(STARTUP_MESSAGE)
 
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN] = hass_config[DOMAIN]
-
-    registry = EntityRegistry()
 
-    await start_it_up(hass, hass_config, registry)
+    if DOMAIN in hass_config:
+        # The import flows set up the entries, which waits for this setup
+        hass.async_create_task(async_import_yaml(hass, hass_config))
 
     async def reload_scripts_handler(_) -> None:
         """Handle reload service calls."""
         _LOGGER.debug("reloading")
 
-        await registry.shutdown()
-
         try:
             unprocessed_conf = await conf_util.async_hass_config_yaml(hass)
         except HomeAssistantError as err:
             _LOGGER.error(err)
             return
 
-        conf = await conf_util.async_process_component_config(
+        conf = await conf_util.async_process_component_and_handle_errors(
             hass, unprocessed_conf, await async_get_integration(hass, DOMAIN)
         )
 
         if conf is None:
             return
 
-        hass.data.setdefault(DOMAIN, {})
-        hass.data[DOMAIN] = conf[DOMAIN]
-        await start_it_up(hass, conf, registry)
+        if DOMAIN not in conf:
+            # The imported boxes are kept and can be edited in the UI from now on
+            hass.data[DATA_YAML_BOXES] = set()
+            return
+
+        await async_import_yaml(hass, conf)
 
     hass.services.async_register(DOMAIN, SERVICE_RELOAD, reload_scripts_handler)
 
+    async def dump_trace_handler(call: ServiceCall) -> ServiceResponse:
+        """Return the traces, and write them to a file if a filename is given."""
+        traces = async_get_coordinator(hass).async_traces(call.data.get(ATTR_ENTITY_ID))
+
+        if (filename := call.data.get(ATTR_FILENAME)) is not None:
+            path = hass.config.path(filename)
+            if not hass.config.is_allowed_path(path):
+                raise HomeAssistantError(f"Writing to {path} is not allowed")
+            await hass.async_add_executor_job(save_json, path, traces)
+            _LOGGER.info("Wrote the traces of %s boxes to %s", len(traces), path)
+
+        return {"traces": traces}
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_DUMP_TRACE,
+        dump_trace_handler,
+        schema=DUMP_TRACE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
     return True
 
 
-async def start_it_up(
-    hass: HomeAssistant, hass_config: Config, registry: EntityRegistry
-):
-    """Handle Startup Tasks"""
+async def async_import_yaml(hass: HomeAssistant, hass_config: ConfigType) -> None:
+    """Import the boxes configured in YAML as config entries, in one batch."""
+    items = hass_config[DOMAIN]
+    names = {item[CONF_NAME] for item in items}
+    hass.data[DATA_YAML_BOXES] = names
+    # Boxes removed from YAML, imported boxes are kept when the whole section is
+    # removed, to manage them in the UI from then on
+    removed = [
+        entry
+        for entry in hass.config_entries.async_entries(DOMAIN)
+        if entry.source == SOURCE_IMPORT and entry.unique_id not in names
+    ]
+
+    # New entries are set up as part of their import flow, all concurrently
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(
+            hass.config_entries.flow.async_init(
+                DOMAIN, context={"source": SOURCE_IMPORT}, data=item
+            )
+            for item in items
+        ),
+        *(hass.config_entries.async_remove(entry.entry_id) for entry in removed),
+        return_exceptions=True,
+    )
+
+    outcomes: dict[str, int] = {}
+    for item, result in zip(items, results):
+        if isinstance(result, BaseException):
+            _LOGGER.error("Importing %s failed: %s", item[CONF_NAME], result)
+            outcome = "failed"
+        elif result["type"] is FlowResultType.CREATE_ENTRY:
+            outcome = "created"
+        else:
+            outcome = result.get("reason", "aborted")
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    _LOGGER.info(
+        "Imported %s boxes from YAML and removed %s, ready in %.3f s: %s",
+        len(items),
+        len(removed),
+        time.perf_counter() - started,
+        outcomes,
+    )
 
-    config = {"registrar": registry.register_entities, "entities": hass.data[DOMAIN]}
 
-    hass.async_create_task(
-        discovery.async_load_platform(
-            hass,
-            BINARY_SENSOR,
-            DOMAIN,
-            config,
-            hass_config,
+async def async_migrate_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Migrate a config entry to the current version."""
+    if entry.version > 1:
+        return False
+
+    if entry.minor_version < 2:
+        # Boxes are identified by their name, like the boxes imported from YAML,
+        # unless another box already has the name
+        unique_id = entry.unique_id
+        name = entry.data[CONF_NAME]
+        if (
+            unique_id is None
+            and hass.config_entries.async_entry_for_domain_unique_id(DOMAIN, name)
+            is None
+        ):
+            unique_id = name
+        hass.config_entries.async_update_entry(
+            entry, unique_id=unique_id, minor_version=2
         )
-    )
+
+    return True
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Wasp in a Box from a config entry."""
+    if entry.source == SOURCE_IMPORT:
+        _async_adopt_yaml_entity(hass, entry)
+
+    # Shared by the box and its sensors
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = EntryData()
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
@@ -148,15 +282,45 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     return True
 
 
+@callback
+def _async_adopt_yaml_entity(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """
+    Move the entity of a box that was set up by the YAML platform to this entry.
+
+    The box keeps its entity ID and history, its unique ID becomes the entry ID
+    like the other entities of the entry.
+    """
+    registry = er.async_get(hass)
+    if (
+        entity_id := registry.async_get_entity_id(
+            BINARY_SENSOR, DOMAIN, f"{DOMAIN}_{entry.data[CONF_NAME]}"
+        )
+    ) is not None:
+        _LOGGER.debug("Adopting %s for %s", entity_id, entry.title)
+        registry.async_update_entity(entity_id, new_unique_id=entry.entry_id)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
-        hass.data[DOMAIN].pop(entry.entry_id)
+        hass.data[DOMAIN].pop(entry.entry_id, None)
 
     return unload_ok
 
 
 async def update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
-    """Handle options update."""
+    """Handle options update, a running box is reconfigured in place."""
+    entry_data: EntryData | None = hass.data[DOMAIN].get(entry.entry_id)
+    config = BoxConfig.from_config({**entry.data, **entry.options})
+    # Whether the attributes are recorded is a property of the entity class
+    if (
+        entry_data is not None
+        and (box := entry_data.box) is not None
+        and box.box_config.unrecorded_attributes == config.unrecorded_attributes
+    ):
+        _LOGGER.debug("Configuration options updated, reconfiguring %s", entry.title)
+        box.async_reconfigure(config)
+        return
+
     _LOGGER.debug("Configuration options updated, reloading Wasp in a Box integration")
-    hass.config_entries.async_schedule_reload(entry.entry_id)(entry.entry_id)
+    hass.config_entries.async_schedule_reload(entry.entry_id)
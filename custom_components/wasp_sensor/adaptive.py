@@ -0,0 +1,76 @@
+"""Sensor change delay learned per wasp sensor."""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Any
+
+# A sensor that turns off again within the sensor change delay flapped, like a
+# PIR sensor that sends 'on' right before 'off', a sensor that does not flap
+# needs no delay at all
+
+# Changes to see before the delay is lowered below the configured delay
+WARMUP_CHANGES = 20
+# Recent flaps to keep per sensor, flaps older than the window are forgotten
+MAX_FLAPS = 32
+FLAP_WINDOW = 7 * 24 * 3600.0
+# The delay is this much longer than the longest recent flap
+FLAP_MARGIN = 1.5
+
+
+class AdaptiveDelay:
+    """Streaming flap statistics of one wasp sensor, in bounded memory."""
+
+    __slots__ = ("changes", "last_on", "_flaps")
+
+    def __init__(self) -> None:
+        self.changes = 0
+        # Clock time the sensor turned on, None while it is off
+        self.last_on: float | None = None
+        # (clock time, seconds since the previous change), oldest first
+        self._flaps: deque[tuple[float, float]] = deque(maxlen=MAX_FLAPS)
+
+    def record(self, now: float, active: bool, max_delay: float) -> None:
+        """Add a change of the sensor, off shorter than max_delay after on is a flap."""
+        if active:
+            self.last_on = now
+        else:
+            # Turning on again right after off, like walking back in, is no flap
+            if self.last_on is not None and now - self.last_on < max_delay:
+                self._flaps.append((now, now - self.last_on))
+            self.last_on = None
+        self.changes += 1
+
+    def delay(self, now: float, min_delay: float, max_delay: float) -> float:
+        """Return the smallest delay that covers the recent flaps, within bounds."""
+        if self.changes < WARMUP_CHANGES:
+            return max_delay
+
+        flaps = self._flaps
+        while flaps and flaps[0][0] < now - FLAP_WINDOW:
+            flaps.popleft()
+        if not flaps:
+            return min_delay
+
+        longest = max(interval for _, interval in flaps)
+        return min(max_delay, max(min_delay, longest * FLAP_MARGIN))
+
+    def as_dict(self, wall_offset: float) -> dict[str, Any]:
+        """Return the statistics to persist, clock times as wall clock time."""
+        return {
+            "changes": self.changes,
+            "last_on": self.last_on + wall_offset if self.last_on is not None else None,
+            "flaps": [[when + wall_offset, interval] for when, interval in self._flaps],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any], wall_offset: float) -> AdaptiveDelay:
+        """Restore the statistics persisted by as_dict."""
+        adaptive = cls()
+        adaptive.changes = data.get("changes", 0)
+        if (last_on := data.get("last_on")) is not None:
+            adaptive.last_on = last_on - wall_offset
+        adaptive._flaps.extend(
+            (when - wall_offset, interval) for when, interval in data.get("flaps", ())
+        )
+        return adaptive
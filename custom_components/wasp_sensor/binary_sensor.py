@@ -1,9 +1,12 @@
 """Binary sensor platform for Wasp Sensor."""
 
-import asyncio
-from datetime import timedelta
-from functools import partial
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass
 import logging
+import time
+from typing import Any
 
 from homeassistant.components.binary_sensor import (
     BinarySensorDeviceClass,
@@ -11,46 +14,33 @@ from homeassistant.components.binary_sensor import (
     BinarySensorEntityDescription,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import EVENT_HOMEASSISTANT_START
-from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddConfigEntryEntitiesCallback
-from homeassistant.helpers.event import async_track_state_change_event
-from homeassistant.helpers.restore_state import RestoreEntity
-
-from .const import (
-    CONF_BOX_INV_SENSORS,
-    CONF_BOX_SENSORS,
-    CONF_NAME,
-    CONF_SENSOR_CHANGE_DELAY,
-    CONF_TIMEOUT,
-    CONF_WASP_INV_SENSORS,
-    CONF_WASP_SENSORS,
-    DEFAULT_SENSOR_CHANGE_DELAY,
-    DOMAIN,
+from homeassistant.helpers.restore_state import ExtraStoredData, RestoreEntity
+
+from .const import DOMAIN, WASP_ROLES
+from .coordinator import WaspCoordinator, async_get_coordinator
+from .engine import (
+    CONFIDENCE_TENTATIVE,
+    REASON_OCCUPIED,
+    REASON_RETRACTED,
+    REASON_TIMEOUT_STARTED,
+    REASON_UNCHANGED,
+    TIMEOUT,
+    Deadline,
+    Decision,
+    WaspBoxEngine,
 )
+from .dwell import DwellStats
+from .membership import MemberKey
+from .metrics import Metrics
+from .models import BoxConfig
+from .timer import WheelTimer
+from .trace import TraceBuffer
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
 
-async def async_setup_platform(hass, _, async_add_entities, discovery_info=None):
-    """Setup binary_sensor platform."""
-    entities = []
-    for config in discovery_info["entities"]:
-        entity_description = BinarySensorEntityDescription(
-            key="online",
-            device_class=BinarySensorDeviceClass.OCCUPANCY,
-            name=config[CONF_NAME],
-        )
-        entities.append(
-            WaspBinarySensor(
-                entity_description, f"{DOMAIN}_{config[CONF_NAME]}", hass, config
-            )
-        )
-
-    async_add_entities(entities)
-    await discovery_info["registrar"](entities)
-
-
 async def async_setup_entry(
     hass: HomeAssistant,
     config_entry: ConfigEntry,
@@ -59,239 +49,591 @@ async def async_setup_entry(
     """Set up the Wasp in a Box sensor."""
     entities = []
 
+    box_config = BoxConfig.from_config({**config_entry.data, **config_entry.options})
+    entry_data = hass.data[DOMAIN][config_entry.entry_id]
     entity_description = BinarySensorEntityDescription(
         key=None,
         device_class=BinarySensorDeviceClass.OCCUPANCY,
-        name=config_entry.data[CONF_NAME],
+        name=box_config.name,
     )
-    entities.append(
-        WaspBinarySensor(
-            entity_description,
-            config_entry.entry_id,
-            hass,
-            config_entry.options,
-        )
+    box_class = (
+        WaspUnrecordedBinarySensor
+        if box_config.unrecorded_attributes
+        else WaspBinarySensor
+    )
+    box = box_class(
+        entity_description,
+        config_entry.entry_id,
+        hass,
+        box_config,
+        entry_data.metrics,
+        entry_data.dwell,
+    )
+    entry_data.box = box
+    entities.append(box)
+    entities.extend(
+        WaspDetailBinarySensor(description, config_entry.entry_id, box)
+        for description in DETAIL_TYPES
     )
 
     async_add_entities(entities)
 
 
+@dataclass(frozen=True, kw_only=True)
+class WaspDetailEntityDescription(BinarySensorEntityDescription):
+    """Describes a detail of the state of a box."""
+
+    value_fn: Callable[[WaspBoxEngine], bool]
+
+
+# The box state attributes as entities, to record them without the attributes
+DETAIL_TYPES: tuple[WaspDetailEntityDescription, ...] = (
+    WaspDetailEntityDescription(
+        key="box_open",
+        name="Box open",
+        device_class=BinarySensorDeviceClass.OPENING,
+        value_fn=lambda engine: not engine.box_closed,
+    ),
+    WaspDetailEntityDescription(
+        key="wasp_seen",
+        name="Wasp seen",
+        device_class=BinarySensorDeviceClass.MOTION,
+        value_fn=lambda engine: engine.wasp_seen,
+    ),
+)
+
+
+@dataclass
+class WaspExtraStoredData(ExtraStoredData):
+    """Persisted state machine of a box, including its pending deadlines."""
+
+    engine: dict[str, Any]
+    dwell: dict[str, Any] | None = None
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return a dict representation of the stored data."""
+        return {**self.engine, "dwell": self.dwell}
+
+    @classmethod
+    def from_dict(cls, restored: dict[str, Any]) -> WaspExtraStoredData | None:
+        """Initialize the stored data from a dict."""
+        if not isinstance(restored, dict) or "deadlines" not in restored:
+            return None
+
+        engine = dict(restored)
+        return cls(engine, engine.pop("dwell", None))
+
+
 class WaspBinarySensor(BinarySensorEntity, RestoreEntity):
     """Wasp binary_sensor class."""
 
+    # The learned delays change with most state writes
+    _unrecorded_attributes = frozenset({"sensor_change_delays"})
+    _attr_should_poll = False
+
     def __init__(
         self,
         entity_description: BinarySensorEntityDescription,
         unique_id: str,
         hass,
-        config,
+        config: BoxConfig,
+        metrics: Metrics | None = None,
+        dwell: DwellStats | None = None,
     ):
         self.hass = hass
         self._config = config
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.dwell = dwell if dwell is not None else DwellStats()
 
         self._attr_unique_id = unique_id
         self.entity_description = entity_description
 
         _LOGGER.debug("%s: startup %s", self.entity_description.name, self._config)
 
-        self._wasp_in_box = False
-        self._box_closed = False
-        self._wasp_seen = False
+        # The engine runs on the loop clock, the same clock as the timer wheel
+        self._engine = WaspBoxEngine(config, clock=hass.loop.time)
+
+        # The state as last written, to skip writes when nothing changed
+        self._written_state: tuple[bool, bool, bool, bool] | None = None
+
+        # Loop time the events waiting for a sensor change delay or for the
+        # next state write were fired, for the event to decision latency
+        self._fired: dict[str, float] = {}
+        self._write_fired: float | None = None
+
+        # Pending timeout of the engine, sensor change delays are waited for by
+        # the coordinator so boxes sharing a sensor share the timer
+        self._timers: dict[str, WheelTimer] = {}
+        self._debounces: dict[str, Deadline] = {}
+        self._coordinator: WaspCoordinator | None = None
+        self._started = False
+
+        # The configuration with its areas, labels and groups resolved into
+        # sensors, and what that depends on
+        self._sensor_config = config
+        self._member_keys: frozenset[MemberKey] = frozenset()
+
+        # Detail entities that follow the state writes of the box
+        self._details: set[WaspDetailBinarySensor] = set()
+
+        # Opt-in trace of the most recent events and decisions
+        self._trace: TraceBuffer | None = (
+            TraceBuffer(config.trace_size) if config.trace_size else None
+        )
 
     async def async_added_to_hass(self):
         """Handle added to Hass."""
         await super().async_added_to_hass()
 
-        if state := await self.async_get_last_state():
-            _LOGGER.debug("%s: restoring state %s", self.entity_description.name, state)
-            self._wasp_in_box = state.attributes.get("wasp_in_box", False)
-            self._box_closed = state.attributes.get("box_closed", False)
-            self._wasp_seen = state.attributes.get("wasp_seen", False)
+        self._coordinator = async_get_coordinator(self.hass)
 
-        # wait until full HASS Startup before starting event listeners
-        if self.hass.is_running:
-            await self._startup()
-        else:
-            self.hass.bus.async_listen_once(EVENT_HOMEASSISTANT_START, self._startup)
-
-    async def _startup(self, _=None):
-        await self._evaluate_wasp_sensors()
-        await self._evaluate_box_sensors()
-
-        # Wasp Sensor State Changes
-        sensors = self._config[CONF_WASP_SENSORS]
-        if len(sensors) > 0:
-            self.async_on_remove(
-                async_track_state_change_event(
-                    self.hass,
-                    sensors,
-                    partial(self._wasp_sensor_change_handler, expected_state="on"),
-                )
+        if (extra := await self.async_get_last_extra_data()) is not None and (
+            stored := WaspExtraStoredData.from_dict(extra.as_dict())
+        ) is not None:
+            _LOGGER.debug(
+                "%s: restoring state machine %s", self.entity_description.name, stored
             )
-
-        # Wasp Inverted Sensor State Changes
-        sensors = self._config[CONF_WASP_INV_SENSORS]
-        if len(sensors) > 0:
-            self.async_on_remove(
-                async_track_state_change_event(
-                    self.hass,
-                    sensors,
-                    partial(self._wasp_sensor_change_handler, expected_state="off"),
-                )
+            self._engine.restore(stored.engine, self._wall_offset())
+            if stored.dwell is not None:
+                self.dwell.restore(stored.dwell)
+        elif state := await self.async_get_last_state():
+            _LOGGER.debug("%s: restoring state %s", self.entity_description.name, state)
+            self._engine.wasp_in_box = state.attributes.get("wasp_in_box", False)
+            self._engine.box_closed = state.attributes.get("box_closed", False)
+            self._engine.wasp_seen = state.attributes.get("wasp_seen", False)
+            self._engine.tentative = (
+                state.attributes.get("confidence") == CONFIDENCE_TENTATIVE
             )
 
-        # Box Sensor State Changes
-        sensors = self._config[CONF_BOX_SENSORS]
-        if len(sensors) > 0:
-            self.async_on_remove(
-                async_track_state_change_event(
-                    self.hass,
-                    sensors,
-                    self._box_sensor_change_handler,
-                )
-            )
+        # The coordinator starts all boxes in one batch after HASS Startup
+        self._coordinator.async_add_box(self)
 
-        # Box Inverted Sensor State Changes
-        sensors = self._config[CONF_BOX_INV_SENSORS]
-        if len(sensors) > 0:
-            self.async_on_remove(
-                async_track_state_change_event(
-                    self.hass,
-                    sensors,
-                    self._box_sensor_change_handler,
-                )
-            )
+    async def async_will_remove_from_hass(self) -> None:
+        """Cancel all pending work when removed from Hass."""
+        self._coordinator.async_remove_box(self)
+        self._started = False
+        self._timers.clear()
+        self._debounces.clear()
+        self._fired.clear()
+        self._write_fired = None
+        self._engine.reset_pending()
+
+        await super().async_will_remove_from_hass()
 
     @callback
-    async def _box_sensor_change_handler(self, event: Event):
-        this_entity_id = event.data["entity_id"]
-        new_state = event.data["new_state"].state
+    def async_start(self, get_state: Callable[[str], str | None]) -> None:
+        """Initialise from the sensor states, called by the coordinator."""
+        # Drop the restored state of sensors that are no longer configured, now
+        # that the areas, labels and groups are resolved
+        self._engine.update_sensors(self._sensor_config)
+        self._engine.rescan(get_state)
+        self._started = True
+
+        # Deadlines restored from before the restart, those that passed while
+        # Home Assistant was not running fire right away
+        for deadline in self._engine.pending_deadlines():
+            _LOGGER.debug("%s: resuming %s", self.entity_description.name, deadline)
+            self._schedule_deadline(deadline)
 
-        _LOGGER.debug(
-            "%s: %s is now %s",
-            self.entity_description.name,
-            this_entity_id,
-            new_state,
+    @property
+    def extra_restore_state_data(self) -> WaspExtraStoredData:
+        """Return the state machine to persist across restarts."""
+        return WaspExtraStoredData(
+            self._engine.snapshot(self._wall_offset()), self.dwell.as_dict(time.time())
+        )
+
+    @callback
+    def async_get_trace(self) -> list[dict[str, Any]] | None:
+        """Return the trace, or None when tracing is not enabled."""
+        if self._trace is None:
+            return None
+
+        return self._trace.as_list(self._wall_offset())
+
+    def _wall_offset(self) -> float:
+        """Return the wall clock time minus the loop clock time."""
+        return time.time() - self.hass.loop.time()
+
+    @property
+    def box_config(self) -> BoxConfig:
+        """Return the configuration of the box."""
+        return self._config
+
+    @property
+    def sensor_config(self) -> BoxConfig:
+        """Return the configuration with its areas, labels and groups resolved."""
+        return self._sensor_config
+
+    @property
+    def member_keys(self) -> frozenset[MemberKey]:
+        """Return the areas, labels and groups the sensors are resolved from."""
+        return self._member_keys
+
+    @callback
+    def async_resolve_members(self) -> bool:
+        """Resolve the areas, labels and groups, return whether sensors changed."""
+        sensor_config, self._member_keys = self._coordinator.membership.async_expand(
+            self._config
         )
+        if sensor_config == self._sensor_config:
+            return False
 
-        await self._evaluate_box_sensors()
-        self._wasp_in_box = False
+        self._sensor_config = sensor_config
+        self._async_cancel_dropped(self._engine.update_sensors(sensor_config))
 
-        await self.async_update_ha_state()
+        return True
+
+    @callback
+    def _async_cancel_dropped(self, dropped: list[Deadline]) -> None:
+        """Cancel the debounces of sensors the box does not have anymore."""
+        for deadline in dropped:
+            self._fired.pop(deadline.key, None)
+            if self._debounces.pop(deadline.key, None) is not None:
+                self._coordinator.async_cancel_debounce(self, deadline)
 
-        if not self._box_closed or not self._wasp_seen:
+    @callback
+    def async_members_changed(self) -> None:
+        """Follow the changed members of the areas, labels and groups of the box."""
+        if not self.async_resolve_members():
             return
 
         _LOGGER.debug(
-            "%s: box is closed and wasp is seen, waiting %s seconds",
+            "%s: sensors changed to %s",
             self.entity_description.name,
-            self._config[CONF_TIMEOUT],
+            self._sensor_config.sensor_roles,
         )
 
-        timeout = self._config[CONF_TIMEOUT]
-        if isinstance(timeout, dict):
-            timeout = timedelta(**timeout).total_seconds()
-        await asyncio.sleep(timeout)
+        self._engine.rescan(self._coordinator.async_sensor_state)
+        self._coordinator.async_update_box(self)
+        self._coordinator.async_schedule_write(self)
 
-        if self._box_closed and self._wasp_seen:
-            _LOGGER.debug(
-                "%s: box is still closed and wasp is still seen after %s seconds",
-                self.entity_description.name,
-                self._config[CONF_TIMEOUT],
-            )
+    @callback
+    def async_reconfigure(self, config: BoxConfig) -> None:
+        """Apply a changed configuration without removing the entity."""
+        if config == self._config:
+            return
+
+        _LOGGER.debug("%s: reconfigure %s", self.entity_description.name, config)
+
+        self._config = config
+
+        if not config.trace_size:
+            self._trace = None
+        elif self._trace is None:
+            self._trace = TraceBuffer(config.trace_size)
+        elif self._trace.size != config.trace_size:
+            self._trace.resize(config.trace_size)
 
-            self._wasp_in_box = True
-            await self.async_update_ha_state()
+        if not self._started:
+            # Startup resolves the members and picks up the new configuration
+            self._sensor_config = config
             return
 
-    async def _evaluate_box_sensors(self):
-        for sensor in self._config[CONF_BOX_SENSORS]:
-            state = self.hass.states.get(sensor).state
-            if state == "on":
-                self._box_closed = False
-                self._wasp_in_box = False
-                return
+        self._sensor_config, self._member_keys = (
+            self._coordinator.membership.async_expand(config)
+        )
+        # The timeout and the debounces of the remaining sensors keep running
+        self._async_cancel_dropped(self._engine.reconfigure(self._sensor_config))
 
-        for sensor in self._config[CONF_BOX_INV_SENSORS]:
-            state = self.hass.states.get(sensor).state
-            if state == "off":
-                self._box_closed = False
-                self._wasp_in_box = False
-                return
+        self._engine.rescan(self._coordinator.async_sensor_state)
+        self._coordinator.async_update_box(self)
+        self._coordinator.async_schedule_write(self)
 
-        self._box_closed = True
-        return
+    @callback
+    def accepts_sensor_state(
+        self, entity_id: str, role: str, state: str | None
+    ) -> bool:
+        """Return whether a transition from or to an unusable state is an event."""
+        return self._engine.accepts(entity_id, role, state)
 
     @callback
-    async def _wasp_sensor_change_handler(
-        self, event: Event, expected_state: str = "on"
-    ):
-        this_entity_id = event.data["entity_id"]
-        new_state = event.data["new_state"].state
+    def async_dispatch_sensor_event(
+        self,
+        this_entity_id: str,
+        old_state: str | None,
+        new_state: str | None,
+        role: str,
+        now: float,
+        fired: float,
+    ) -> None:
+        """
+        Handle a state change of one of the sensors of this box.
+
+        The fired time is the loop time the state change event was fired, the
+        latency is counted from there until the decision is written.
+        """
+        self.metrics.events_received += 1
+
+        if role in WASP_ROLES:
+            decision = self._engine.wasp_sensor_changed(
+                this_entity_id, role, now, new_state
+            )
+            if decision.schedule is not None:
+                _LOGGER.debug(
+                    "%s: waiting for %s, currently %s, for %s seconds",
+                    self.entity_description.name,
+                    this_entity_id,
+                    new_state,
+                    decision.schedule.when - now,
+                )
+        else:
+            _LOGGER.debug(
+                "%s: %s is now %s",
+                self.entity_description.name,
+                this_entity_id,
+                new_state,
+            )
+            decision = self._engine.box_sensor_changed(
+                this_entity_id, role, new_state, now
+            )
 
-        sensor_change_delay = self._config.get(
-            CONF_SENSOR_CHANGE_DELAY, DEFAULT_SENSOR_CHANGE_DELAY
-        )
-        if isinstance(sensor_change_delay, dict):
-            sensor_change_delay = timedelta(**sensor_change_delay).total_seconds()
+        if decision.reason == REASON_UNCHANGED:
+            # A new value of a numeric sensor that did not cross its threshold
+            self.metrics.events_filtered += 1
+        else:
+            self._apply_decision(decision)
+        if decision.schedule is not None and decision.schedule.key != TIMEOUT:
+            self._fired[decision.schedule.key] = fired
+        else:
+            self._decided(decision, fired)
+
+        if (trace := self._trace) is not None:
+            trace.record(
+                now,
+                this_entity_id,
+                old_state,
+                new_state,
+                decision.reason,
+                decision.write,
+            )
+
+    @callback
+    def async_child_changed(
+        self, child_entity_id: str, child_state: str | None, now: float
+    ) -> None:
+        """Handle a change of the occupancy of a child box."""
+        decision = self._engine.child_box_changed(child_entity_id, child_state, now)
+        if not decision.write:
+            return
 
         _LOGGER.debug(
-            "%s: waiting for %s, currently %s, for %s seconds",
+            "%s: child %s is now %s",
             self.entity_description.name,
-            this_entity_id,
-            new_state,
-            sensor_change_delay,
+            child_entity_id,
+            child_state,
         )
+        self.metrics.events_received += 1
+        self._apply_decision(decision)
 
-        # Wait; some sensors send 'on' right before 'off'
-        await asyncio.sleep(sensor_change_delay)
+        if (trace := self._trace) is not None:
+            trace.record(
+                now, child_entity_id, None, child_state, decision.reason, decision.write
+            )
 
-        this_state = self.hass.states.get(this_entity_id).state
+    @callback
+    def async_sensor_settled(self, deadline: Deadline, state: str | None) -> None:
+        """Handle the state of a wasp sensor after the sensor change delay."""
+        self._deadline_reached(deadline, state)
 
-        _LOGGER.debug(
-            "%s: %s is %s after %s seconds",
-            self.entity_description.name,
-            this_entity_id,
-            this_state,
-            sensor_change_delay,
+    @callback
+    def _deadline_reached(self, deadline: Deadline, this_state: str | None = None):
+        if deadline.key == TIMEOUT:
+            del self._timers[deadline.key]
+            self.metrics.timeouts_completed += 1
+            decision = self._engine.deadline_reached(deadline)
+        else:
+            del self._debounces[deadline.key]
+            fired = self._fired.pop(deadline.key, None)
+            _LOGGER.debug(
+                "%s: %s is %s after the sensor change delay",
+                self.entity_description.name,
+                deadline.key,
+                this_state,
+            )
+            decision = self._engine.deadline_reached(deadline, this_state)
+            if fired is not None:
+                self._decided(decision, fired)
+
+        self._apply_decision(decision)
+
+        if (trace := self._trace) is not None:
+            trace.record(
+                self.hass.loop.time(),
+                deadline.key,
+                None,
+                this_state,
+                decision.reason,
+                decision.write,
+            )
+
+    @callback
+    def _apply_decision(self, decision: Decision) -> None:
+        """Act upon a decision of the engine."""
+        if decision.cancel is not None:
+            if (timer := self._timers.pop(decision.cancel, None)) is not None:
+                timer.cancel()
+                self.metrics.timeouts_aborted += 1
+            elif (pending := self._debounces.pop(decision.cancel, None)) is not None:
+                self._fired.pop(decision.cancel, None)
+                self._coordinator.async_cancel_debounce(self, pending)
+                self.metrics.debounces_cancelled += 1
+
+        if (deadline := decision.schedule) is not None:
+            if decision.reason == REASON_TIMEOUT_STARTED:
+                self.metrics.timeouts_started += 1
+                _LOGGER.debug(
+                    "%s: box is closed and wasp is seen, waiting %s seconds",
+                    self.entity_description.name,
+                    self._config.timeout,
+                )
+            self._schedule_deadline(deadline)
+
+        if decision.reason == REASON_OCCUPIED:
+            _LOGGER.debug(
+                "%s: box is still closed and wasp is still seen after %s seconds",
+                self.entity_description.name,
+                self._config.timeout,
+            )
+        elif decision.reason == REASON_RETRACTED:
+            _LOGGER.debug(
+                "%s: wasp is gone before the timeout, retracting occupied",
+                self.entity_description.name,
+            )
+
+        if decision.write:
+            self._coordinator.async_schedule_write(self)
+
+    @callback
+    def _decided(self, decision: Decision, fired: float) -> None:
+        """Count the latency of an event once its decision is taken."""
+        if decision.write:
+            # Counted when the state is written, together with other events
+            # decided in the same loop iteration
+            if self._write_fired is None or fired < self._write_fired:
+                self._write_fired = fired
+        else:
+            self.metrics.latency.record(self.hass.loop.time() - fired)
+
+    @callback
+    def _schedule_deadline(self, deadline: Deadline) -> None:
+        if deadline.key != TIMEOUT:
+            self._debounces[deadline.key] = deadline
+            self._coordinator.async_debounce(self, deadline)
+            return
+
+        self._timers[deadline.key] = self._coordinator.timers.schedule_at(
+            deadline.when,
+            self._deadline_reached,
+            deadline,
+            owner=self,
+            name=deadline.key,
         )
 
-        if this_state == expected_state:
-            if self._box_closed:
-                self._wasp_in_box = True
+    @property
+    def engine(self) -> WaspBoxEngine:
+        """Return the state machine of the box."""
+        return self._engine
 
-        await self._evaluate_wasp_sensors()
-        await self.async_update_ha_state()
+    @callback
+    def async_add_detail(self, detail: WaspDetailBinarySensor) -> CALLBACK_TYPE:
+        """Write a detail entity along with the box, return a remove callback."""
+        self._details.add(detail)
+        return lambda: self._details.discard(detail)
 
-    async def _evaluate_wasp_sensors(self):
-        for this_wasp_sensor in self._config[CONF_WASP_SENSORS]:
-            this_state = self.hass.states.get(this_wasp_sensor).state
-            if this_state == "on":
-                self._wasp_seen = True
-                return
+    @callback
+    def async_write_state(self) -> None:
+        """Write the state, unless is_on and the attributes did not change."""
+        if (fired := self._write_fired) is not None:
+            self._write_fired = None
+            self.metrics.latency.record(self.hass.loop.time() - fired)
+
+        state = (
+            self._engine.wasp_in_box,
+            self._engine.box_closed,
+            self._engine.wasp_seen,
+            self._engine.tentative,
+        )
+        if state == self._written_state:
+            self.metrics.writes_suppressed += 1
+            return
 
-        for this_wasp_sensor in self._config[CONF_WASP_INV_SENSORS]:
-            this_state = self.hass.states.get(this_wasp_sensor).state
-            if this_state == "off":
-                self._wasp_seen = True
-                return
+        self._written_state = state
+        self.metrics.writes_issued += 1
+        self.dwell.update(state[0], time.time())
+        self.async_write_ha_state()
 
-        self._wasp_seen = False
-        return
+        for detail in self._details:
+            detail.async_box_written()
 
     @property
     def extra_state_attributes(self):
         """Return the state attributes."""
-        return {
+        attributes = {
             # "attribution": f"{DOMAIN} {BINARY_SENSOR}",
             # "id": str(self.unique_id),
             # "integration": DOMAIN,
-            "wasp_in_box": self._wasp_in_box,
-            "box_closed": self._box_closed,
-            "wasp_seen": self._wasp_seen,
+            "wasp_in_box": self._engine.wasp_in_box,
+            "box_closed": self._engine.box_closed,
+            "wasp_seen": self._engine.wasp_seen,
+            "confidence": self._engine.confidence,
         }
+        if self._config.adaptive_delay:
+            # Learned delays are updated with the next state write
+            attributes["sensor_change_delays"] = self._engine.sensor_change_delays()
+
+        return attributes
 
     @property
     def is_on(self):
         """Return true if the binary_sensor is on."""
-        return self._wasp_in_box
+        return self._engine.wasp_in_box
+
+
+class WaspUnrecordedBinarySensor(WaspBinarySensor):
+    """A box that keeps its attributes out of the recorder."""
+
+    # The attributes are restored from the extra restore data and are
+    # available as detail entities, they need not be in the recorder
+    _unrecorded_attributes = WaspBinarySensor._unrecorded_attributes | {
+        "wasp_in_box",
+        "box_closed",
+        "wasp_seen",
+        "confidence",
+    }
+
+
+class WaspDetailBinarySensor(BinarySensorEntity):
+    """A detail of the state of a box, disabled by default."""
+
+    entity_description: WaspDetailEntityDescription
+
+    _attr_entity_registry_enabled_default = False
+    _attr_should_poll = False
+
+    def __init__(
+        self,
+        entity_description: WaspDetailEntityDescription,
+        entry_id: str,
+        box: WaspBinarySensor,
+    ) -> None:
+        self.entity_description = entity_description
+        self._attr_unique_id = f"{entry_id}_{entity_description.key}"
+        self._attr_name = (
+            f"{box.entity_description.name} {entity_description.name.lower()}"
+        )
+        self._box = box
+
+    async def async_added_to_hass(self) -> None:
+        """Follow the state writes of the box."""
+        await super().async_added_to_hass()
+
+        self.async_on_remove(self._box.async_add_detail(self))
+        self.async_box_written()
+
+    @callback
+    def async_box_written(self) -> None:
+        """Write the state, only when it changed."""
+        is_on = self.entity_description.value_fn(self._box.engine)
+        if is_on != self._attr_is_on:
+            self._attr_is_on = is_on
+            self.async_write_ha_state()
@@ -5,54 +5,152 @@ from __future__ import annotations
 import logging
 from typing import Any, Final
 
-from homeassistant.components import binary_sensor
-from homeassistant.config_entries import ConfigEntry, ConfigFlow, OptionsFlow
+from homeassistant.components import binary_sensor, sensor
+from homeassistant.config_entries import (
+    SOURCE_IMPORT,
+    ConfigEntry,
+    ConfigFlow,
+    OptionsFlow,
+)
 from homeassistant.core import callback
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.helpers.selector import (
+    AreaSelector,
+    AreaSelectorConfig,
+    BooleanSelector,
     DurationSelector,
     DurationSelectorConfig,
     EntitySelector,
     EntitySelectorConfig,
+    LabelSelector,
+    LabelSelectorConfig,
+    NumberSelector,
+    NumberSelectorConfig,
+    NumberSelectorMode,
+    ObjectSelector,
+    SelectSelector,
+    SelectSelectorConfig,
+    SelectSelectorMode,
     TextSelector,
 )
 import voluptuous as vol
 
 from .const import (
+    CONF_ADAPTIVE_DELAY,
+    CONF_BOX_AREAS,
     CONF_BOX_INV_SENSORS,
+    CONF_BOX_LABELS,
     CONF_BOX_SENSORS,
+    CONF_CHILD_BOXES,
+    CONF_MIN_SENSOR_CHANGE_DELAY,
     CONF_NAME,
+    CONF_OPTIMISTIC,
     CONF_SENSOR_CHANGE_DELAY,
+    CONF_THRESHOLDS,
     CONF_TIMEOUT,
+    CONF_TRACE_SIZE,
+    CONF_UNAVAILABLE_POLICY,
+    CONF_UNRECORDED_ATTRIBUTES,
+    CONF_WASP_AREAS,
     CONF_WASP_INV_SENSORS,
+    CONF_WASP_LABELS,
     CONF_WASP_SENSORS,
+    DATA_YAML_BOXES,
+    DEFAULT_ADAPTIVE_DELAY,
+    DEFAULT_MIN_SENSOR_CHANGE_DELAY,
+    DEFAULT_OPTIMISTIC,
     DEFAULT_SENSOR_CHANGE_DELAY,
+    DEFAULT_TRACE_SIZE,
+    DEFAULT_UNAVAILABLE_POLICY,
+    DEFAULT_UNRECORDED_ATTRIBUTES,
     DEFAULT_WASP_TIMEOUT,
     DOMAIN,
+    MAX_TRACE_SIZE,
+    UNAVAILABLE_POLICIES,
 )
+from .schema import THRESHOLDS_SCHEMA, missing_thresholds, unused_thresholds
 
 _LOGGER: Final = logging.getLogger(__name__)
 
+# Numeric sensors need a threshold rule
+INPUT_DOMAINS = [binary_sensor.DOMAIN, sensor.DOMAIN]
+
+
+def _validate_thresholds(user_input: dict[str, Any], errors: dict[str, str]) -> None:
+    """Validate and normalise the threshold rules entered as an object."""
+    try:
+        user_input[CONF_THRESHOLDS] = THRESHOLDS_SCHEMA(
+            user_input.get(CONF_THRESHOLDS) or {}
+        )
+    except vol.Invalid as err:
+        _LOGGER.debug("Invalid threshold rules: %s", err)
+        errors[CONF_THRESHOLDS] = "invalid_thresholds"
+        return
+
+    if missing := missing_thresholds(user_input):
+        _LOGGER.debug("Numeric sensors without a threshold rule: %s", missing)
+        errors[CONF_THRESHOLDS] = "threshold_missing"
+    elif unused := unused_thresholds(user_input):
+        _LOGGER.debug("Threshold rules for sensors not in the box: %s", unused)
+        errors[CONF_THRESHOLDS] = "threshold_unused"
+
+
+def _duration(seconds: float) -> dict[str, int]:
+    """Return a duration selector value."""
+    whole = int(seconds)
+    if (milliseconds := round((seconds - whole) * 1000)) == 0:
+        return {"seconds": whole}
+
+    return {"seconds": whole, "milliseconds": milliseconds}
+
+
+def _import_options(import_data: dict[str, Any]) -> dict[str, Any]:
+    """Return the options of a box configured in YAML, as the options flow stores them."""
+    options = {key: value for key, value in import_data.items() if key != CONF_NAME}
+    # YAML durations are a number of seconds
+    for key in (CONF_TIMEOUT, CONF_SENSOR_CHANGE_DELAY, CONF_MIN_SENSOR_CHANGE_DELAY):
+        options[key] = _duration(options[key])
+
+    return options
+
 
 class WaspConfigFlow(ConfigFlow, domain=DOMAIN):
     """Handle a config flow for Wasp in a Box."""
 
     VERSION = 1
+    MINOR_VERSION = 2
 
     SCHEMA = vol.Schema(
         {
             vol.Required(CONF_NAME): TextSelector(),
             vol.Optional(CONF_WASP_SENSORS, default=[]): EntitySelector(
-                EntitySelectorConfig(multiple=True, domain=binary_sensor.DOMAIN)
+                EntitySelectorConfig(multiple=True, domain=INPUT_DOMAINS)
             ),
             vol.Optional(CONF_WASP_INV_SENSORS, default=[]): EntitySelector(
-                EntitySelectorConfig(multiple=True, domain=binary_sensor.DOMAIN)
+                EntitySelectorConfig(multiple=True, domain=INPUT_DOMAINS)
             ),
             vol.Optional(CONF_BOX_SENSORS, default=[]): EntitySelector(
-                EntitySelectorConfig(multiple=True, domain=binary_sensor.DOMAIN)
+                EntitySelectorConfig(multiple=True, domain=INPUT_DOMAINS)
             ),
             vol.Optional(CONF_BOX_INV_SENSORS, default=[]): EntitySelector(
-                EntitySelectorConfig(multiple=True, domain=binary_sensor.DOMAIN)
+                EntitySelectorConfig(multiple=True, domain=INPUT_DOMAINS)
+            ),
+            vol.Optional(CONF_CHILD_BOXES, default=[]): EntitySelector(
+                EntitySelectorConfig(
+                    multiple=True, integration=DOMAIN, domain=binary_sensor.DOMAIN
+                )
+            ),
+            vol.Optional(CONF_WASP_AREAS, default=[]): AreaSelector(
+                AreaSelectorConfig(multiple=True)
+            ),
+            vol.Optional(CONF_WASP_LABELS, default=[]): LabelSelector(
+                LabelSelectorConfig(multiple=True)
+            ),
+            vol.Optional(CONF_BOX_AREAS, default=[]): AreaSelector(
+                AreaSelectorConfig(multiple=True)
+            ),
+            vol.Optional(CONF_BOX_LABELS, default=[]): LabelSelector(
+                LabelSelectorConfig(multiple=True)
             ),
             vol.Optional(
                 CONF_TIMEOUT,
@@ -70,6 +168,36 @@ class WaspConfigFlow(ConfigFlow, domain=DOMAIN):
             ): DurationSelector(
                 DurationSelectorConfig(enable_day=False, enable_millisecond=True)
             ),
+            vol.Optional(
+                CONF_ADAPTIVE_DELAY, default=DEFAULT_ADAPTIVE_DELAY
+            ): BooleanSelector(),
+            vol.Optional(
+                CONF_MIN_SENSOR_CHANGE_DELAY,
+                default={"seconds": DEFAULT_MIN_SENSOR_CHANGE_DELAY},
+            ): DurationSelector(
+                DurationSelectorConfig(enable_day=False, enable_millisecond=True)
+            ),
+            vol.Optional(
+                CONF_UNAVAILABLE_POLICY, default=DEFAULT_UNAVAILABLE_POLICY
+            ): SelectSelector(
+                SelectSelectorConfig(
+                    options=list(UNAVAILABLE_POLICIES),
+                    mode=SelectSelectorMode.DROPDOWN,
+                    translation_key=CONF_UNAVAILABLE_POLICY,
+                )
+            ),
+            vol.Optional(
+                CONF_OPTIMISTIC, default=DEFAULT_OPTIMISTIC
+            ): BooleanSelector(),
+            vol.Optional(CONF_THRESHOLDS, default={}): ObjectSelector(),
+            vol.Optional(CONF_TRACE_SIZE, default=DEFAULT_TRACE_SIZE): NumberSelector(
+                NumberSelectorConfig(
+                    min=0, max=MAX_TRACE_SIZE, step=1, mode=NumberSelectorMode.BOX
+                )
+            ),
+            vol.Optional(
+                CONF_UNRECORDED_ATTRIBUTES, default=DEFAULT_UNRECORDED_ATTRIBUTES
+            ): BooleanSelector(),
         }
     )
 
@@ -81,6 +209,7 @@ class WaspConfigFlow(ConfigFlow, domain=DOMAIN):
 
         if user_input is not None:
             self.SCHEMA(user_input)
+            _validate_thresholds(user_input, errors)
 
             title = user_input.get(CONF_NAME)
             data = {CONF_NAME: title}
@@ -89,11 +218,28 @@ class WaspConfigFlow(ConfigFlow, domain=DOMAIN):
                 CONF_WASP_INV_SENSORS: user_input.get(CONF_WASP_INV_SENSORS),
                 CONF_BOX_SENSORS: user_input.get(CONF_BOX_SENSORS),
                 CONF_BOX_INV_SENSORS: user_input.get(CONF_BOX_INV_SENSORS),
+                CONF_CHILD_BOXES: user_input.get(CONF_CHILD_BOXES),
+                CONF_WASP_AREAS: user_input.get(CONF_WASP_AREAS),
+                CONF_WASP_LABELS: user_input.get(CONF_WASP_LABELS),
+                CONF_BOX_AREAS: user_input.get(CONF_BOX_AREAS),
+                CONF_BOX_LABELS: user_input.get(CONF_BOX_LABELS),
                 CONF_TIMEOUT: user_input.get(CONF_TIMEOUT),
                 CONF_SENSOR_CHANGE_DELAY: user_input.get(CONF_SENSOR_CHANGE_DELAY),
+                CONF_ADAPTIVE_DELAY: user_input.get(CONF_ADAPTIVE_DELAY),
+                CONF_MIN_SENSOR_CHANGE_DELAY: user_input.get(
+                    CONF_MIN_SENSOR_CHANGE_DELAY
+                ),
+                CONF_UNAVAILABLE_POLICY: user_input.get(CONF_UNAVAILABLE_POLICY),
+                CONF_OPTIMISTIC: user_input.get(CONF_OPTIMISTIC),
+                CONF_THRESHOLDS: user_input.get(CONF_THRESHOLDS),
+                CONF_TRACE_SIZE: user_input.get(CONF_TRACE_SIZE),
+                CONF_UNRECORDED_ATTRIBUTES: user_input.get(CONF_UNRECORDED_ATTRIBUTES),
             }
 
             if not errors:
+                # The name identifies a box, also against the boxes in YAML
+                await self.async_set_unique_id(title)
+                self._abort_if_unique_id_configured()
                 return self.async_create_entry(title=title, data=data, options=options)
 
         if user_input is not None:
@@ -107,6 +253,31 @@ class WaspConfigFlow(ConfigFlow, domain=DOMAIN):
             errors=errors,
         )
 
+    async def async_step_import(self, import_data: dict[str, Any]) -> FlowResult:
+        """Import a box configured in YAML, its name identifies it across restarts."""
+        name = import_data[CONF_NAME]
+        options = _import_options(import_data)
+
+        await self.async_set_unique_id(name)
+        entry = self.hass.config_entries.async_entry_for_domain_unique_id(DOMAIN, name)
+        if entry is not None:
+            if entry.source != SOURCE_IMPORT:
+                _LOGGER.warning(
+                    "Not importing %s from YAML, a box with that name exists", name
+                )
+                return self.async_abort(reason="already_configured")
+
+            if entry.options == options:
+                return self.async_abort(reason="already_configured")
+
+            # YAML stays the source of the options of an imported box
+            self.hass.config_entries.async_update_entry(entry, options=options)
+            return self.async_abort(reason="updated")
+
+        return self.async_create_entry(
+            title=name, data={CONF_NAME: name}, options=options
+        )
+
     @staticmethod
     @callback
     def async_get_options_flow(
@@ -122,16 +293,33 @@ class WaspOptionsFlowHandler(OptionsFlow):
     OPTIONS_SCHEMA = vol.Schema(
         {
             vol.Optional(CONF_WASP_SENSORS, default=[]): EntitySelector(
-                EntitySelectorConfig(multiple=True, domain=binary_sensor.DOMAIN)
+                EntitySelectorConfig(multiple=True, domain=INPUT_DOMAINS)
             ),
             vol.Optional(CONF_WASP_INV_SENSORS, default=[]): EntitySelector(
-                EntitySelectorConfig(multiple=True, domain=binary_sensor.DOMAIN)
+                EntitySelectorConfig(multiple=True, domain=INPUT_DOMAINS)
             ),
             vol.Optional(CONF_BOX_SENSORS, default=[]): EntitySelector(
-                EntitySelectorConfig(multiple=True, domain=binary_sensor.DOMAIN)
+                EntitySelectorConfig(multiple=True, domain=INPUT_DOMAINS)
             ),
             vol.Optional(CONF_BOX_INV_SENSORS, default=[]): EntitySelector(
-                EntitySelectorConfig(multiple=True, domain=binary_sensor.DOMAIN)
+                EntitySelectorConfig(multiple=True, domain=INPUT_DOMAINS)
+            ),
+            vol.Optional(CONF_CHILD_BOXES, default=[]): EntitySelector(
+                EntitySelectorConfig(
+                    multiple=True, integration=DOMAIN, domain=binary_sensor.DOMAIN
+                )
+            ),
+            vol.Optional(CONF_WASP_AREAS, default=[]): AreaSelector(
+                AreaSelectorConfig(multiple=True)
+            ),
+            vol.Optional(CONF_WASP_LABELS, default=[]): LabelSelector(
+                LabelSelectorConfig(multiple=True)
+            ),
+            vol.Optional(CONF_BOX_AREAS, default=[]): AreaSelector(
+                AreaSelectorConfig(multiple=True)
+            ),
+            vol.Optional(CONF_BOX_LABELS, default=[]): LabelSelector(
+                LabelSelectorConfig(multiple=True)
             ),
             vol.Optional(
                 CONF_TIMEOUT, default={"seconds": DEFAULT_WASP_TIMEOUT}
@@ -144,6 +332,36 @@ class WaspOptionsFlowHandler(OptionsFlow):
             ): DurationSelector(
                 DurationSelectorConfig(enable_day=False, enable_millisecond=True)
             ),
+            vol.Optional(
+                CONF_ADAPTIVE_DELAY, default=DEFAULT_ADAPTIVE_DELAY
+            ): BooleanSelector(),
+            vol.Optional(
+                CONF_MIN_SENSOR_CHANGE_DELAY,
+                default={"seconds": DEFAULT_MIN_SENSOR_CHANGE_DELAY},
+            ): DurationSelector(
+                DurationSelectorConfig(enable_day=False, enable_millisecond=True)
+            ),
+            vol.Optional(
+                CONF_UNAVAILABLE_POLICY, default=DEFAULT_UNAVAILABLE_POLICY
+            ): SelectSelector(
+                SelectSelectorConfig(
+                    options=list(UNAVAILABLE_POLICIES),
+                    mode=SelectSelectorMode.DROPDOWN,
+                    translation_key=CONF_UNAVAILABLE_POLICY,
+                )
+            ),
+            vol.Optional(
+                CONF_OPTIMISTIC, default=DEFAULT_OPTIMISTIC
+            ): BooleanSelector(),
+            vol.Optional(CONF_THRESHOLDS, default={}): ObjectSelector(),
+            vol.Optional(CONF_TRACE_SIZE, default=DEFAULT_TRACE_SIZE): NumberSelector(
+                NumberSelectorConfig(
+                    min=0, max=MAX_TRACE_SIZE, step=1, mode=NumberSelectorMode.BOX
+                )
+            ),
+            vol.Optional(
+                CONF_UNRECORDED_ATTRIBUTES, default=DEFAULT_UNRECORDED_ATTRIBUTES
+            ): BooleanSelector(),
         }
     )
 
@@ -151,10 +369,17 @@ class WaspOptionsFlowHandler(OptionsFlow):
         self, user_input: dict[str, Any] | None = None
     ) -> FlowResult:
         """Manage the options."""
+        if self.config_entry.source == SOURCE_IMPORT and (
+            self.config_entry.unique_id in self.hass.data.get(DATA_YAML_BOXES, ())
+        ):
+            # The next import would overwrite the options again
+            return self.async_abort(reason="managed_in_yaml")
+
         errors: dict[str, str] = {}
 
         if user_input is not None:
             self.OPTIONS_SCHEMA(user_input)
+            _validate_thresholds(user_input, errors)
 
             if not errors:
                 return self.async_create_entry(title="", data=user_input)
@@ -9,10 +9,10 @@ ISSUE_URL = "https://github.com/rrooggiieerr/homeassistant-wasp/issues"
 
 # Platforms
 BINARY_SENSOR = "binary_sensor"
-PLATFORMS = [BINARY_SENSOR]
 
 # Services
 SERVICE_RELOAD = "reload"
+SERVICE_DUMP_TRACE = "dump_trace"
 
 # Defaults
 DEFAULT_NAME = DOMAIN
@@ -22,13 +22,75 @@ CONF_WASP_SENSORS = "wasp_sensors"
 CONF_WASP_INV_SENSORS = "wasp_inv_sensors"
 CONF_BOX_SENSORS = "box_sensors"
 CONF_BOX_INV_SENSORS = "box_inv_sensors"
+CONF_CHILD_BOXES = "child_boxes"
+CONF_WASP_AREAS = "wasp_areas"
+CONF_WASP_LABELS = "wasp_labels"
+CONF_BOX_AREAS = "box_areas"
+CONF_BOX_LABELS = "box_labels"
 CONF_TIMEOUT = "timeout"
 CONF_NAME = "name"
 CONF_SENSOR_CHANGE_DELAY = "sensor_change_delay"
+CONF_UNAVAILABLE_POLICY = "unavailable_policy"
+CONF_TRACE_SIZE = "trace_size"
+CONF_THRESHOLDS = "thresholds"
+CONF_LOWER = "lower"
+CONF_UPPER = "upper"
+CONF_HYSTERESIS = "hysteresis"
+CONF_OPTIMISTIC = "optimistic"
+CONF_ADAPTIVE_DELAY = "adaptive_delay"
+CONF_MIN_SENSOR_CHANGE_DELAY = "min_sensor_change_delay"
+CONF_UNRECORDED_ATTRIBUTES = "unrecorded_attributes"
+
+# Sensor roles, a sensor can have one or more roles in one or more boxes
+SENSOR_ROLES = (
+    CONF_WASP_SENSORS,
+    CONF_WASP_INV_SENSORS,
+    CONF_BOX_SENSORS,
+    CONF_BOX_INV_SENSORS,
+)
+WASP_ROLES = (CONF_WASP_SENSORS, CONF_WASP_INV_SENSORS)
+BOX_ROLES = (CONF_BOX_SENSORS, CONF_BOX_INV_SENSORS)
+# An occupied child box counts as a seen wasp, children are not tracked on the bus
+CHILD_ROLES = (CONF_CHILD_BOXES,)
+
+# The state that makes a sensor count as a seen wasp or an open box, per role
+SENSOR_ROLE_ACTIVE_STATE = {
+    CONF_WASP_SENSORS: "on",
+    CONF_WASP_INV_SENSORS: "off",
+    CONF_BOX_SENSORS: "on",
+    CONF_BOX_INV_SENSORS: "off",
+    CONF_CHILD_BOXES: "on",
+}
+
+# Sensor states without a usable value
+UNAVAILABLE_STATES = frozenset({"unavailable", "unknown"})
+
+# How a sensor without a usable value is handled
+UNAVAILABLE_POLICY_INACTIVE = "inactive"
+UNAVAILABLE_POLICY_ACTIVE = "active"
+UNAVAILABLE_POLICY_IGNORE = "ignore"
+UNAVAILABLE_POLICIES = (
+    UNAVAILABLE_POLICY_INACTIVE,
+    UNAVAILABLE_POLICY_ACTIVE,
+    UNAVAILABLE_POLICY_IGNORE,
+)
+
+# The coordinator is kept next to hass.data[DOMAIN], which only holds entries
+DATA_COORDINATOR = f"{DOMAIN}_coordinator"
+# Names of the boxes in the YAML configuration, these are managed in YAML
+DATA_YAML_BOXES = f"{DOMAIN}_yaml_boxes"
 
 # Configuration
 DEFAULT_SENSOR_CHANGE_DELAY = 1
 DEFAULT_WASP_TIMEOUT = 5
+DEFAULT_UNAVAILABLE_POLICY = UNAVAILABLE_POLICY_INACTIVE
+DEFAULT_OPTIMISTIC = False
+DEFAULT_ADAPTIVE_DELAY = False
+DEFAULT_MIN_SENSOR_CHANGE_DELAY = 0
+DEFAULT_UNRECORDED_ATTRIBUTES = False
+# Tracing is off unless a trace size is configured
+DEFAULT_TRACE_SIZE = 0
+MAX_TRACE_SIZE = 10000
 
 
 STARTUP_MESSAGE = f"""
@@ -0,0 +1,545 @@
+"""Domain wide event dispatcher for Wasp Sensor."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Iterable, Mapping
+from graphlib import CycleError, TopologicalSorter
+import heapq
+import itertools
+import logging
+import time
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.const import EVENT_HOMEASSISTANT_START
+from homeassistant.core import (
+    CALLBACK_TYPE,
+    Event,
+    EventStateChangedData,
+    HomeAssistant,
+    callback,
+)
+from homeassistant.helpers.event import async_track_state_change_event
+
+from .const import CHILD_ROLES, DATA_COORDINATOR, UNAVAILABLE_STATES
+from .membership import MemberKey, MembershipIndex
+from .metrics import Metrics
+from .timer import TimerWheel, WheelTimer
+
+if TYPE_CHECKING:
+    from .binary_sensor import WaspBinarySensor
+    from .engine import Deadline
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+@callback
+def async_get_coordinator(hass: HomeAssistant) -> WaspCoordinator:
+    """Return the coordinator shared by all boxes, create it if needed."""
+    if (coordinator := hass.data.get(DATA_COORDINATOR)) is None:
+        coordinator = hass.data[DATA_COORDINATOR] = WaspCoordinator(hass)
+
+    return coordinator
+
+
+class SensorDebounce:
+    """
+    A sensor change delay shared by all boxes waiting on the same change.
+
+    Boxes can have different delays, the one timer runs until the earliest
+    deadline of the waiting boxes and is moved to the next one from there.
+    """
+
+    __slots__ = ("entity_id", "timer", "waiters")
+
+    def __init__(self, entity_id: str) -> None:
+        self.entity_id = entity_id
+        self.timer: WheelTimer | None = None
+        # box -> the deadline of that box
+        self.waiters: dict[WaspBinarySensor, Deadline] = {}
+
+
+class WaspCoordinator:
+    """
+    Subscribe once to the union of all wasp and box sensors.
+
+    Boxes are started in batches, after Home Assistant has started. An index
+    from entity_id to the boxes and roles that care about that entity is kept
+    so a state change only reaches the boxes that need it. All box
+    timeouts and sensor change delays are kept on one shared timer wheel, and
+    state writes are coalesced to at most one per box per loop iteration.
+
+    Boxes that wait on the same change of a wasp sensor with the same sensor
+    change delay share a single timer, the sensor state is read once when it
+    settles and handed to every waiting box.
+
+    Boxes can have other boxes as children. The occupancy of a child is handed
+    to its parents in-process when the child is written, boxes are written in
+    topological order so a parent is written once, after all its children.
+
+    Areas, labels and groups of the boxes are resolved into sensors by the
+    membership index. When their members change, only the boxes using them
+    index their sensors again, the entries are not reloaded.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+
+        # entity_id -> ((box, role), ...)
+        self._index: dict[str, tuple[tuple[WaspBinarySensor, str], ...]] = {}
+        # box -> {role: [entity_id, ...]}
+        self._boxes: dict[WaspBinarySensor, Mapping[str, Iterable[str]]] = {}
+
+        self._unsub: CALLBACK_TYPE | None = None
+        self._refresh_handle: asyncio.Handle | None = None
+
+        # Boxes waiting for the next startup batch
+        self._starting: dict[WaspBinarySensor, None] = {}
+        self._start_handle: asyncio.Handle | None = None
+        self._start_unsub: CALLBACK_TYPE | None = None
+
+        self.timers = TimerWheel(hass.loop)
+
+        # State changes seen by the coordinator, the boxes keep their own metrics
+        self.metrics = Metrics()
+
+        # (entity_id, time of the change) -> debounce shared by the waiting boxes
+        self._debounces: dict[tuple[str, float], SensorDebounce] = {}
+
+        # The box hierarchy, entity_id -> running box, entity_id of a child
+        # box -> its parents and box -> position in topological order
+        self._box_ids: dict[str, WaspBinarySensor] = {}
+        self._parents: dict[str, tuple[WaspBinarySensor, ...]] = {}
+        self._rank: dict[WaspBinarySensor, int] = {}
+
+        # Boxes with a pending state write, written once per loop iteration
+        self._dirty: dict[WaspBinarySensor, None] = {}
+        self._write_handle: asyncio.Handle | None = None
+
+        # Sensors of the areas, labels and groups the boxes use
+        self.membership = MembershipIndex(hass, self._async_members_changed)
+
+    @callback
+    def async_add_box(self, box: WaspBinarySensor) -> None:
+        """Start a box with the next startup batch."""
+        self._starting[box] = None
+
+        if self._start_handle is not None or self._start_unsub is not None:
+            return
+
+        # wait until full HASS Startup before starting event listeners
+        if self.hass.is_running:
+            self._start_handle = self.hass.loop.call_soon(self._async_start_boxes)
+        else:
+            self._start_unsub = self.hass.bus.async_listen_once(
+                EVENT_HOMEASSISTANT_START, self._async_hass_started
+            )
+
+    @callback
+    def _async_hass_started(self, _: Event) -> None:
+        self._start_unsub = None
+        self._async_start_boxes()
+
+    @callback
+    def _async_start_boxes(self) -> None:
+        """
+        Start all pending boxes in a single pass.
+
+        The state of every referenced sensor is read once, all boxes are
+        initialised from that snapshot, the shared subscription is installed
+        and the initial states are written in one batch.
+        """
+        self._start_handle = None
+        boxes, self._starting = list(self._starting), {}
+        if not boxes:
+            return
+
+        start = time.perf_counter()
+
+        for box in boxes:
+            box.async_resolve_members()
+
+        snapshot: dict[str, str | None] = {}
+        get_state = self.hass.states.get
+        for box in boxes:
+            for entity_id in box.sensor_config.sensor_roles:
+                if entity_id not in snapshot:
+                    state = get_state(entity_id)
+                    snapshot[entity_id] = state.state if state is not None else None
+
+        for box in boxes:
+            self._async_index(box, box.sensor_config.sensors)
+        self._async_rebuild_graph()
+
+        # Children are started before their parents, which read their occupancy
+        boxes.sort(key=lambda box: self._rank.get(box, 0))
+        box_ids = self._box_ids
+
+        def get_snapshot_state(entity_id: str) -> str | None:
+            if (child := box_ids.get(entity_id)) is not None:
+                return "on" if child.is_on else "off"
+            return snapshot.get(entity_id)
+
+        for box in boxes:
+            box.async_start(get_snapshot_state)
+            self._dirty[box] = None
+
+        self._async_refresh_subscription()
+        self._async_flush_writes()
+
+        _LOGGER.info(
+            "Started %s boxes watching %s sensors in %.1f ms",
+            len(boxes),
+            len(snapshot),
+            (time.perf_counter() - start) * 1000,
+        )
+
+    @callback
+    def async_update_box(self, box: WaspBinarySensor) -> None:
+        """Index the sensors of a box again after its configuration changed."""
+        self._async_unregister(box)
+        self._async_index(box, box.sensor_config.sensors)
+        self._async_rebuild_graph()
+        self._async_schedule_refresh()
+        self._async_retain_members()
+
+    @callback
+    def async_remove_box(self, box: WaspBinarySensor) -> None:
+        """Stop dispatching to a box and drop all its pending work."""
+        self._starting.pop(box, None)
+
+        # The parents see a removed child as unavailable
+        now = self.hass.loop.time()
+        for parent in self._parents.get(box.entity_id, ()):
+            parent.async_child_changed(box.entity_id, None, now)
+
+        self._async_unregister(box)
+        self._async_rebuild_graph()
+        self._async_schedule_refresh()
+        self.timers.cancel_owner(box)
+        self.async_cancel_debounces(box)
+        self._dirty.pop(box, None)
+        self._async_retain_members()
+
+    @callback
+    def _async_members_changed(self, keys: set[MemberKey]) -> None:
+        """Hand changed members of areas, labels and groups to the boxes using them."""
+        for box in list(self._boxes):
+            if not box.member_keys.isdisjoint(keys):
+                box.async_members_changed()
+
+    @callback
+    def _async_retain_members(self) -> None:
+        self.membership.async_retain(
+            key for box in self._boxes for key in box.member_keys
+        )
+
+    @callback
+    def _async_index(
+        self, box: WaspBinarySensor, sensors: Mapping[str, Iterable[str]]
+    ) -> None:
+        self._boxes[box] = sensors
+        for role, entity_ids in sensors.items():
+            if role in CHILD_ROLES:
+                continue
+            for entity_id in entity_ids:
+                self._index[entity_id] = self._index.get(entity_id, ()) + ((box, role),)
+
+    @callback
+    def _async_unregister(self, box: WaspBinarySensor) -> None:
+        if (sensors := self._boxes.pop(box, None)) is None:
+            return
+
+        for entity_ids in sensors.values():
+            for entity_id in entity_ids:
+                if entity_id not in self._index:
+                    continue
+                listeners = tuple(
+                    listener
+                    for listener in self._index[entity_id]
+                    if listener[0] is not box
+                )
+                if listeners:
+                    self._index[entity_id] = listeners
+                else:
+                    del self._index[entity_id]
+
+    @callback
+    def _async_rebuild_graph(self) -> None:
+        """Order the running boxes so every child comes before its parents."""
+        self._box_ids = {box.entity_id: box for box in self._boxes}
+        graph = {
+            box: [
+                self._box_ids[entity_id]
+                for entity_id in box.sensor_config.child_boxes
+                if entity_id in self._box_ids
+            ]
+            for box in self._boxes
+        }
+
+        while True:
+            try:
+                order = tuple(TopologicalSorter(graph).static_order())
+                break
+            except CycleError as err:
+                # Every box in the cycle is a child of the next one
+                cycle = err.args[1]
+                child, parent = cycle[0], cycle[1]
+                _LOGGER.error(
+                    "%s is a child of %s and of its own children, ignoring %s as a"
+                    " child of %s",
+                    child.entity_id,
+                    parent.entity_id,
+                    child.entity_id,
+                    parent.entity_id,
+                )
+                graph[parent] = [box for box in graph[parent] if box is not child]
+
+        self._rank = {box: rank for rank, box in enumerate(order)}
+        parents: dict[str, tuple[WaspBinarySensor, ...]] = {}
+        for parent, children in graph.items():
+            for child in children:
+                parents[child.entity_id] = parents.get(child.entity_id, ()) + (parent,)
+        self._parents = parents
+
+    @callback
+    def async_sensor_state(self, entity_id: str) -> str | None:
+        """Return the state of a sensor, or the occupancy of a running box."""
+        if (box := self._box_ids.get(entity_id)) is not None:
+            return "on" if box.is_on else "off"
+
+        state = self.hass.states.get(entity_id)
+        return state.state if state is not None else None
+
+    @callback
+    def _async_schedule_refresh(self) -> None:
+        """Resubscribe once per loop iteration, however many boxes (un)registered."""
+        if self._refresh_handle is None:
+            self._refresh_handle = self.hass.loop.call_soon(
+                self._async_refresh_subscription
+            )
+
+    @callback
+    def _async_refresh_subscription(self) -> None:
+        if self._refresh_handle is not None:
+            self._refresh_handle.cancel()
+            self._refresh_handle = None
+
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+
+        if self._index:
+            _LOGGER.debug(
+                "Tracking %s sensors for %s boxes", len(self._index), len(self._boxes)
+            )
+            self._unsub = async_track_state_change_event(
+                self.hass, list(self._index), self._async_state_changed
+            )
+
+    @callback
+    def _async_state_changed(self, event: Event[EventStateChangedData]) -> None:
+        """
+        Dispatch a state change to the boxes that have the sensor.
+
+        Attribute only updates, like battery level or signal strength, do not
+        reach the boxes. Transitions from or to an unavailable state are left
+        to the unavailable policy of each box. The latency of the coordinator
+        is counted from the event being fired until it is handed to the boxes.
+        """
+        metrics = self.metrics
+        metrics.events_received += 1
+
+        data = event.data
+        new_state = data["new_state"]
+        old_state = data["old_state"]
+
+        # The new state is None when the sensor is removed
+        state = new_state.state if new_state is not None else None
+        old = old_state.state if old_state is not None else None
+        if state == old:
+            metrics.events_filtered += 1
+            return
+
+        entity_id = data["entity_id"]
+        now = self.hass.loop.time()
+        # The event is stamped with the wall clock, the boxes run on the loop clock
+        fired = now - max(0.0, time.time() - event.time_fired_timestamp)
+        unusable = (
+            state is None
+            or state in UNAVAILABLE_STATES
+            or old is None
+            or old in UNAVAILABLE_STATES
+        )
+        for box, role in self._index.get(entity_id, ()):
+            if unusable and not box.accepts_sensor_state(entity_id, role, state):
+                box.metrics.events_filtered += 1
+                continue
+            box.async_dispatch_sensor_event(entity_id, old, state, role, now, fired)
+
+        metrics.latency.record(self.hass.loop.time() - fired)
+
+    @staticmethod
+    def _debounce_key(deadline: Deadline) -> tuple[str, float]:
+        """Return the change a deadline waits on, a restored one may not know it."""
+        since = deadline.since
+        return (deadline.key, since if since is not None else deadline.when)
+
+    @callback
+    def async_debounce(self, box: WaspBinarySensor, deadline: Deadline) -> None:
+        """Wait for a wasp sensor to settle, sharing the timer with other boxes."""
+        key = self._debounce_key(deadline)
+        if (debounce := self._debounces.get(key)) is None:
+            debounce = self._debounces[key] = SensorDebounce(deadline.key)
+
+        debounce.waiters[box] = deadline
+        if debounce.timer is None or deadline.when < debounce.timer.deadline:
+            self._schedule_debounce(key, debounce, deadline.when)
+
+    @callback
+    def _schedule_debounce(
+        self, key: tuple[str, float], debounce: SensorDebounce, when: float
+    ) -> None:
+        if debounce.timer is not None:
+            debounce.timer.cancel()
+        debounce.timer = self.timers.schedule_at(
+            when, self._async_debounce_settled, key, name=debounce.entity_id
+        )
+
+    @callback
+    def async_cancel_debounce(self, box: WaspBinarySensor, deadline: Deadline) -> None:
+        """Stop waiting for a wasp sensor, cancel the timer if nobody else waits."""
+        key = self._debounce_key(deadline)
+        if (debounce := self._debounces.get(key)) is None:
+            return
+
+        debounce.waiters.pop(box, None)
+        if not debounce.waiters:
+            if debounce.timer is not None:
+                debounce.timer.cancel()
+            del self._debounces[key]
+
+    @callback
+    def async_cancel_debounces(self, box: WaspBinarySensor) -> None:
+        """Stop waiting for all wasp sensors of a box."""
+        for debounce in list(self._debounces.values()):
+            if (deadline := debounce.waiters.get(box)) is not None:
+                self.async_cancel_debounce(box, deadline)
+
+    @callback
+    def _async_debounce_settled(self, key: tuple[str, float]) -> None:
+        debounce = self._debounces[key]
+        when = debounce.timer.deadline
+        debounce.timer = None
+
+        # Every box with this deadline settles on the same state, the others
+        # keep waiting on the same timer
+        settled = [
+            (box, deadline)
+            for box, deadline in debounce.waiters.items()
+            if deadline.when <= when
+        ]
+        for box, _ in settled:
+            del debounce.waiters[box]
+        if debounce.waiters:
+            self._schedule_debounce(
+                key,
+                debounce,
+                min(deadline.when for deadline in debounce.waiters.values()),
+            )
+        else:
+            del self._debounces[key]
+
+        state = self.hass.states.get(debounce.entity_id)
+        state = state.state if state is not None else None
+        for box, deadline in settled:
+            box.async_sensor_settled(deadline, state)
+
+    @callback
+    def async_schedule_write(self, box: WaspBinarySensor) -> None:
+        """Write the state of a box, at most once per loop iteration."""
+        self._dirty[box] = None
+        if self._write_handle is None:
+            self._write_handle = self.hass.loop.call_soon(self._async_flush_writes)
+
+    @callback
+    def _async_flush_writes(self) -> None:
+        if self._write_handle is not None:
+            self._write_handle.cancel()
+            self._write_handle = None
+        dirty, self._dirty = self._dirty, {}
+        if not self._parents:
+            for box in dirty:
+                box.async_write_state()
+            return
+
+        # Children are written first, a child handing its occupancy to its
+        # parents marks them dirty, they are written later in the same pass
+        rank = self._rank
+        sequence = itertools.count()
+        queue = [(rank.get(box, 0), next(sequence), box) for box in dirty]
+        heapq.heapify(queue)
+        now = self.hass.loop.time()
+        while queue:
+            box = heapq.heappop(queue)[2]
+            dirty.pop(box, None)
+            box.async_write_state()
+
+            if (parents := self._parents.get(box.entity_id)) is None:
+                continue
+            state = "on" if box.is_on else "off"
+            for parent in parents:
+                parent.async_child_changed(box.entity_id, state, now)
+            for parent in self._dirty:
+                if parent not in dirty:
+                    dirty[parent] = None
+                    heapq.heappush(queue, (rank.get(parent, 0), next(sequence), parent))
+            self._dirty.clear()
+
+        if self._write_handle is not None:
+            self._write_handle.cancel()
+            self._write_handle = None
+
+    @callback
+    def async_traces(
+        self, entity_ids: Iterable[str] | None = None
+    ) -> dict[str, list[dict[str, Any]]]:
+        """Return the trace of every box that has tracing enabled."""
+        wanted = set(entity_ids) if entity_ids is not None else None
+        return {
+            box.entity_id: trace
+            for box in self._boxes
+            if (wanted is None or box.entity_id in wanted)
+            and (trace := box.async_get_trace()) is not None
+        }
+
+    @callback
+    def async_metrics(self) -> dict[str, Any]:
+        """Return the coordinator metrics and the sum of the metrics of all boxes."""
+        return {
+            "coordinator": self.metrics.as_dict(),
+            "boxes": Metrics.total(box.metrics for box in self._boxes).as_dict(),
+            "tracked_sensors": len(self._index),
+            "boxes_running": len(self._boxes),
+            "pending_timers": len(self.timers),
+            "pending_debounces": len(self._debounces),
+        }
+
+    @callback
+    def async_pending_deadlines(self) -> dict[str, list[tuple[str, float]]]:
+        """Return the pending deadlines per box as name and seconds remaining."""
+        now = self.hass.loop.time()
+        pending = {
+            box.entity_id: [
+                (timer.name, round(timer.deadline - now, 3)) for timer in timers
+            ]
+            for box, timers in self.timers.pending_by_owner().items()
+            if box is not None
+        }
+        for debounce in self._debounces.values():
+            for box, deadline in debounce.waiters.items():
+                pending.setdefault(box.entity_id, []).append(
+                    (deadline.key, round(deadline.when - now, 3))
+                )
+
+        return pending
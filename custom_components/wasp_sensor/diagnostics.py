@@ -0,0 +1,33 @@
+"""Diagnostics support for Wasp Sensor."""
+
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .coordinator import async_get_coordinator
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator = async_get_coordinator(hass)
+    entry_data = hass.data[DOMAIN].get(entry.entry_id)
+
+    return {
+        "entry": {
+            "data": dict(entry.data),
+            "options": dict(entry.options),
+        },
+        "box": entry_data.metrics.as_dict() if entry_data is not None else None,
+        "dwell": (
+            entry_data.dwell.as_dict(time.time()) if entry_data is not None else None
+        ),
+        "domain": coordinator.async_metrics(),
+        "pending_deadlines": coordinator.async_pending_deadlines(),
+    }
@@ -0,0 +1,142 @@
+"""Occupancy and dwell time statistics of a box over a rolling window."""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Any
+
+BUCKET_SECONDS = 3600
+# The rolling window is the current hour and the 23 hours before it
+WINDOW_BUCKETS = 24
+
+# Fields of a bucket
+_INDEX = 0
+_OCCUPIED = 1
+_VISITS = 2
+_DWELLS = 3
+_DWELL_TOTAL = 4
+_DWELL_MAX = 5
+
+
+class DwellStats:
+    """
+    Occupied time, visits and dwell times of a box.
+
+    A visit counts in the hour it started, its dwell time in the hour it
+    ended and its occupied time in every hour it lasted.
+    """
+
+    __slots__ = ("occupied_since", "last_occupied", "_buckets")
+
+    def __init__(self) -> None:
+        # Start of the current visit, None while not occupied
+        self.occupied_since: float | None = None
+        # Start of the most recent visit
+        self.last_occupied: float | None = None
+        # [index, occupied, visits, dwells, dwell total, dwell max], oldest first
+        self._buckets: deque[list[float]] = deque()
+
+    def update(self, occupied: bool, now: float) -> None:
+        """Handle a change of the occupancy of the box."""
+        if occupied:
+            if self.occupied_since is None:
+                self.occupied_since = self.last_occupied = now
+                self._bucket(now)[_VISITS] += 1
+            return
+
+        if (since := self.occupied_since) is None:
+            return
+
+        self.occupied_since = None
+        first = max(int(since // BUCKET_SECONDS), self._first_index(now))
+        for index in range(first, int(now // BUCKET_SECONDS) + 1):
+            start = max(since, index * BUCKET_SECONDS)
+            end = min(now, (index + 1) * BUCKET_SECONDS)
+            if end > start:
+                self._bucket(index * BUCKET_SECONDS)[_OCCUPIED] += end - start
+
+        bucket = self._bucket(now)
+        dwell = now - since
+        bucket[_DWELLS] += 1
+        bucket[_DWELL_TOTAL] += dwell
+        bucket[_DWELL_MAX] = max(bucket[_DWELL_MAX], dwell)
+
+    def _first_index(self, now: float) -> int:
+        return int(now // BUCKET_SECONDS) - WINDOW_BUCKETS + 1
+
+    def _bucket(self, when: float) -> list[float]:
+        index = int(when // BUCKET_SECONDS)
+        buckets = self._buckets
+        if buckets and buckets[-1][_INDEX] == index:
+            return buckets[-1]
+
+        for bucket in reversed(buckets):
+            if bucket[_INDEX] == index:
+                return bucket
+            if bucket[_INDEX] < index:
+                break
+
+        bucket = [index, 0.0, 0, 0, 0.0, 0.0]
+        buckets.append(bucket)
+        if len(buckets) > 1 and buckets[-2][_INDEX] > index:
+            # Only when a visit that started hours ago ends
+            self._buckets = deque(sorted(buckets, key=lambda item: item[_INDEX]))
+
+        return bucket
+
+    def _window(self, now: float) -> list[list[float]]:
+        """Return the buckets in the window, dropping older ones."""
+        first = self._first_index(now)
+        buckets = self._buckets
+        while buckets and buckets[0][_INDEX] < first:
+            buckets.popleft()
+
+        return list(buckets)
+
+    def occupied_seconds(self, now: float) -> float:
+        """Return the time occupied in the window, including the current visit."""
+        total = sum(bucket[_OCCUPIED] for bucket in self._window(now))
+        if (since := self.occupied_since) is not None:
+            total += now - max(since, self._first_index(now) * BUCKET_SECONDS)
+
+        return total
+
+    def visits(self, now: float) -> int:
+        """Return the number of visits that started in the window."""
+        return int(sum(bucket[_VISITS] for bucket in self._window(now)))
+
+    def mean_dwell(self, now: float) -> float | None:
+        """Return the mean dwell time of the visits that ended in the window."""
+        window = self._window(now)
+        if not (dwells := sum(bucket[_DWELLS] for bucket in window)):
+            return None
+
+        return sum(bucket[_DWELL_TOTAL] for bucket in window) / dwells
+
+    def max_dwell(self, now: float) -> float | None:
+        """Return the longest dwell time of the visits that ended in the window."""
+        window = [bucket for bucket in self._window(now) if bucket[_DWELLS]]
+        if not window:
+            return None
+
+        return max(bucket[_DWELL_MAX] for bucket in window)
+
+    def as_dict(self, now: float | None = None) -> dict[str, Any]:
+        """Return the statistics to persist."""
+        buckets = self._window(now) if now is not None else list(self._buckets)
+        return {
+            "occupied_since": self.occupied_since,
+            "last_occupied": self.last_occupied,
+            "buckets": [list(bucket) for bucket in buckets],
+        }
+
+    def restore(self, data: dict[str, Any]) -> None:
+        """Restore the statistics persisted by as_dict."""
+        self.occupied_since = data.get("occupied_since")
+        self.last_occupied = data.get("last_occupied")
+        self._buckets = deque(
+            sorted(
+                (list(bucket) for bucket in data.get("buckets", ())),
+                key=lambda bucket: bucket[_INDEX],
+            )
+        )
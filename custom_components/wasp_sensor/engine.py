@@ -0,0 +1,605 @@
+"""Wasp in a Box state machine, turning timestamped sensor events into decisions."""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Mapping
+import time
+from typing import Any
+
+from .adaptive import AdaptiveDelay
+from .const import (
+    BOX_ROLES,
+    CHILD_ROLES,
+    CONF_CHILD_BOXES,
+    SENSOR_ROLE_ACTIVE_STATE,
+    UNAVAILABLE_POLICY_ACTIVE,
+    UNAVAILABLE_POLICY_IGNORE,
+    UNAVAILABLE_STATES,
+    WASP_ROLES,
+)
+from .models import BoxConfig
+
+# Key of the box timeout deadline, sensor change delays are keyed by entity_id
+TIMEOUT = "timeout"
+
+# Decision reasons
+REASON_BOX_OPENED = "box_opened"
+REASON_BOX_CLOSED = "box_closed"
+REASON_TIMEOUT_STARTED = "timeout_started"
+REASON_DEBOUNCE = "debounce"
+REASON_WASP_SEEN = "wasp_seen"
+REASON_WASP_GONE = "wasp_gone"
+REASON_OCCUPIED = "occupied"
+REASON_TIMEOUT_EXPIRED = "timeout_expired"
+REASON_RETRACTED = "retracted"
+REASON_STALE = "stale"
+REASON_UNCHANGED = "unchanged"
+
+# Confidence of an occupied box
+CONFIDENCE_TENTATIVE = "tentative"
+CONFIDENCE_CONFIRMED = "confirmed"
+
+# Roles that count as a seen wasp
+_WASP_EVIDENCE_ROLES = WASP_ROLES + CHILD_ROLES
+
+
+class Deadline:
+    """A deadline the engine wants to be called back on."""
+
+    __slots__ = ("key", "when", "generation", "role", "since")
+
+    def __init__(
+        self,
+        key: str,
+        when: float,
+        generation: int,
+        role: str | None,
+        since: float | None = None,
+    ):
+        self.key = key
+        self.when = when
+        self.generation = generation
+        self.role = role
+        # Clock time of the event the deadline waits on, if known
+        self.since = since
+
+    def __repr__(self) -> str:
+        return f"<Deadline {self.key} at {self.when:.3f} #{self.generation}>"
+
+
+class Decision:
+    """The outcome of an event for the adapter to act upon."""
+
+    __slots__ = ("reason", "write", "schedule", "cancel")
+
+    def __init__(
+        self,
+        reason: str,
+        write: bool,
+        schedule: Deadline | None = None,
+        cancel: str | None = None,
+    ):
+        self.reason = reason
+        # Whether the state should be written
+        self.write = write
+        # Deadline to start, after the pending deadline to cancel is cancelled
+        self.schedule = schedule
+        # Key of a pending deadline that is not needed anymore
+        self.cancel = cancel
+
+    def __repr__(self) -> str:
+        return (
+            f"<Decision {self.reason} write={self.write} "
+            f"schedule={self.schedule} cancel={self.cancel}>"
+        )
+
+
+_STALE = Decision(REASON_STALE, False)
+_UNCHANGED = Decision(REASON_UNCHANGED, False)
+
+
+class WaspBoxEngine:
+    """
+    Wasp in a Box occupancy logic for a single box.
+
+    If the box is closed and then a wasp is seen, the wasp is in the box. If the
+    box is opened the wasp is not in the box. If the box closes while a wasp is
+    seen, the wasp is in the box when it is still closed and a wasp is still
+    seen after the timeout.
+
+    In optimistic mode the wasp is tentatively in the box as soon as the box
+    closes while a wasp is seen. The timeout confirms it, or it is retracted
+    when no wasp is seen anymore before the timeout.
+    """
+
+    __slots__ = (
+        "config",
+        "clock",
+        "wasp_in_box",
+        "box_closed",
+        "wasp_seen",
+        "tentative",
+        "_sensor_active",
+        "_thresholded",
+        "_box_open_count",
+        "_wasp_seen_count",
+        "_generation",
+        "_timeout",
+        "_debounce",
+        "_last_event",
+        "_adaptive",
+    )
+
+    def __init__(
+        self, config: BoxConfig, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.config = config
+        self.clock = clock
+
+        self.wasp_in_box = False
+        self.box_closed = False
+        self.wasp_seen = False
+        # Whether wasp_in_box still waits for the timeout to confirm it
+        self.tentative = False
+
+        # Live state of every sensor per role and the number of active sensors,
+        # so a single event can update box_closed and wasp_seen in constant time
+        self._sensor_active: dict[tuple[str, str], bool] = {}
+        self._box_open_count = 0
+        self._wasp_seen_count = 0
+
+        # Last on or off state of every sensor with a threshold rule per role
+        self._thresholded: dict[tuple[str, str], str | None] = {}
+
+        # A newer event replaces a pending deadline, the generation token
+        # discards any decision that was already superseded
+        self._generation = 0
+        self._timeout: Deadline | None = None
+        self._debounce: dict[str, Deadline] = {}
+
+        # Clock time of the last event per sensor
+        self._last_event: dict[str, float] = {}
+
+        # Flap statistics per wasp sensor, with an adaptive sensor change delay
+        self._adaptive: dict[str, AdaptiveDelay] = {}
+
+    def rescan(self, get_state: Callable[[str], str | None]) -> None:
+        """Rebuild the state of all sensors, only needed at (re)start."""
+        self._box_open_count = self._rescan_roles(BOX_ROLES, get_state)
+        self._wasp_seen_count = self._rescan_roles(_WASP_EVIDENCE_ROLES, get_state)
+
+        self.box_closed = self._box_open_count == 0
+        self.wasp_seen = self._wasp_seen_count > 0
+        if not self.box_closed:
+            self.wasp_in_box = False
+            self.tentative = False
+
+    def _rescan_roles(
+        self, roles: tuple[str, ...], get_state: Callable[[str], str | None]
+    ) -> int:
+        count = 0
+        sensors = self.config.sensors
+        for role in roles:
+            active_state = SENSOR_ROLE_ACTIVE_STATE[role]
+            for entity_id in sensors[role]:
+                state = get_state(entity_id)
+                if entity_id in self.config.thresholds:
+                    state = self._thresholded[(role, entity_id)] = self._threshold(
+                        role, entity_id, state
+                    )
+                if state is None or state in UNAVAILABLE_STATES:
+                    active = self._unavailable_active(role, entity_id)
+                else:
+                    active = state == active_state
+                self._sensor_active[(role, entity_id)] = active
+                count += active
+
+        return count
+
+    def _threshold(self, role: str, entity_id: str, state: str | None) -> str | None:
+        """Return on or off for the numeric state of a sensor with a threshold."""
+        try:
+            value = float(state)
+        except (TypeError, ValueError):
+            # Unavailable, unknown or not numeric
+            return state
+
+        was_on = self._thresholded.get((role, entity_id)) == "on"
+        return "on" if self.config.thresholds[entity_id].is_on(value, was_on) else "off"
+
+    def _threshold_changed(
+        self, role: str, entity_id: str, state: str | None
+    ) -> tuple[bool, str | None]:
+        """Apply the threshold rule, return whether on or off changed."""
+        key = (role, entity_id)
+        state = self._threshold(role, entity_id, state)
+        if key in self._thresholded and self._thresholded[key] == state:
+            return False, state
+
+        self._thresholded[key] = state
+        return True, state
+
+    def _unavailable_active(self, role: str, entity_id: str) -> bool:
+        """Return whether a sensor without a usable state counts as active."""
+        policy = self.config.unavailable_policy
+        if policy == UNAVAILABLE_POLICY_IGNORE:
+            # Keep the last known state
+            return self._sensor_active.get((role, entity_id), False)
+
+        return policy == UNAVAILABLE_POLICY_ACTIVE
+
+    def accepts(self, entity_id: str, role: str, state: str | None) -> bool:
+        """
+        Return whether a transition from or to an unusable state is an event.
+
+        With the ignore policy a sensor becoming unavailable is not an event,
+        and neither is it becoming available again in its last known state.
+        """
+        if self.config.unavailable_policy != UNAVAILABLE_POLICY_IGNORE:
+            return True
+
+        if entity_id in self.config.thresholds:
+            state = self._threshold(role, entity_id, state)
+
+        if state is None or state in UNAVAILABLE_STATES:
+            return False
+
+        return (state == SENSOR_ROLE_ACTIVE_STATE[role]) != self._sensor_active.get(
+            (role, entity_id), False
+        )
+
+    def _update_sensor(self, role: str, entity_id: str, state: str | None) -> bool:
+        """Update the active sensor counters for a single sensor."""
+        if state is None or state in UNAVAILABLE_STATES:
+            active = self._unavailable_active(role, entity_id)
+        else:
+            active = state == SENSOR_ROLE_ACTIVE_STATE[role]
+        if self._sensor_active.get((role, entity_id), False) != active:
+            self._sensor_active[(role, entity_id)] = active
+            delta = 1 if active else -1
+            if role in BOX_ROLES:
+                self._box_open_count += delta
+                self.box_closed = self._box_open_count == 0
+            else:
+                self._wasp_seen_count += delta
+                self.wasp_seen = self._wasp_seen_count > 0
+
+        return active
+
+    @property
+    def confidence(self) -> str | None:
+        """Return whether an occupied box is tentative or confirmed."""
+        if not self.wasp_in_box:
+            return None
+
+        return CONFIDENCE_TENTATIVE if self.tentative else CONFIDENCE_CONFIRMED
+
+    def sensor_change_delays(self) -> dict[str, float]:
+        """Return the learned sensor change delay of every wasp sensor."""
+        config = self.config
+        if not config.adaptive_delay:
+            return {}
+
+        now = self.clock()
+        delays = {}
+        for role in WASP_ROLES:
+            for entity_id in config.sensors[role]:
+                if (adaptive := self._adaptive.get(entity_id)) is None:
+                    delay = config.sensor_change_delay
+                else:
+                    delay = adaptive.delay(
+                        now, config.min_sensor_change_delay, config.sensor_change_delay
+                    )
+                delays[entity_id] = round(delay, 3)
+
+        return delays
+
+    @property
+    def pending(self) -> bool:
+        """Return whether any deadline is pending."""
+        return self._timeout is not None or bool(self._debounce)
+
+    def pending_deadlines(self) -> list[Deadline]:
+        """Return the pending deadlines."""
+        deadlines = list(self._debounce.values())
+        if self._timeout is not None:
+            deadlines.append(self._timeout)
+
+        return deadlines
+
+    def box_sensor_changed(
+        self, entity_id: str, role: str, state: str | None, now: float | None = None
+    ) -> Decision:
+        """Handle a state change of a box sensor."""
+        if entity_id in self.config.thresholds:
+            changed, state = self._threshold_changed(role, entity_id, state)
+            if not changed:
+                return _UNCHANGED
+
+        if now is None:
+            now = self.clock()
+        self._last_event[entity_id] = now
+
+        self._update_sensor(role, entity_id, state)
+        self.wasp_in_box = False
+        self.tentative = False
+
+        # Any box change supersedes a timeout that is still pending
+        cancel = TIMEOUT if self._timeout is not None else None
+        self._timeout = None
+
+        if not self.box_closed:
+            return Decision(REASON_BOX_OPENED, True, cancel=cancel)
+
+        if not self.wasp_seen:
+            return Decision(REASON_BOX_CLOSED, True, cancel=cancel)
+
+        self._generation += 1
+        deadline = self._timeout = Deadline(
+            TIMEOUT, now + self.config.timeout, self._generation, None, now
+        )
+        if self.config.optimistic:
+            self.wasp_in_box = self.tentative = True
+
+        return Decision(REASON_TIMEOUT_STARTED, True, deadline, cancel)
+
+    def timeout_elapsed(self, generation: int) -> Decision:
+        """Handle the box timeout deadline."""
+        if self._timeout is None or self._timeout.generation != generation:
+            return _STALE
+
+        self._timeout = None
+
+        if self.box_closed and self.wasp_seen:
+            self.wasp_in_box = True
+            self.tentative = False
+            return Decision(REASON_OCCUPIED, True)
+
+        if self.tentative:
+            self.wasp_in_box = self.tentative = False
+            return Decision(REASON_RETRACTED, True)
+
+        return Decision(REASON_TIMEOUT_EXPIRED, False)
+
+    def wasp_sensor_changed(
+        self,
+        entity_id: str,
+        role: str,
+        now: float | None = None,
+        state: str | None = None,
+    ) -> Decision:
+        """
+        Handle a state change of a wasp sensor.
+
+        Some sensors send 'on' right before 'off', the sensor is only evaluated
+        after the sensor change delay. A newer change replaces the pending one.
+        The state is only needed for sensors with a threshold rule, a new value
+        that does not cross the threshold is not a change.
+        """
+        if entity_id in self.config.thresholds:
+            changed, state = self._threshold_changed(role, entity_id, state)
+            if not changed:
+                return _UNCHANGED
+
+        if now is None:
+            now = self.clock()
+        self._last_event[entity_id] = now
+
+        cancel = entity_id if entity_id in self._debounce else None
+
+        delay = self.config.sensor_change_delay
+        if self.config.adaptive_delay:
+            if (adaptive := self._adaptive.get(entity_id)) is None:
+                adaptive = self._adaptive[entity_id] = AdaptiveDelay()
+            if state is not None and state not in UNAVAILABLE_STATES:
+                adaptive.record(now, state == SENSOR_ROLE_ACTIVE_STATE[role], delay)
+            delay = adaptive.delay(now, self.config.min_sensor_change_delay, delay)
+
+        self._generation += 1
+        deadline = self._debounce[entity_id] = Deadline(
+            entity_id, now + delay, self._generation, role, now
+        )
+
+        return Decision(REASON_DEBOUNCE, False, deadline, cancel)
+
+    def wasp_sensor_settled(
+        self, entity_id: str, role: str, state: str | None, generation: int
+    ) -> Decision:
+        """Handle the sensor change delay deadline of a wasp sensor."""
+        pending = self._debounce.get(entity_id)
+        if pending is None or pending.generation != generation:
+            return _STALE
+
+        del self._debounce[entity_id]
+
+        if entity_id in self.config.thresholds:
+            state = self._thresholded[(role, entity_id)] = self._threshold(
+                role, entity_id, state
+            )
+
+        if self._update_sensor(role, entity_id, state):
+            return self._wasp_seen()
+
+        return self._wasp_gone()
+
+    def child_box_changed(
+        self, entity_id: str, state: str | None, now: float | None = None
+    ) -> Decision:
+        """
+        Handle a change of the occupancy of a child box.
+
+        An occupied child box is a seen wasp, without a sensor change delay as
+        the child box already applied its own.
+        """
+        role = CONF_CHILD_BOXES
+        was_active = self._sensor_active.get((role, entity_id), False)
+        if self._update_sensor(role, entity_id, state) == was_active:
+            return _UNCHANGED
+
+        self._last_event[entity_id] = self.clock() if now is None else now
+        if not was_active:
+            return self._wasp_seen()
+
+        return self._wasp_gone()
+
+    def _wasp_seen(self) -> Decision:
+        if self.box_closed:
+            # A wasp seen in a closed box confirms a tentative wasp as well
+            self.wasp_in_box = True
+            self.tentative = False
+
+        return Decision(REASON_WASP_SEEN, True)
+
+    def _wasp_gone(self) -> Decision:
+        if not self.tentative or self.wasp_seen:
+            return Decision(REASON_WASP_GONE, True)
+
+        # The wasp left before the timeout confirmed it was in the box
+        self.wasp_in_box = self.tentative = False
+        cancel = TIMEOUT if self._timeout is not None else None
+        self._timeout = None
+
+        return Decision(REASON_RETRACTED, True, cancel=cancel)
+
+    def deadline_reached(
+        self, deadline: Deadline, state: str | None = None
+    ) -> Decision:
+        """Handle a deadline, state is the current state of a wasp sensor."""
+        if deadline.key == TIMEOUT:
+            return self.timeout_elapsed(deadline.generation)
+
+        return self.wasp_sensor_settled(
+            deadline.key, deadline.role, state, deadline.generation
+        )
+
+    def reconfigure(self, config: BoxConfig) -> list[Deadline]:
+        """
+        Use a changed configuration, rescan before handling new events.
+
+        The occupancy and the pending timeout are kept, a changed timeout or
+        sensor change delay applies to the next deadline. Sensors with a
+        changed threshold rule are evaluated again. Returns the debounces of
+        the dropped sensors to cancel.
+        """
+        thresholds = self.config.thresholds
+        dropped = self.update_sensors(config)
+        for key in [
+            key
+            for key in self._thresholded
+            if thresholds.get(key[1]) != config.thresholds.get(key[1])
+        ]:
+            del self._thresholded[key]
+
+        return dropped
+
+    def update_sensors(self, config: BoxConfig) -> list[Deadline]:
+        """
+        Use a configuration with other sensors, rescan before handling new events.
+
+        Unlike reconfigure, the state and deadlines of the sensors that remain
+        are kept. Returns the debounces of the dropped sensors to cancel.
+        """
+        self.config = config
+        sensor_roles = config.sensor_roles
+
+        for states in (self._sensor_active, self._thresholded):
+            for key in [
+                key for key in states if key[0] not in sensor_roles.get(key[1], ())
+            ]:
+                del states[key]
+
+        dropped = [
+            deadline
+            for deadline in self._debounce.values()
+            if deadline.role not in sensor_roles.get(deadline.key, ())
+        ]
+        for deadline in dropped:
+            del self._debounce[deadline.key]
+        for events in (self._last_event, self._adaptive):
+            for entity_id in [
+                entity_id for entity_id in events if entity_id not in sensor_roles
+            ]:
+                del events[entity_id]
+
+        return dropped
+
+    def reset_pending(self) -> None:
+        """Forget all pending deadlines."""
+        self._timeout = None
+        self._debounce.clear()
+
+    def snapshot(self, wall_offset: float) -> dict[str, Any]:
+        """
+        Return the full state to persist.
+
+        Deadlines and timestamps are stored as wall clock time, wall_offset is
+        the wall clock time minus the engine clock time.
+        """
+        return {
+            "wasp_in_box": self.wasp_in_box,
+            "box_closed": self.box_closed,
+            "wasp_seen": self.wasp_seen,
+            "tentative": self.tentative,
+            "generation": self._generation,
+            "deadlines": [
+                {
+                    "key": deadline.key,
+                    "deadline": deadline.when + wall_offset,
+                    "generation": deadline.generation,
+                    "role": deadline.role,
+                    "since": (
+                        deadline.since + wall_offset
+                        if deadline.since is not None
+                        else None
+                    ),
+                }
+                for deadline in self.pending_deadlines()
+            ],
+            "last_event": {
+                entity_id: when + wall_offset
+                for entity_id, when in self._last_event.items()
+            },
+            "adaptive": {
+                entity_id: adaptive.as_dict(wall_offset)
+                for entity_id, adaptive in self._adaptive.items()
+            },
+        }
+
+    def restore(self, data: Mapping[str, Any], wall_offset: float) -> None:
+        """
+        Restore the state persisted by snapshot.
+
+        Deadlines are restored as pending, a deadline that passed while not
+        running is due immediately. The areas, labels and groups of the box are
+        not resolved yet, update_sensors drops the state of sensors that are
+        no longer configured once they are.
+        """
+        self.wasp_in_box = data.get("wasp_in_box", False)
+        self.box_closed = data.get("box_closed", False)
+        self.wasp_seen = data.get("wasp_seen", False)
+        self.tentative = data.get("tentative", False)
+        self._generation = max(self._generation, data.get("generation", 0))
+
+        self.reset_pending()
+        for item in data.get("deadlines", ()):
+            since = item.get("since")
+            deadline = Deadline(
+                item["key"],
+                item["deadline"] - wall_offset,
+                item["generation"],
+                item.get("role"),
+                since - wall_offset if since is not None else None,
+            )
+            if deadline.key == TIMEOUT:
+                self._timeout = deadline
+            else:
+                self._debounce[deadline.key] = deadline
+
+        self._last_event = {
+            entity_id: when - wall_offset
+            for entity_id, when in data.get("last_event", {}).items()
+        }
+        self._adaptive = {
+            entity_id: AdaptiveDelay.from_dict(adaptive, wall_offset)
+            for entity_id, adaptive in data.get("adaptive", {}).items()
+        }
@@ -0,0 +1,368 @@
+"""Areas, labels and groups resolved into the sensors of the boxes."""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+import dataclasses
+import logging
+
+from homeassistant.components.binary_sensor import BinarySensorDeviceClass
+from homeassistant.const import ATTR_ENTITY_ID
+from homeassistant.core import (
+    CALLBACK_TYPE,
+    Event,
+    EventStateChangedData,
+    HomeAssistant,
+    callback,
+    split_entity_id,
+)
+from homeassistant.helpers import (
+    area_registry as ar,
+    device_registry as dr,
+    entity_registry as er,
+    label_registry as lr,
+)
+from homeassistant.helpers.event import async_track_state_change_event
+
+from .const import (
+    BINARY_SENSOR,
+    CHILD_ROLES,
+    CONF_BOX_SENSORS,
+    CONF_WASP_SENSORS,
+    DOMAIN,
+)
+from .models import BoxConfig
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+KIND_AREA = "area"
+KIND_LABEL = "label"
+KIND_GROUP = "group"
+
+# The binary sensors of an area or label that are wasp or box sensors
+ROLE_DEVICE_CLASSES = {
+    CONF_WASP_SENSORS: frozenset(
+        {
+            BinarySensorDeviceClass.MOTION,
+            BinarySensorDeviceClass.OCCUPANCY,
+            BinarySensorDeviceClass.PRESENCE,
+        }
+    ),
+    CONF_BOX_SENSORS: frozenset(
+        {
+            BinarySensorDeviceClass.DOOR,
+            BinarySensorDeviceClass.GARAGE_DOOR,
+            BinarySensorDeviceClass.OPENING,
+            BinarySensorDeviceClass.WINDOW,
+        }
+    ),
+}
+
+# (kind, area/label id or group entity_id, role)
+MemberKey = tuple[str, str, str | None]
+
+
+class MembershipIndex:
+    """
+    Cache of the members of the areas, labels and groups used by the boxes.
+
+    Members are resolved once and kept up to date from the entity, device,
+    area and label registry events and from the state of the groups. Only the
+    entities a registry event is about are evaluated again.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        on_change: Callable[[set[MemberKey]], None],
+    ) -> None:
+        self.hass = hass
+        self._on_change = on_change
+        self._members: dict[MemberKey, frozenset[str]] = {}
+
+        # Groups met while resolving, including nested groups
+        self._groups: set[str] = set()
+
+        self._unsubs: list[CALLBACK_TYPE] = []
+        self._group_unsub: CALLBACK_TYPE | None = None
+
+    @callback
+    def async_expand(self, config: BoxConfig) -> tuple[BoxConfig, frozenset[MemberKey]]:
+        """
+        Return the configuration with its areas, labels and groups resolved.
+
+        Also returns the keys the resolved configuration depends on.
+        """
+        keys: set[MemberKey] = set()
+        roles: dict[str, frozenset[str]] = {}
+
+        for role, entity_ids in config.sensors.items():
+            if role in CHILD_ROLES:
+                continue
+            expanded: set[str] = set()
+            for entity_id in entity_ids:
+                if self._is_group(entity_id):
+                    key = (KIND_GROUP, entity_id, None)
+                    keys.add(key)
+                    expanded |= self._async_get(key)
+                else:
+                    expanded.add(entity_id)
+            roles[role] = frozenset(expanded)
+
+        for role, kind, ids in (
+            (CONF_WASP_SENSORS, KIND_AREA, config.wasp_areas),
+            (CONF_WASP_SENSORS, KIND_LABEL, config.wasp_labels),
+            (CONF_BOX_SENSORS, KIND_AREA, config.box_areas),
+            (CONF_BOX_SENSORS, KIND_LABEL, config.box_labels),
+        ):
+            for item_id in ids:
+                key = (kind, item_id, role)
+                keys.add(key)
+                roles[role] = roles[role] | self._async_get(key)
+
+        if not keys:
+            return config, frozenset()
+
+        return dataclasses.replace(config, **roles), frozenset(keys)
+
+    @callback
+    def async_retain(self, keys: Iterable[MemberKey]) -> None:
+        """Forget the members of everything not used anymore."""
+        keys = set(keys)
+        for key in [key for key in self._members if key not in keys]:
+            del self._members[key]
+
+        if not any(key[0] == KIND_GROUP for key in self._members):
+            self._groups.clear()
+            self._async_track_groups()
+
+        if not self._members:
+            self.async_shutdown()
+
+    @callback
+    def async_shutdown(self) -> None:
+        """Stop listening to registry and group changes."""
+        while self._unsubs:
+            self._unsubs.pop()()
+        if self._group_unsub is not None:
+            self._group_unsub()
+            self._group_unsub = None
+
+    def _is_group(self, entity_id: str) -> bool:
+        if entity_id.startswith(f"{KIND_GROUP}."):
+            return True
+
+        entry = er.async_get(self.hass).async_get(entity_id)
+        return entry is not None and entry.platform == KIND_GROUP
+
+    @callback
+    def _async_get(self, key: MemberKey) -> frozenset[str]:
+        if (members := self._members.get(key)) is None:
+            if not self._unsubs:
+                self._async_listen()
+            members = self._members[key] = self._resolve(key)
+            if key[0] == KIND_GROUP:
+                self._async_track_groups()
+
+        return members
+
+    def _resolve(self, key: MemberKey) -> frozenset[str]:
+        kind, item_id, role = key
+        if kind == KIND_GROUP:
+            return frozenset(self._resolve_group(item_id, set()))
+
+        ent_reg = er.async_get(self.hass)
+        dev_reg = dr.async_get(self.hass)
+        if kind == KIND_AREA:
+            entries = er.async_entries_for_area(ent_reg, item_id)
+            devices = dr.async_entries_for_area(dev_reg, item_id)
+        else:
+            entries = er.async_entries_for_label(ent_reg, item_id)
+            devices = dr.async_entries_for_label(dev_reg, item_id)
+
+        candidates = {entry.entity_id: entry for entry in entries}
+        for device in devices:
+            for entry in er.async_entries_for_device(ent_reg, device.id):
+                candidates.setdefault(entry.entity_id, entry)
+
+        return frozenset(
+            entity_id
+            for entity_id, entry in candidates.items()
+            if self._matches(entry, key)
+        )
+
+    def _resolve_group(self, entity_id: str, seen: set[str]) -> set[str]:
+        seen.add(entity_id)
+        self._groups.add(entity_id)
+
+        members: set[str] = set()
+        if (state := self.hass.states.get(entity_id)) is None:
+            return members
+
+        for member in state.attributes.get(ATTR_ENTITY_ID, ()):
+            if member in seen:
+                continue
+            if self._is_group(member):
+                members |= self._resolve_group(member, seen)
+            elif split_entity_id(member)[0] == BINARY_SENSOR:
+                members.add(member)
+            else:
+                # Numeric sensors need a threshold rule, which a group can not give
+                _LOGGER.warning(
+                    "Skipping %s of %s, only binary sensors of a group are used",
+                    member,
+                    entity_id,
+                )
+
+        return members
+
+    def _matches(self, entry: er.RegistryEntry, key: MemberKey) -> bool:
+        """Return whether an entity is a member of an area or label."""
+        kind, item_id, role = key
+        if (
+            entry.disabled_by is not None
+            or entry.platform == DOMAIN
+            or entry.domain != "binary_sensor"
+            or (entry.device_class or entry.original_device_class)
+            not in ROLE_DEVICE_CLASSES[role]
+        ):
+            return False
+
+        device = None
+        if entry.device_id is not None:
+            device = dr.async_get(self.hass).async_get(entry.device_id)
+
+        if kind == KIND_AREA:
+            if entry.area_id is not None:
+                return entry.area_id == item_id
+            return device is not None and device.area_id == item_id
+
+        return item_id in entry.labels or (
+            device is not None and item_id in device.labels
+        )
+
+    @callback
+    def _async_listen(self) -> None:
+        bus = self.hass.bus
+        self._unsubs = [
+            bus.async_listen(
+                er.EVENT_ENTITY_REGISTRY_UPDATED, self._async_entity_registry_updated
+            ),
+            bus.async_listen(
+                dr.EVENT_DEVICE_REGISTRY_UPDATED, self._async_device_registry_updated
+            ),
+            bus.async_listen(
+                ar.EVENT_AREA_REGISTRY_UPDATED, self._async_area_registry_updated
+            ),
+            bus.async_listen(
+                lr.EVENT_LABEL_REGISTRY_UPDATED, self._async_label_registry_updated
+            ),
+        ]
+
+    @callback
+    def _async_track_groups(self) -> None:
+        if self._group_unsub is not None:
+            self._group_unsub()
+            self._group_unsub = None
+
+        if self._groups:
+            self._group_unsub = async_track_state_change_event(
+                self.hass, list(self._groups), self._async_group_changed
+            )
+
+    @callback
+    def _async_update_entities(self, entity_ids: Iterable[str]) -> None:
+        """Evaluate the membership of some entities of all areas and labels."""
+        ent_reg = er.async_get(self.hass)
+        changed: set[MemberKey] = set()
+        for entity_id in entity_ids:
+            entry = ent_reg.async_get(entity_id)
+            for key, members in self._members.items():
+                if key[0] == KIND_GROUP:
+                    continue
+                member = entry is not None and self._matches(entry, key)
+                if member != (entity_id in members):
+                    self._members[key] = (
+                        members | {entity_id} if member else members - {entity_id}
+                    )
+                    changed.add(key)
+
+        self._async_notify(changed)
+
+    @callback
+    def _async_resolve_again(self, keys: Iterable[MemberKey]) -> None:
+        changed: set[MemberKey] = set()
+        for key in keys:
+            members = self._resolve(key)
+            if members != self._members[key]:
+                self._members[key] = members
+                changed.add(key)
+
+        self._async_notify(changed)
+
+    @callback
+    def _async_notify(self, changed: set[MemberKey]) -> None:
+        if changed:
+            _LOGGER.debug("Members changed of %s", changed)
+            self._on_change(changed)
+
+    @callback
+    def _async_entity_registry_updated(
+        self, event: Event[er.EventEntityRegistryUpdatedData]
+    ) -> None:
+        entity_ids = [event.data["entity_id"]]
+        if (old_entity_id := event.data.get("old_entity_id")) is not None:
+            entity_ids.append(old_entity_id)
+        self._async_update_entities(entity_ids)
+
+    @callback
+    def _async_device_registry_updated(
+        self, event: Event[dr.EventDeviceRegistryUpdatedData]
+    ) -> None:
+        if event.data["action"] != "update":
+            # Entities of a new or removed device have their own events
+            return
+
+        changes = event.data.get("changes", {})
+        if "area_id" not in changes and "labels" not in changes:
+            return
+
+        ent_reg = er.async_get(self.hass)
+        self._async_update_entities(
+            entry.entity_id
+            for entry in er.async_entries_for_device(
+                ent_reg, event.data["device_id"], include_disabled_entities=True
+            )
+        )
+
+    @callback
+    def _async_area_registry_updated(
+        self, event: Event[ar.EventAreaRegistryUpdatedData]
+    ) -> None:
+        area_id = event.data["area_id"]
+        self._async_resolve_again(
+            [key for key in self._members if key[:2] == (KIND_AREA, area_id)]
+        )
+
+    @callback
+    def _async_label_registry_updated(
+        self, event: Event[lr.EventLabelRegistryUpdatedData]
+    ) -> None:
+        label_id = event.data["label_id"]
+        self._async_resolve_again(
+            [key for key in self._members if key[:2] == (KIND_LABEL, label_id)]
+        )
+
+    @callback
+    def _async_group_changed(self, event: Event[EventStateChangedData]) -> None:
+        old_state = event.data["old_state"]
+        new_state = event.data["new_state"]
+        old = old_state.attributes.get(ATTR_ENTITY_ID) if old_state else None
+        new = new_state.attributes.get(ATTR_ENTITY_ID) if new_state else None
+        if old == new:
+            # Only the state of the group changed
+            return
+
+        keys = [key for key in self._members if key[0] == KIND_GROUP]
+        self._async_resolve_again(keys)
+        self._async_track_groups()
@@ -0,0 +1,137 @@
+"""Counters and latency histograms for Wasp Sensor."""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+import math
+from typing import Any
+
+# The first bucket holds everything up to 1 µs, every next bucket is 2 ** (1/4),
+# about 19%, wider than the previous one, the last bucket everything above
+# about 16 seconds
+_BUCKET_BASE = 1e-6
+_BUCKETS_PER_OCTAVE = 4
+_BUCKETS = 24 * _BUCKETS_PER_OCTAVE
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+class LatencyHistogram:
+    """Log-scale histogram of durations in seconds."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (_BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        """Count a duration."""
+        if seconds <= _BUCKET_BASE:
+            index = 0
+        else:
+            index = min(
+                _BUCKETS,
+                math.ceil(math.log2(seconds / _BUCKET_BASE) * _BUCKETS_PER_OCTAVE),
+            )
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: LatencyHistogram) -> None:
+        """Add the counts of another histogram."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction: float) -> float | None:
+        """Return the upper bound of the bucket holding the percentile."""
+        if not self.count:
+            return None
+
+        rank = max(1, math.ceil(fraction * self.count))
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                break
+
+        return min(self.max, _BUCKET_BASE * 2 ** (index / _BUCKETS_PER_OCTAVE))
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return a summary in milliseconds."""
+        summary: dict[str, Any] = {
+            "count": self.count,
+            "mean_ms": _ms(self.total / self.count) if self.count else None,
+            "max_ms": _ms(self.max) if self.count else None,
+        }
+        for fraction in PERCENTILES:
+            value = self.percentile(fraction)
+            summary[f"p{round(fraction * 100)}_ms"] = (
+                _ms(value) if value is not None else None
+            )
+
+        return summary
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000.0, 4)
+
+
+class Metrics:
+    """
+    Counters and the latency of a box or the coordinator.
+
+    The latency of a box runs from a state change event being fired until its
+    decision is written, including any sensor change delay. The latency of
+    the coordinator runs until the event is handed to the boxes.
+    """
+
+    COUNTERS = (
+        "events_received",
+        "events_filtered",
+        "debounces_cancelled",
+        "timeouts_started",
+        "timeouts_completed",
+        "timeouts_aborted",
+        "writes_issued",
+        "writes_suppressed",
+    )
+
+    __slots__ = COUNTERS + ("latency",)
+
+    def __init__(self) -> None:
+        self.events_received = 0
+        self.events_filtered = 0
+        self.debounces_cancelled = 0
+        self.timeouts_started = 0
+        self.timeouts_completed = 0
+        self.timeouts_aborted = 0
+        self.writes_issued = 0
+        self.writes_suppressed = 0
+        self.latency = LatencyHistogram()
+
+    @classmethod
+    def total(cls, metrics: Iterable[Metrics]) -> Metrics:
+        """Return the sum of several metrics."""
+        total = cls()
+        for item in metrics:
+            for counter in cls.COUNTERS:
+                setattr(
+                    total, counter, getattr(total, counter) + getattr(item, counter)
+                )
+            total.latency.merge(item.latency)
+
+        return total
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the counters and the latency summary."""
+        return {
+            **{counter: getattr(self, counter) for counter in self.COUNTERS},
+            "latency": self.latency.as_dict(),
+        }
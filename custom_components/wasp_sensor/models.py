@@ -0,0 +1,218 @@
+"""Data models for Wasp Sensor."""
+
+from __future__ import annotations
+
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from datetime import timedelta
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+
+from .const import (
+    CONF_ADAPTIVE_DELAY,
+    CONF_BOX_AREAS,
+    CONF_BOX_INV_SENSORS,
+    CONF_BOX_LABELS,
+    CONF_BOX_SENSORS,
+    CONF_CHILD_BOXES,
+    CONF_HYSTERESIS,
+    CONF_LOWER,
+    CONF_MIN_SENSOR_CHANGE_DELAY,
+    CONF_NAME,
+    CONF_OPTIMISTIC,
+    CONF_SENSOR_CHANGE_DELAY,
+    CONF_THRESHOLDS,
+    CONF_TIMEOUT,
+    CONF_TRACE_SIZE,
+    CONF_UNAVAILABLE_POLICY,
+    CONF_UNRECORDED_ATTRIBUTES,
+    CONF_UPPER,
+    CONF_WASP_AREAS,
+    CONF_WASP_INV_SENSORS,
+    CONF_WASP_LABELS,
+    CONF_WASP_SENSORS,
+    DEFAULT_ADAPTIVE_DELAY,
+    DEFAULT_MIN_SENSOR_CHANGE_DELAY,
+    DEFAULT_OPTIMISTIC,
+    DEFAULT_SENSOR_CHANGE_DELAY,
+    DEFAULT_TRACE_SIZE,
+    DEFAULT_UNAVAILABLE_POLICY,
+    DEFAULT_UNRECORDED_ATTRIBUTES,
+    DEFAULT_WASP_TIMEOUT,
+)
+from .dwell import DwellStats
+from .metrics import Metrics
+
+if TYPE_CHECKING:
+    from .binary_sensor import WaspBinarySensor
+
+
+def duration_to_seconds(value: float | Mapping[str, float]) -> float:
+    """Return seconds for a number of seconds or a duration selector dict."""
+    if isinstance(value, Mapping):
+        return timedelta(**value).total_seconds()
+
+    return float(value)
+
+
+@dataclass(frozen=True, slots=True)
+class ThresholdRule:
+    """
+    Turns the numeric state of a sensor into on or off.
+
+    The rule works like the threshold helper of Home Assistant. With only a
+    lower limit the sensor is on below it, with only an upper limit above it
+    and with both limits in between them. Within the hysteresis around a limit
+    the sensor keeps its previous state.
+    """
+
+    lower: float | None = None
+    upper: float | None = None
+    hysteresis: float = 0.0
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> ThresholdRule:
+        """Create from a THRESHOLD_SCHEMA item."""
+        lower = config.get(CONF_LOWER)
+        upper = config.get(CONF_UPPER)
+        return cls(
+            lower=float(lower) if lower is not None else None,
+            upper=float(upper) if upper is not None else None,
+            hysteresis=float(config.get(CONF_HYSTERESIS) or 0.0),
+        )
+
+    def is_on(self, value: float, was_on: bool) -> bool:
+        """Return whether the sensor is on for a value."""
+        hysteresis = self.hysteresis
+        lower = self.lower
+        upper = self.upper
+
+        if upper is None:
+            if value < lower - hysteresis:
+                return True
+            if value > lower + hysteresis:
+                return False
+        elif lower is None:
+            if value > upper + hysteresis:
+                return True
+            if value < upper - hysteresis:
+                return False
+        else:
+            if value < lower - hysteresis or value > upper + hysteresis:
+                return False
+            if lower + hysteresis < value < upper - hysteresis:
+                return True
+
+        return was_on
+
+
+@dataclass(frozen=True, slots=True)
+class BoxConfig:
+    """
+    Configuration of a box, normalised once.
+
+    YAML stores durations as a number of seconds while config entry options
+    store duration selector dicts, both are resolved to float seconds.
+    """
+
+    name: str
+    wasp_sensors: frozenset[str] = frozenset()
+    wasp_inv_sensors: frozenset[str] = frozenset()
+    box_sensors: frozenset[str] = frozenset()
+    box_inv_sensors: frozenset[str] = frozenset()
+    child_boxes: frozenset[str] = frozenset()
+    # Areas and labels whose motion and door sensors are wasp and box sensors
+    wasp_areas: frozenset[str] = frozenset()
+    wasp_labels: frozenset[str] = frozenset()
+    box_areas: frozenset[str] = frozenset()
+    box_labels: frozenset[str] = frozenset()
+    timeout: float = float(DEFAULT_WASP_TIMEOUT)
+    sensor_change_delay: float = float(DEFAULT_SENSOR_CHANGE_DELAY)
+    # Learn the delay per wasp sensor, between the minimum and the delay above
+    adaptive_delay: bool = DEFAULT_ADAPTIVE_DELAY
+    min_sensor_change_delay: float = float(DEFAULT_MIN_SENSOR_CHANGE_DELAY)
+    unavailable_policy: str = DEFAULT_UNAVAILABLE_POLICY
+    # Report a closed box with a seen wasp as occupied before the timeout
+    optimistic: bool = DEFAULT_OPTIMISTIC
+    trace_size: int = DEFAULT_TRACE_SIZE
+    # Keep the attributes of the box out of the recorder
+    unrecorded_attributes: bool = DEFAULT_UNRECORDED_ATTRIBUTES
+    # entity_id -> threshold rule, for sensors with a numeric state
+    thresholds: Mapping[str, ThresholdRule] = field(
+        default_factory=lambda: MappingProxyType({}), hash=False
+    )
+
+    # entity_id -> roles of that entity in this box
+    sensor_roles: Mapping[str, tuple[str, ...]] = field(
+        init=False, compare=False, repr=False
+    )
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "thresholds", MappingProxyType(dict(self.thresholds)))
+
+        sensor_roles: dict[str, tuple[str, ...]] = {}
+        for role, entity_ids in self.sensors.items():
+            for entity_id in entity_ids:
+                sensor_roles[entity_id] = sensor_roles.get(entity_id, ()) + (role,)
+        object.__setattr__(self, "sensor_roles", MappingProxyType(sensor_roles))
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> BoxConfig:
+        """Create from an ENTRY_SCHEMA item or config entry data and options."""
+        return cls(
+            name=config[CONF_NAME],
+            wasp_sensors=frozenset(config.get(CONF_WASP_SENSORS) or ()),
+            wasp_inv_sensors=frozenset(config.get(CONF_WASP_INV_SENSORS) or ()),
+            box_sensors=frozenset(config.get(CONF_BOX_SENSORS) or ()),
+            box_inv_sensors=frozenset(config.get(CONF_BOX_INV_SENSORS) or ()),
+            child_boxes=frozenset(config.get(CONF_CHILD_BOXES) or ()),
+            wasp_areas=frozenset(config.get(CONF_WASP_AREAS) or ()),
+            wasp_labels=frozenset(config.get(CONF_WASP_LABELS) or ()),
+            box_areas=frozenset(config.get(CONF_BOX_AREAS) or ()),
+            box_labels=frozenset(config.get(CONF_BOX_LABELS) or ()),
+            timeout=duration_to_seconds(config.get(CONF_TIMEOUT, DEFAULT_WASP_TIMEOUT)),
+            sensor_change_delay=duration_to_seconds(
+                config.get(CONF_SENSOR_CHANGE_DELAY, DEFAULT_SENSOR_CHANGE_DELAY)
+            ),
+            adaptive_delay=bool(
+                config.get(CONF_ADAPTIVE_DELAY, DEFAULT_ADAPTIVE_DELAY)
+            ),
+            min_sensor_change_delay=duration_to_seconds(
+                config.get(
+                    CONF_MIN_SENSOR_CHANGE_DELAY, DEFAULT_MIN_SENSOR_CHANGE_DELAY
+                )
+            ),
+            unavailable_policy=config.get(
+                CONF_UNAVAILABLE_POLICY, DEFAULT_UNAVAILABLE_POLICY
+            ),
+            optimistic=bool(config.get(CONF_OPTIMISTIC, DEFAULT_OPTIMISTIC)),
+            trace_size=int(config.get(CONF_TRACE_SIZE, DEFAULT_TRACE_SIZE)),
+            unrecorded_attributes=bool(
+                config.get(CONF_UNRECORDED_ATTRIBUTES, DEFAULT_UNRECORDED_ATTRIBUTES)
+            ),
+            thresholds={
+                entity_id: ThresholdRule.from_config(rule)
+                for entity_id, rule in (config.get(CONF_THRESHOLDS) or {}).items()
+            },
+        )
+
+    @property
+    def sensors(self) -> dict[str, frozenset[str]]:
+        """Return the sensors per role."""
+        return {
+            CONF_WASP_SENSORS: self.wasp_sensors,
+            CONF_WASP_INV_SENSORS: self.wasp_inv_sensors,
+            CONF_BOX_SENSORS: self.box_sensors,
+            CONF_BOX_INV_SENSORS: self.box_inv_sensors,
+            CONF_CHILD_BOXES: self.child_boxes,
+        }
+
+
+@dataclass(slots=True)
+class EntryData:
+    """Runtime data of a config entry, shared by the box and its sensors."""
+
+    metrics: Metrics = field(default_factory=Metrics)
+    dwell: DwellStats = field(default_factory=DwellStats)
+    # The box, to reconfigure it in place when the options change
+    box: WaspBinarySensor | None = None
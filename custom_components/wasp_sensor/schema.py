@@ -0,0 +1,68 @@
+"""Schemas shared by the YAML configuration and the config flow."""
+
+from collections.abc import Mapping
+from typing import Any
+
+from homeassistant.components.sensor import DOMAIN as SENSOR_DOMAIN
+from homeassistant.core import split_entity_id
+import homeassistant.helpers.config_validation as cv
+import voluptuous as vol
+
+from .const import (
+    CONF_HYSTERESIS,
+    CONF_LOWER,
+    CONF_THRESHOLDS,
+    CONF_UPPER,
+    SENSOR_ROLES,
+)
+
+THRESHOLD_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Optional(CONF_LOWER): vol.Coerce(float),
+            vol.Optional(CONF_UPPER): vol.Coerce(float),
+            vol.Optional(CONF_HYSTERESIS, default=0.0): vol.All(
+                vol.Coerce(float), vol.Range(min=0)
+            ),
+        }
+    ),
+    cv.has_at_least_one_key(CONF_LOWER, CONF_UPPER),
+)
+
+THRESHOLDS_SCHEMA = vol.Schema({cv.entity_id: THRESHOLD_SCHEMA})
+
+
+def _role_entities(config: Mapping[str, Any]) -> set[str]:
+    return {entity_id for role in SENSOR_ROLES for entity_id in config.get(role) or ()}
+
+
+def missing_thresholds(config: Mapping[str, Any]) -> list[str]:
+    """Return the numeric sensors of a box without a threshold rule."""
+    thresholds = config.get(CONF_THRESHOLDS) or {}
+    return sorted(
+        entity_id
+        for entity_id in _role_entities(config)
+        if split_entity_id(entity_id)[0] == SENSOR_DOMAIN
+        and entity_id not in thresholds
+    )
+
+
+def unused_thresholds(config: Mapping[str, Any]) -> list[str]:
+    """Return the threshold rules of a box for entities it does not use."""
+    return sorted(set(config.get(CONF_THRESHOLDS) or {}) - _role_entities(config))
+
+
+def validate_thresholds(config: dict[str, Any]) -> dict[str, Any]:
+    """Require a threshold rule for every numeric sensor, and only for those."""
+    if missing := missing_thresholds(config):
+        raise vol.Invalid(
+            f"Numeric sensors need a threshold rule: {', '.join(missing)}",
+            path=[CONF_THRESHOLDS],
+        )
+    if unused := unused_thresholds(config):
+        raise vol.Invalid(
+            f"Threshold rules for sensors the box does not use: {', '.join(unused)}",
+            path=[CONF_THRESHOLDS],
+        )
+
+    return config
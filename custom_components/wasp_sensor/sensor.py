@@ -0,0 +1,192 @@
+"""Statistic and diagnostic sensor platform for Wasp Sensor."""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import time
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity_platform import AddConfigEntryEntitiesCallback
+import homeassistant.util.dt as dt_util
+
+from .const import CONF_NAME, DOMAIN
+from .dwell import DwellStats
+from .metrics import Metrics
+from .models import EntryData
+
+# Counters change with every event and statistics with the time, poll them
+# instead of writing every change
+SCAN_INTERVAL = timedelta(seconds=60)
+
+
+@dataclass(frozen=True, kw_only=True)
+class WaspMetricsSensorEntityDescription(SensorEntityDescription):
+    """Describes a metric of a box."""
+
+    value_fn: Callable[[Metrics], float | None]
+
+
+def _counter(key: str) -> WaspMetricsSensorEntityDescription:
+    return WaspMetricsSensorEntityDescription(
+        key=key,
+        name=key.replace("_", " ").capitalize(),
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: getattr(metrics, key),
+    )
+
+
+def _latency(fraction: float) -> WaspMetricsSensorEntityDescription:
+    percentile = round(fraction * 100)
+    return WaspMetricsSensorEntityDescription(
+        key=f"latency_p{percentile}",
+        name=f"Event latency p{percentile}",
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        suggested_display_precision=3,
+        value_fn=lambda metrics: (
+            None
+            if (value := metrics.latency.percentile(fraction)) is None
+            else value * 1000.0
+        ),
+    )
+
+
+SENSOR_TYPES: tuple[WaspMetricsSensorEntityDescription, ...] = (
+    *(_counter(key) for key in Metrics.COUNTERS),
+    _latency(0.5),
+    _latency(0.99),
+)
+
+
+@dataclass(frozen=True, kw_only=True)
+class WaspDwellSensorEntityDescription(SensorEntityDescription):
+    """Describes an occupancy statistic of a box over the last 24 hours."""
+
+    value_fn: Callable[[DwellStats, float], float | datetime | None]
+
+
+def _dwell(
+    key: str, name: str, value_fn: Callable[[DwellStats, float], float | None]
+) -> WaspDwellSensorEntityDescription:
+    return WaspDwellSensorEntityDescription(
+        key=key,
+        name=name,
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement=UnitOfTime.SECONDS,
+        suggested_unit_of_measurement=UnitOfTime.MINUTES,
+        suggested_display_precision=0,
+        value_fn=value_fn,
+    )
+
+
+DWELL_SENSOR_TYPES: tuple[WaspDwellSensorEntityDescription, ...] = (
+    _dwell("occupied_time", "Occupied time", DwellStats.occupied_seconds),
+    WaspDwellSensorEntityDescription(
+        key="visits",
+        name="Visits",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=DwellStats.visits,
+    ),
+    _dwell("mean_dwell", "Mean dwell time", DwellStats.mean_dwell),
+    _dwell("max_dwell", "Max dwell time", DwellStats.max_dwell),
+    WaspDwellSensorEntityDescription(
+        key="last_occupied",
+        name="Last occupied",
+        device_class=SensorDeviceClass.TIMESTAMP,
+        value_fn=lambda dwell, now: (
+            None
+            if dwell.last_occupied is None
+            else dt_util.utc_from_timestamp(dwell.last_occupied)
+        ),
+    ),
+)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddConfigEntryEntitiesCallback,
+) -> None:
+    """Set up the statistic and diagnostic sensors of a Wasp in a Box sensor."""
+    entry_data: EntryData = hass.data[DOMAIN][config_entry.entry_id]
+    name = config_entry.data[CONF_NAME]
+
+    async_add_entities(
+        [
+            *(
+                WaspDwellSensor(
+                    description, config_entry.entry_id, name, entry_data.dwell
+                )
+                for description in DWELL_SENSOR_TYPES
+            ),
+            *(
+                WaspMetricsSensor(
+                    description, config_entry.entry_id, name, entry_data.metrics
+                )
+                for description in SENSOR_TYPES
+            ),
+        ]
+    )
+
+
+class WaspDwellSensor(SensorEntity):
+    """An occupancy statistic of a box, disabled by default."""
+
+    entity_description: WaspDwellSensorEntityDescription
+
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(
+        self,
+        entity_description: WaspDwellSensorEntityDescription,
+        entry_id: str,
+        box_name: str,
+        dwell: DwellStats,
+    ) -> None:
+        self.entity_description = entity_description
+        self._attr_unique_id = f"{entry_id}_{entity_description.key}"
+        self._attr_name = f"{box_name} {entity_description.name.lower()}"
+        self._dwell = dwell
+
+    @property
+    def native_value(self) -> float | datetime | None:
+        """Return the current value of the statistic."""
+        return self.entity_description.value_fn(self._dwell, time.time())
+
+
+class WaspMetricsSensor(SensorEntity):
+    """A metric of a box, disabled by default."""
+
+    entity_description: WaspMetricsSensorEntityDescription
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(
+        self,
+        entity_description: WaspMetricsSensorEntityDescription,
+        entry_id: str,
+        box_name: str,
+        metrics: Metrics,
+    ) -> None:
+        self.entity_description = entity_description
+        self._attr_unique_id = f"{entry_id}_{entity_description.key}"
+        self._attr_name = f"{box_name} {entity_description.name.lower()}"
+        self._metrics = metrics
+
+    @property
+    def native_value(self) -> float | None:
+        """Return the current value of the metric."""
+        return self.entity_description.value_fn(self._metrics)
@@ -0,0 +1,274 @@
+"""Hashed timer wheel shared by all Wasp Sensor boxes."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable, Hashable
+import logging
+import math
+from typing import Any
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+# Millisecond resolution, the duration selectors allow milliseconds
+DEFAULT_RESOLUTION = 0.001
+# One revolution of the wheel covers a little over 4 seconds
+DEFAULT_SLOTS = 4096
+
+
+class WheelTimer:
+    """A pending deadline on the timer wheel."""
+
+    __slots__ = (
+        "wheel",
+        "tick",
+        "deadline",
+        "owner",
+        "name",
+        "callback",
+        "args",
+        "active",
+    )
+
+    def __init__(
+        self,
+        wheel: TimerWheel,
+        tick: int,
+        deadline: float,
+        owner: Hashable | None,
+        name: str | None,
+        callback: Callable[..., Any],
+        args: tuple[Any, ...],
+    ) -> None:
+        self.wheel = wheel
+        self.tick = tick
+        self.deadline = deadline
+        self.owner = owner
+        self.name = name
+        self.callback = callback
+        self.args = args
+        self.active = True
+
+    def cancel(self) -> None:
+        """Cancel the timer, cancelling a timer that already fired is a no-op."""
+        self.wheel.cancel(self)
+
+    def __repr__(self) -> str:
+        return f"<WheelTimer {self.name} {self.owner} at {self.deadline:.3f}>"
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel driven by a single event loop timer.
+
+    Timers are hashed on their deadline tick into a fixed number of slots, which
+    makes inserting and cancelling a timer O(1). Only one loop timer is kept,
+    scheduled for the earliest deadline in the current revolution of the wheel.
+
+    Without a loop the wheel is driven by calling advance(), which together with
+    an injected clock allows running it on a virtual clock.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop | None = None,
+        *,
+        clock: Callable[[], float] | None = None,
+        resolution: float = DEFAULT_RESOLUTION,
+        slots: int = DEFAULT_SLOTS,
+    ) -> None:
+        self._loop = loop
+        self._clock = clock if clock is not None else loop.time
+        self._resolution = resolution
+        self._slots: list[dict[WheelTimer, None]] = [{} for _ in range(slots)]
+        self._owners: dict[Hashable, dict[WheelTimer, None]] = {}
+        self._count = 0
+
+        # The last tick that has been processed
+        self._cursor = self._to_tick(self._clock())
+        self._firing = False
+
+        self._wake_tick: int | None = None
+        self._wake_handle: asyncio.TimerHandle | None = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _to_tick(self, when: float) -> int:
+        return math.floor(when / self._resolution)
+
+    def schedule(
+        self,
+        delay: float,
+        callback: Callable[..., Any],
+        *args: Any,
+        owner: Hashable | None = None,
+        name: str | None = None,
+    ) -> WheelTimer:
+        """Call callback with args after delay seconds."""
+        return self.schedule_at(
+            self._clock() + delay, callback, *args, owner=owner, name=name
+        )
+
+    def schedule_at(
+        self,
+        deadline: float,
+        callback: Callable[..., Any],
+        *args: Any,
+        owner: Hashable | None = None,
+        name: str | None = None,
+    ) -> WheelTimer:
+        """Call callback with args at the given clock time."""
+        if self._count == 0 and not self._firing:
+            # Nothing happened while the wheel was idle, skip ahead
+            self._cursor = max(self._cursor, self._to_tick(self._clock()))
+
+        # A deadline in the past fires on the next tick
+        tick = max(math.ceil(deadline / self._resolution), self._cursor + 1)
+        timer = WheelTimer(self, tick, deadline, owner, name, callback, args)
+
+        self._slots[tick % len(self._slots)][timer] = None
+        self._owners.setdefault(owner, {})[timer] = None
+        self._count += 1
+
+        if not self._firing and (self._wake_tick is None or tick < self._wake_tick):
+            self._set_wake(tick)
+
+        return timer
+
+    def cancel(self, timer: WheelTimer) -> None:
+        """Cancel a timer."""
+        if not timer.active:
+            # Already fired or cancelled
+            return
+
+        timer.active = False
+        slot = self._slots[timer.tick % len(self._slots)]
+        if timer not in slot:
+            # Due and about to fire
+            return
+
+        del slot[timer]
+        self._count -= 1
+        owned = self._owners[timer.owner]
+        del owned[timer]
+        if not owned:
+            del self._owners[timer.owner]
+
+        # Waking up early for a cancelled timer is harmless, only stop the loop
+        # timer when nothing is pending anymore
+        if self._count == 0:
+            self._set_wake(None)
+
+    def cancel_owner(self, owner: Hashable) -> None:
+        """Cancel all timers of an owner."""
+        for timer in list(self._owners.get(owner, ())):
+            self.cancel(timer)
+
+    def pending(self, owner: Hashable | None = None) -> list[WheelTimer]:
+        """Return the pending timers of an owner ordered by deadline."""
+        return sorted(self._owners.get(owner, ()), key=lambda timer: timer.deadline)
+
+    def pending_by_owner(self) -> dict[Hashable | None, list[WheelTimer]]:
+        """Return the pending timers of every owner ordered by deadline."""
+        return {owner: self.pending(owner) for owner in self._owners}
+
+    def advance(self, now: float | None = None) -> int:
+        """Fire all timers that are due, return the number of timers fired."""
+        fired = self._advance_to(self._to_tick(self._clock() if now is None else now))
+        if self._loop is not None:
+            self._set_wake(self.next_tick())
+
+        return fired
+
+    def _advance_to(self, now_tick: int) -> int:
+        if now_tick <= self._cursor:
+            return 0
+
+        expired: list[WheelTimer] = []
+        if self._count:
+            slots = self._slots
+            n_slots = len(slots)
+            if now_tick - self._cursor >= n_slots:
+                candidates = range(n_slots)
+            else:
+                candidates = (
+                    tick % n_slots for tick in range(self._cursor + 1, now_tick + 1)
+                )
+            for index in candidates:
+                slot = slots[index]
+                if not slot:
+                    continue
+                for timer in [timer for timer in slot if timer.tick <= now_tick]:
+                    del slot[timer]
+                    expired.append(timer)
+
+        self._cursor = now_tick
+        if not expired:
+            return 0
+
+        expired.sort(key=lambda timer: timer.tick)
+        self._firing = True
+        try:
+            for timer in expired:
+                self._count -= 1
+                owned = self._owners[timer.owner]
+                del owned[timer]
+                if not owned:
+                    del self._owners[timer.owner]
+
+            for timer in expired:
+                if not timer.active:
+                    # Cancelled by a timer that fired before
+                    continue
+                timer.active = False
+                try:
+                    timer.callback(*timer.args)
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception("Error running timer %s", timer)
+        finally:
+            self._firing = False
+
+        return len(expired)
+
+    def next_tick(self) -> int | None:
+        """Return the earliest pending tick, or None when nothing is pending."""
+        if not self._count:
+            return None
+
+        slots = self._slots
+        n_slots = len(slots)
+        for tick in range(self._cursor + 1, self._cursor + n_slots + 1):
+            slot = slots[tick % n_slots]
+            if slot and any(timer.tick == tick for timer in slot):
+                return tick
+
+        # Everything pending is at least one revolution away, check again then
+        return self._cursor + n_slots
+
+    def _set_wake(self, tick: int | None) -> None:
+        if self._wake_handle is not None:
+            self._wake_handle.cancel()
+            self._wake_handle = None
+
+        self._wake_tick = tick
+        if tick is not None and self._loop is not None:
+            self._wake_handle = self._loop.call_at(tick * self._resolution, self._wake)
+
+    def _wake(self) -> None:
+        # The loop may run the timer a fraction of a tick early
+        wake_tick = self._wake_tick
+        self._wake_handle = None
+        self._wake_tick = None
+        self._advance_to(max(self._to_tick(self._clock()), wake_tick))
+        self._set_wake(self.next_tick())
+
+    def shutdown(self) -> None:
+        """Cancel all pending timers and the loop timer."""
+        for slot in self._slots:
+            for timer in slot:
+                timer.active = False
+            slot.clear()
+        self._owners.clear()
+        self._count = 0
+        self._set_wake(None)
@@ -0,0 +1,59 @@
+"""Fixed size trace of the events and decisions of a box."""
+
+from __future__ import annotations
+
+from collections import deque
+from datetime import UTC, datetime
+from typing import Any
+
+# Fields of a trace entry
+TRACE_FIELDS = ("time", "sensor", "old_state", "new_state", "reason", "write")
+
+TraceEntry = tuple[float, str, str | None, str | None, str, bool]
+
+
+class TraceBuffer:
+    """Ring buffer keeping the most recent trace entries."""
+
+    __slots__ = ("_entries",)
+
+    def __init__(self, size: int) -> None:
+        self._entries: deque[TraceEntry] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Return the maximum number of entries."""
+        return self._entries.maxlen
+
+    def resize(self, size: int) -> None:
+        """Change the size, keeping the most recent entries."""
+        self._entries = deque(self._entries, maxlen=size)
+
+    def record(
+        self,
+        when: float,
+        sensor: str,
+        old_state: str | None,
+        new_state: str | None,
+        reason: str,
+        write: bool,
+    ) -> None:
+        """Add an entry, dropping the oldest one when the buffer is full."""
+        self._entries.append((when, sensor, old_state, new_state, reason, write))
+
+    def as_list(self, wall_offset: float) -> list[dict[str, Any]]:
+        """
+        Return the entries from oldest to newest.
+
+        wall_offset is the wall clock time minus the clock time of the entries.
+        """
+        return [
+            {
+                **dict(zip(TRACE_FIELDS, entry)),
+                "time": datetime.fromtimestamp(entry[0] + wall_offset, UTC).isoformat(),
+            }
+            for entry in self._entries
+        ]
@@ -0,0 +1 @@
+"""Tests for the Wasp Sensor integration."""
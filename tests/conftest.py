@@ -0,0 +1,66 @@
+"""Fixtures for the Wasp Sensor tests."""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+import importlib.util
+from pathlib import Path
+import sqlite3
+
+import pytest
+
+# The tests of the integration itself need Home Assistant and its test helpers
+if importlib.util.find_spec("pytest_homeassistant_custom_component") is None:
+    collect_ignore = [
+        "test_coordinator.py",
+        "test_init.py",
+        "test_membership.py",
+        "test_services.py",
+    ]
+
+
+class VirtualClock:
+    """A clock that only moves when the test moves it."""
+
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> VirtualClock:
+    """Return a virtual clock for an engine or a timer wheel."""
+    return VirtualClock()
+
+
+@pytest.fixture
+def recorder_db(tmp_path: Path) -> Callable[[Iterable[tuple[str, str, float]]], str]:
+    """Return a function writing states to a minimal recorder database."""
+
+    def write(states: Iterable[tuple[str, str, float]]) -> str:
+        path = str(tmp_path / "home-assistant_v2.db")
+        with sqlite3.connect(path) as connection:
+            connection.execute(
+                "CREATE TABLE states_meta"
+                " (metadata_id INTEGER PRIMARY KEY, entity_id TEXT UNIQUE)"
+            )
+            connection.execute(
+                "CREATE TABLE states (state_id INTEGER PRIMARY KEY,"
+                " metadata_id INTEGER, state TEXT, last_updated_ts REAL)"
+            )
+            for entity_id, state, when in states:
+                connection.execute(
+                    "INSERT OR IGNORE INTO states_meta (entity_id) VALUES (?)",
+                    (entity_id,),
+                )
+                connection.execute(
+                    "INSERT INTO states (metadata_id, state, last_updated_ts)"
+                    " SELECT metadata_id, ?, ? FROM states_meta WHERE entity_id = ?",
+                    (state, when, entity_id),
+                )
+        connection.close()
+        return path
+
+    return write
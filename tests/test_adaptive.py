@@ -0,0 +1,80 @@
+"""Tests for the sensor change delay learned per wasp sensor."""
+
+from __future__ import annotations
+
+from benchmarks.core import load_module
+
+adaptive = load_module("adaptive")
+
+
+def record_changes(delay, times, max_delay=10.0):
+    """Record the sensor turning on and off in turns, at each time."""
+    for index, now in enumerate(times):
+        delay.record(now, index % 2 == 0, max_delay)
+
+
+def test_warmup_uses_configured_delay():
+    """Until enough changes are seen the configured delay is used."""
+    delay = adaptive.AdaptiveDelay()
+    record_changes(delay, [index * 100.0 for index in range(5)])
+    assert delay.delay(500.0, 0.0, 10.0) == 10.0
+
+
+def test_no_flaps_uses_minimum():
+    """A sensor that does not flap gets the minimum delay."""
+    delay = adaptive.AdaptiveDelay()
+    record_changes(delay, [index * 100.0 for index in range(adaptive.WARMUP_CHANGES)])
+    assert delay.delay(3000.0, 0.5, 10.0) == 0.5
+
+
+def test_flaps_set_the_delay():
+    """The delay covers the longest recent flap, within the bounds."""
+    delay = adaptive.AdaptiveDelay()
+    times = []
+    for index in range(adaptive.WARMUP_CHANGES // 2):
+        # A 2 second flap every 100 seconds
+        times += [index * 100.0, index * 100.0 + 2.0]
+    record_changes(delay, times)
+
+    assert delay.delay(2000.0, 0.0, 10.0) == 2.0 * adaptive.FLAP_MARGIN
+    assert delay.delay(2000.0, 0.0, 2.5) == 2.5
+    assert delay.delay(2000.0, 4.0, 10.0) == 4.0
+
+
+def test_turning_on_again_is_no_flap():
+    """Only off right after on is a flap, not on right after off."""
+    delay = adaptive.AdaptiveDelay()
+    times = [0.0]
+    for index in range(adaptive.WARMUP_CHANGES):
+        # On for 50 seconds, then on again 2 seconds after off
+        times.append(times[-1] + (50.0 if index % 2 == 0 else 2.0))
+    record_changes(delay, times)
+
+    assert delay.delay(times[-1], 0.0, 10.0) == 0.0
+
+
+def test_old_flaps_are_forgotten():
+    """Flaps older than the window do not count anymore."""
+    delay = adaptive.AdaptiveDelay()
+    record_changes(delay, [0.0, 2.0])
+    record_changes(
+        delay, [100.0 + index * 100.0 for index in range(adaptive.WARMUP_CHANGES)]
+    )
+
+    assert delay.delay(3000.0, 0.0, 10.0) == 2.0 * adaptive.FLAP_MARGIN
+    assert delay.delay(adaptive.FLAP_WINDOW + 3.0, 0.0, 10.0) == 0.0
+
+
+def test_restore():
+    """The statistics survive a round trip with another clock."""
+    delay = adaptive.AdaptiveDelay()
+    record_changes(delay, [0.0, 3.0, 100.0])
+    data = delay.as_dict(1000.0)
+
+    restored = adaptive.AdaptiveDelay.from_dict(data, 500.0)
+    assert restored.changes == delay.changes
+    assert restored.as_dict(500.0) == data
+
+    # The sensor turned on before the restart, turning off is a flap
+    restored.record(602.0, False, 10.0)
+    assert restored.as_dict(500.0)["flaps"] == [[1003.0, 3.0], [1102.0, 2.0]]
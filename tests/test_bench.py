@@ -0,0 +1,53 @@
+"""Smoke tests for the load benchmark."""
+
+from __future__ import annotations
+
+import importlib.util
+import json
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.mark.parametrize(
+    "mode",
+    [
+        "engine",
+        pytest.param(
+            "stack",
+            marks=pytest.mark.skipif(
+                importlib.util.find_spec("homeassistant") is None,
+                reason="the stack mode needs Home Assistant",
+            ),
+        ),
+    ],
+)
+def test_bench_runs(mode: str) -> None:
+    """A tiny run starts the boxes and writes their state."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.bench",
+            "--mode",
+            mode,
+            "--boxes",
+            "2",
+            "--events",
+            "10",
+            "--no-memory",
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    (scenario,) = json.loads(result.stdout)["results"]
+    assert scenario["events"] == 10
+    assert scenario["state_writes"] > 0
+    assert scenario["latency_ms"]["count"] > 0
@@ -0,0 +1,322 @@
+"""Tests for the coordinator shared by all boxes."""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import timedelta
+from typing import Any
+
+from homeassistant.const import EVENT_HOMEASSISTANT_START
+from homeassistant.core import CoreState, HomeAssistant
+from homeassistant.setup import async_setup_component
+import homeassistant.util.dt as dt_util
+import pytest
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.wasp_sensor.const import DOMAIN
+from custom_components.wasp_sensor.coordinator import async_get_coordinator
+from custom_components.wasp_sensor.diagnostics import (
+    async_get_config_entry_diagnostics,
+)
+
+MOTION = "binary_sensor.motion"
+HALLWAY = "binary_sensor.hallway_motion"
+DOOR = "binary_sensor.door"
+FRONT_DOOR = "binary_sensor.front_door"
+
+BOX = {
+    "name": "office",
+    "wasp_sensors": [MOTION],
+    "box_sensors": [DOOR],
+    "timeout": 60,
+    "sensor_change_delay": 0,
+}
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Load the integration from custom_components."""
+    yield
+
+
+async def async_setup_boxes(hass: HomeAssistant, *boxes: dict[str, Any]) -> dict:
+    """Set up boxes from YAML, return the running boxes by name."""
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: list(boxes)})
+    await hass.async_block_till_done()
+    return {
+        entry.title: hass.data[DOMAIN][entry.entry_id].box
+        for entry in hass.config_entries.async_entries(DOMAIN)
+    }
+
+
+async def async_flush_writes(hass: HomeAssistant) -> None:
+    """Handle the pending events, then let the coordinator write the boxes."""
+    await hass.async_block_till_done()
+    # The writes are a call_soon callback, not a task
+    await asyncio.sleep(0)
+
+
+async def test_events_reach_the_boxes_of_the_sensor(hass: HomeAssistant) -> None:
+    """A state change is only dispatched to the boxes that have the sensor."""
+    boxes = await async_setup_boxes(
+        hass, BOX, {**BOX, "name": "hallway", "wasp_sensors": [HALLWAY]}
+    )
+    coordinator = async_get_coordinator(hass)
+    assert coordinator.async_metrics()["tracked_sensors"] == 3
+
+    hass.states.async_set(HALLWAY, "on")
+    await hass.async_block_till_done()
+    assert boxes["hallway"].metrics.events_received == 1
+    assert boxes["office"].metrics.events_received == 0
+
+    hass.states.async_set(DOOR, "on")
+    await hass.async_block_till_done()
+    assert boxes["hallway"].metrics.events_received == 2
+    assert boxes["office"].metrics.events_received == 1
+    assert coordinator.metrics.events_received == 2
+
+    # A removed box does not get events anymore
+    entry = next(
+        entry
+        for entry in hass.config_entries.async_entries(DOMAIN)
+        if entry.title == "hallway"
+    )
+    await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+    assert coordinator.async_metrics()["tracked_sensors"] == 2
+
+    hass.states.async_set(HALLWAY, "off")
+    await hass.async_block_till_done()
+    assert coordinator.metrics.events_received == 2
+
+
+async def test_attribute_changes_are_dropped(hass: HomeAssistant) -> None:
+    """A change of only the attributes of a sensor does not reach the boxes."""
+    hass.states.async_set(MOTION, "off")
+    boxes = await async_setup_boxes(hass, BOX)
+    coordinator = async_get_coordinator(hass)
+
+    hass.states.async_set(MOTION, "off", {"battery_level": 80})
+    await hass.async_block_till_done()
+    assert coordinator.metrics.events_received == 1
+    assert coordinator.metrics.events_filtered == 1
+    assert boxes["office"].metrics.events_received == 0
+
+
+@pytest.mark.parametrize(
+    ("door", "policy", "closed"),
+    [
+        ("on", "inactive", True),
+        ("on", "active", False),
+        ("on", "ignore", False),
+        ("off", "active", False),
+        ("off", "ignore", True),
+    ],
+)
+async def test_unavailable_policy(
+    hass: HomeAssistant, door: str, policy: str, closed: bool
+) -> None:
+    """An unavailable sensor counts as inactive, active or keeps its state."""
+    hass.states.async_set(MOTION, "off")
+    hass.states.async_set(DOOR, door)
+    boxes = await async_setup_boxes(hass, {**BOX, "unavailable_policy": policy})
+    box = boxes["office"]
+    assert box.engine.box_closed == (door == "off")
+
+    hass.states.async_set(DOOR, "unavailable")
+    await hass.async_block_till_done()
+    assert box.engine.box_closed == closed
+    assert box.metrics.events_filtered == (policy == "ignore")
+
+    # The state of the sensor is used again once it is available
+    hass.states.async_set(DOOR, "off")
+    await hass.async_block_till_done()
+    assert box.engine.box_closed
+
+
+async def test_writes_are_coalesced(hass: HomeAssistant) -> None:
+    """A box writes once per loop iteration and only when its state changed."""
+    hass.states.async_set(MOTION, "off")
+    hass.states.async_set(DOOR, "on")
+    boxes = await async_setup_boxes(hass, BOX)
+    metrics = boxes["office"].metrics
+    issued = metrics.writes_issued
+
+    # Opened and closed again before the box is written
+    hass.states.async_set(DOOR, "off")
+    hass.states.async_set(DOOR, "on")
+    await async_flush_writes(hass)
+    assert metrics.writes_issued == issued
+    assert metrics.writes_suppressed == 1
+
+    hass.states.async_set(DOOR, "off")
+    hass.states.async_set(MOTION, "on")
+    await async_flush_writes(hass)
+    assert metrics.writes_issued == issued + 1
+    assert hass.states.get(boxes["office"].entity_id).attributes["box_closed"]
+
+
+async def test_boxes_start_in_one_batch(
+    hass: HomeAssistant, caplog: pytest.LogCaptureFixture
+) -> None:
+    """Boxes set up during startup start together once Home Assistant started."""
+    hass.set_state(CoreState.not_running)
+    hass.states.async_set(MOTION, "on")
+    hass.states.async_set(DOOR, "off")
+    boxes = await async_setup_boxes(
+        hass,
+        BOX,
+        {**BOX, "name": "attic"},
+        {**BOX, "name": "hallway", "wasp_sensors": [HALLWAY]},
+    )
+    coordinator = async_get_coordinator(hass)
+    assert coordinator.async_metrics()["boxes_running"] == 0
+
+    hass.bus.async_fire(EVENT_HOMEASSISTANT_START)
+    await hass.async_block_till_done()
+    assert coordinator.async_metrics()["boxes_running"] == 3
+    assert "Started 3 boxes watching 3 sensors" in caplog.text
+
+    # Every box starts from the states of its sensors at that moment
+    for box in boxes.values():
+        assert box.engine.box_closed
+    assert boxes["office"].engine.wasp_seen
+    assert not boxes["hallway"].engine.wasp_seen
+
+
+async def test_boxes_share_the_debounce(hass: HomeAssistant) -> None:
+    """Boxes waiting on the same change share one timer."""
+    hass.states.async_set(MOTION, "off")
+    hass.states.async_set(DOOR, "off")
+    boxes = await async_setup_boxes(
+        hass,
+        {**BOX, "sensor_change_delay": 2},
+        {**BOX, "name": "attic", "sensor_change_delay": 2},
+        {**BOX, "name": "hallway", "sensor_change_delay": 2},
+    )
+    coordinator = async_get_coordinator(hass)
+
+    hass.states.async_set(MOTION, "on")
+    await hass.async_block_till_done()
+    assert coordinator.async_metrics()["pending_debounces"] == 1
+
+    # The others keep waiting when one box goes away
+    entry = next(
+        entry
+        for entry in hass.config_entries.async_entries(DOMAIN)
+        if entry.title == "hallway"
+    )
+    await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+    assert coordinator.async_metrics()["pending_debounces"] == 1
+
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=3))
+    await async_flush_writes(hass)
+    assert hass.states.get(boxes["office"].entity_id).state == "on"
+    assert hass.states.get(boxes["attic"].entity_id).state == "on"
+    assert coordinator.async_metrics()["pending_debounces"] == 0
+
+
+async def test_boxes_with_other_delays_share_the_debounce(hass: HomeAssistant) -> None:
+    """One timer settles a change for boxes with different sensor change delays."""
+    hass.states.async_set(MOTION, "off")
+    hass.states.async_set(DOOR, "off")
+    boxes = await async_setup_boxes(
+        hass,
+        {**BOX, "sensor_change_delay": 2},
+        {**BOX, "name": "attic", "sensor_change_delay": 5},
+    )
+    office, attic = (box.entity_id for box in boxes.values())
+    coordinator = async_get_coordinator(hass)
+
+    hass.states.async_set(MOTION, "on")
+    await hass.async_block_till_done()
+    assert coordinator.async_metrics()["pending_debounces"] == 1
+
+    # Each box settles after its own delay
+    now = dt_util.utcnow()
+    async_fire_time_changed(hass, now + timedelta(seconds=3))
+    await async_flush_writes(hass)
+    assert hass.states.get(office).state == "on"
+    assert hass.states.get(attic).state == "off"
+    assert coordinator.async_metrics()["pending_debounces"] == 1
+
+    async_fire_time_changed(hass, now + timedelta(seconds=6))
+    await async_flush_writes(hass)
+    assert hass.states.get(attic).state == "on"
+    assert coordinator.async_metrics()["pending_debounces"] == 0
+
+
+async def test_metrics_in_diagnostics(hass: HomeAssistant) -> None:
+    """The counters and latency of a box and of the domain are in diagnostics."""
+    hass.states.async_set(MOTION, "off")
+    hass.states.async_set(DOOR, "off")
+    boxes = await async_setup_boxes(hass, {**BOX, "sensor_change_delay": 2})
+    box = boxes["office"]
+    (entry,) = hass.config_entries.async_entries(DOMAIN)
+
+    # A flap of the motion sensor cancels the sensor change delay
+    hass.states.async_set(MOTION, "on")
+    hass.states.async_set(MOTION, "off")
+    hass.states.async_set(MOTION, "on")
+    await async_flush_writes(hass)
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+    assert diagnostics["box"]["events_received"] == 3
+    assert diagnostics["box"]["debounces_cancelled"] == 2
+    ((sensor, remaining),) = diagnostics["pending_deadlines"][box.entity_id]
+    assert sensor == MOTION
+    assert 0 < remaining <= 2
+    assert diagnostics["domain"]["coordinator"]["latency"]["count"] == 3
+
+    # The latency of the event runs until its decision is written
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=3))
+    await async_flush_writes(hass)
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+    assert diagnostics["box"]["writes_issued"] == 2
+    assert diagnostics["box"]["latency"]["count"] == 1
+    assert diagnostics["domain"]["boxes"] == diagnostics["box"]
+    assert diagnostics["pending_deadlines"] == {}
+
+
+async def test_child_boxes_are_written_first(hass: HomeAssistant) -> None:
+    """An occupied child box is a seen wasp of its parent in the same write."""
+    hass.states.async_set(MOTION, "off")
+    hass.states.async_set(DOOR, "off")
+    hass.states.async_set(FRONT_DOOR, "off")
+    boxes = await async_setup_boxes(
+        hass,
+        {
+            **BOX,
+            "name": "floor",
+            "wasp_sensors": [],
+            "box_sensors": [FRONT_DOOR],
+            "child_boxes": ["binary_sensor.office"],
+        },
+        BOX,
+    )
+    floor, office = boxes["floor"], boxes["office"]
+    assert not floor.engine.wasp_seen
+
+    # Even without a sensor change delay the wasp sensor settles on a timer
+    hass.states.async_set(MOTION, "on")
+    await hass.async_block_till_done()
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=1))
+    await async_flush_writes(hass)
+    assert hass.states.get(office.entity_id).state == "on"
+    assert floor.engine.wasp_seen
+    assert hass.states.get(floor.entity_id).state == "on"
+
+
+async def test_cycle_of_child_boxes(
+    hass: HomeAssistant, caplog: pytest.LogCaptureFixture
+) -> None:
+    """A box that is its own child is ignored as a child, both boxes run."""
+    boxes = await async_setup_boxes(
+        hass,
+        {**BOX, "child_boxes": ["binary_sensor.floor"]},
+        {**BOX, "name": "floor", "child_boxes": ["binary_sensor.office"]},
+    )
+
+    assert "ignoring binary_sensor." in caplog.text
+    assert async_get_coordinator(hass).async_metrics()["boxes_running"] == 2
+    assert all(hass.states.get(box.entity_id) is not None for box in boxes.values())
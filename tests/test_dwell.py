@@ -0,0 +1,83 @@
+"""Tests for the occupancy and dwell time statistics."""
+
+from __future__ import annotations
+
+from benchmarks.core import load_module
+
+dwell = load_module("dwell")
+
+HOUR = dwell.BUCKET_SECONDS
+# Some whole hour, statistics use wall clock time
+START = 1_700_000_000 // HOUR * HOUR
+
+
+def test_visit_across_hours():
+    """A visit counts once, its occupied time in every hour it lasted."""
+    stats = dwell.DwellStats()
+    stats.update(True, START + HOUR - 600)
+    assert stats.occupied_since == START + HOUR - 600
+    # Occupied again while occupied is not a new visit
+    stats.update(True, START + HOUR - 300)
+    stats.update(False, START + HOUR + 1200)
+
+    now = START + 2 * HOUR
+    assert stats.occupied_seconds(now) == 1800
+    assert stats.visits(now) == 1
+    assert stats.mean_dwell(now) == 1800
+    assert stats.max_dwell(now) == 1800
+    assert stats.last_occupied == START + HOUR - 600
+
+
+def test_current_visit_counts():
+    """The occupied time includes the visit that is still going on."""
+    stats = dwell.DwellStats()
+    stats.update(True, START)
+
+    assert stats.occupied_seconds(START + 120) == 120
+    assert stats.visits(START + 120) == 1
+    assert stats.mean_dwell(START + 120) is None
+    assert stats.max_dwell(START + 120) is None
+
+
+def test_mean_and_max():
+    """The mean and max dwell time are over the visits that ended."""
+    stats = dwell.DwellStats()
+    for start, end in ((START, START + 60), (START + 600, START + 900)):
+        stats.update(True, start)
+        stats.update(False, end)
+
+    now = START + 1000
+    assert stats.visits(now) == 2
+    assert stats.mean_dwell(now) == 180
+    assert stats.max_dwell(now) == 300
+
+
+def test_window_slides():
+    """Visits older than the window are forgotten."""
+    stats = dwell.DwellStats()
+    stats.update(True, START)
+    stats.update(False, START + 60)
+
+    now = START + dwell.WINDOW_BUCKETS * HOUR
+    assert stats.visits(now - 1) == 1
+    assert stats.visits(now) == 0
+    assert stats.occupied_seconds(now) == 0
+    assert stats.mean_dwell(now) is None
+    # The last occupied time is kept
+    assert stats.last_occupied == START
+
+
+def test_restore():
+    """The statistics survive a round trip through as_dict and restore."""
+    stats = dwell.DwellStats()
+    stats.update(True, START)
+    stats.update(False, START + 60)
+    stats.update(True, START + 120)
+
+    restored = dwell.DwellStats()
+    restored.restore(stats.as_dict(START + 180))
+
+    now = START + 240
+    assert restored.occupied_since == START + 120
+    assert restored.visits(now) == 2
+    assert restored.occupied_seconds(now) == stats.occupied_seconds(now) == 180
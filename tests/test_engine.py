@@ -0,0 +1,274 @@
+"""Tests for the Wasp in a Box state machine, on a virtual clock."""
+
+from __future__ import annotations
+
+from benchmarks.core import load_module
+
+engine = load_module("engine")
+models = load_module("models")
+
+MOTION = "binary_sensor.motion"
+DOOR = "binary_sensor.door"
+CO2 = "sensor.co2"
+WASP = "wasp_sensors"
+BOX = "box_sensors"
+
+
+def make_engine(clock, states, **config):
+    """Return a started engine for a box with a motion and a door sensor."""
+    config.setdefault("wasp_sensors", frozenset({MOTION}))
+    config.setdefault("box_sensors", frozenset({DOOR}))
+    config.setdefault("timeout", 60.0)
+    config.setdefault("sensor_change_delay", 2.0)
+    box = engine.WaspBoxEngine(models.BoxConfig(name="office", **config), clock)
+    box.rescan(states.get)
+    return box
+
+
+def settle(box, clock, decision, state):
+    """Move the clock to the sensor change delay deadline and let it settle."""
+    clock.now = decision.schedule.when
+    return box.deadline_reached(decision.schedule, state)
+
+
+def test_timeout_then_occupied(clock):
+    """A box that closes while a wasp is seen is occupied after the timeout."""
+    box = make_engine(clock, {DOOR: "on", MOTION: "on"})
+    assert box.wasp_seen and not box.box_closed
+
+    decision = box.box_sensor_changed(DOOR, BOX, "off", now=1.0)
+    assert decision.reason == engine.REASON_TIMEOUT_STARTED
+    assert decision.schedule.when == 61.0
+    assert not box.wasp_in_box
+
+    clock.now = 61.0
+    decision = box.deadline_reached(decision.schedule)
+    assert decision.reason == engine.REASON_OCCUPIED
+    assert decision.write
+    assert box.wasp_in_box
+    assert box.confidence == engine.CONFIDENCE_CONFIRMED
+    assert not box.pending
+
+
+def test_timeout_without_wasp(clock):
+    """No wasp seen anymore when the timeout elapses leaves the box empty."""
+    box = make_engine(clock, {DOOR: "on", MOTION: "on"})
+    timeout = box.box_sensor_changed(DOOR, BOX, "off", now=0.0).schedule
+
+    decision = box.wasp_sensor_changed(MOTION, WASP, now=10.0)
+    settle(box, clock, decision, "off")
+    assert not box.wasp_seen
+
+    clock.now = timeout.when
+    assert box.deadline_reached(timeout).reason == engine.REASON_TIMEOUT_EXPIRED
+    assert not box.wasp_in_box
+
+
+def test_box_opens_during_sensor_change_delay(clock):
+    """A wasp that settles after the box opened is not in the box."""
+    box = make_engine(clock, {DOOR: "off", MOTION: "off"})
+
+    debounce = box.wasp_sensor_changed(MOTION, WASP, now=0.0, state="on")
+    assert debounce.reason == engine.REASON_DEBOUNCE
+    assert not debounce.write
+
+    assert box.box_sensor_changed(DOOR, BOX, "on", now=1.0).reason == (
+        engine.REASON_BOX_OPENED
+    )
+
+    decision = settle(box, clock, debounce, "on")
+    assert decision.reason == engine.REASON_WASP_SEEN
+    assert box.wasp_seen
+    assert not box.wasp_in_box
+
+
+def test_wasp_in_closed_box(clock):
+    """A wasp seen in a closed box is in the box right away."""
+    box = make_engine(clock, {DOOR: "off", MOTION: "off"})
+
+    decision = settle(box, clock, box.wasp_sensor_changed(MOTION, WASP, now=0.0), "on")
+    assert decision.reason == engine.REASON_WASP_SEEN
+    assert box.wasp_in_box
+
+
+def test_newer_change_supersedes_debounce(clock):
+    """Only the latest change of a wasp sensor settles."""
+    box = make_engine(clock, {DOOR: "off", MOTION: "off"})
+
+    first = box.wasp_sensor_changed(MOTION, WASP, now=0.0)
+    second = box.wasp_sensor_changed(MOTION, WASP, now=1.0)
+    assert second.cancel == MOTION
+
+    assert settle(box, clock, first, "on").reason == engine.REASON_STALE
+    assert not box.wasp_in_box
+    assert settle(box, clock, second, "off").reason == engine.REASON_WASP_GONE
+
+
+def test_optimistic_then_retracted(clock):
+    """An optimistic box is retracted when the wasp leaves before the timeout."""
+    box = make_engine(clock, {DOOR: "on", MOTION: "on"}, optimistic=True)
+
+    timeout = box.box_sensor_changed(DOOR, BOX, "off", now=0.0)
+    assert timeout.reason == engine.REASON_TIMEOUT_STARTED
+    assert box.wasp_in_box
+    assert box.confidence == engine.CONFIDENCE_TENTATIVE
+
+    decision = settle(box, clock, box.wasp_sensor_changed(MOTION, WASP, now=5.0), "off")
+    assert decision.reason == engine.REASON_RETRACTED
+    assert decision.cancel == engine.TIMEOUT
+    assert decision.write
+    assert not box.wasp_in_box
+    assert box.confidence is None
+
+    # The cancelled timeout can not confirm the wasp anymore
+    clock.now = timeout.schedule.when
+    assert box.deadline_reached(timeout.schedule).reason == engine.REASON_STALE
+    assert not box.wasp_in_box
+
+
+def test_optimistic_then_confirmed(clock):
+    """An optimistic box is confirmed by the timeout."""
+    box = make_engine(clock, {DOOR: "on", MOTION: "on"}, optimistic=True)
+
+    timeout = box.box_sensor_changed(DOOR, BOX, "off", now=0.0).schedule
+    clock.now = timeout.when
+    assert box.deadline_reached(timeout).reason == engine.REASON_OCCUPIED
+    assert box.wasp_in_box
+    assert box.confidence == engine.CONFIDENCE_CONFIRMED
+
+
+def test_restore_resumes_passed_deadline(clock):
+    """A timeout that passed while not running is due right after a restore."""
+    box = make_engine(clock, {DOOR: "on", MOTION: "on"})
+    box.box_sensor_changed(DOOR, BOX, "off", now=0.0)
+    # Wall clock time is the engine clock plus 1000 seconds
+    data = box.snapshot(1000.0)
+    assert data["deadlines"][0]["deadline"] == 1060.0
+
+    # Restarted 500 seconds of wall clock time later on a new loop clock
+    clock.now = 10.0
+    restored = engine.WaspBoxEngine(box.config, clock)
+    restored.restore(data, 1490.0)
+    restored.rescan({DOOR: "off", MOTION: "on"}.get)
+
+    (timeout,) = restored.pending_deadlines()
+    assert timeout.key == engine.TIMEOUT
+    assert timeout.when < clock.now
+    assert restored.deadline_reached(timeout).reason == engine.REASON_OCCUPIED
+    assert restored.wasp_in_box
+
+
+def test_restore_keeps_sensor_from_area(clock):
+    """Restored state of a sensor of an area is kept until the area is resolved."""
+    resolved = models.BoxConfig(
+        name="office",
+        wasp_sensors=frozenset({MOTION}),
+        box_sensors=frozenset({DOOR}),
+        wasp_areas=frozenset({"office"}),
+        adaptive_delay=True,
+    )
+    box = engine.WaspBoxEngine(resolved, clock)
+    box.rescan({DOOR: "off", MOTION: "off"}.get)
+    box.wasp_sensor_changed(MOTION, WASP, now=0.0, state="on")
+    data = box.snapshot(0.0)
+
+    # The motion sensor is only known through its area when restoring
+    restored = engine.WaspBoxEngine(
+        models.BoxConfig(
+            name="office",
+            box_sensors=frozenset({DOOR}),
+            wasp_areas=frozenset({"office"}),
+            adaptive_delay=True,
+        ),
+        clock,
+    )
+    restored.restore(data, 0.0)
+    assert restored.update_sensors(resolved) == []
+
+    assert [deadline.key for deadline in restored.pending_deadlines()] == [MOTION]
+    assert MOTION in restored.snapshot(0.0)["last_event"]
+    assert restored.snapshot(0.0)["adaptive"][MOTION]["changes"] == 1
+    assert restored.snapshot(0.0)["adaptive"][MOTION]["last_on"] == 0.0
+
+
+def test_reconfigure_keeps_state_and_timeout(clock):
+    """A changed timeout keeps the occupancy and the pending timeout."""
+    box = make_engine(clock, {DOOR: "on", MOTION: "on"}, optimistic=True)
+    timeout = box.box_sensor_changed(DOOR, BOX, "off", now=0.0).schedule
+    assert box.wasp_in_box and box.tentative
+
+    dropped = box.reconfigure(
+        models.BoxConfig(
+            name="office",
+            wasp_sensors=frozenset({MOTION}),
+            box_sensors=frozenset({DOOR}),
+            timeout=120.0,
+            optimistic=True,
+        )
+    )
+    box.rescan({DOOR: "off", MOTION: "on"}.get)
+
+    assert dropped == []
+    assert box.wasp_in_box and box.tentative
+    assert box.pending_deadlines() == [timeout]
+    clock.now = timeout.when
+    assert box.deadline_reached(timeout).reason == engine.REASON_OCCUPIED
+
+
+def test_update_sensors_drops_removed_sensor(clock):
+    """The pending state of a sensor that is no longer configured is dropped."""
+    box = make_engine(clock, {DOOR: "off", MOTION: "off"})
+    box.wasp_sensor_changed(MOTION, WASP, now=0.0)
+
+    dropped = box.update_sensors(
+        models.BoxConfig(name="office", box_sensors=frozenset({DOOR}))
+    )
+    assert [deadline.key for deadline in dropped] == [MOTION]
+    assert not box.pending
+    assert MOTION not in box.snapshot(0.0)["last_event"]
+
+
+def test_threshold_hysteresis(clock):
+    """A numeric sensor only changes when it crosses the hysteresis band."""
+    box = make_engine(
+        clock,
+        {DOOR: "off", CO2: "700"},
+        wasp_sensors=frozenset({CO2}),
+        thresholds={CO2: models.ThresholdRule(upper=800.0, hysteresis=50.0)},
+    )
+    assert not box.wasp_seen
+
+    # Within the band below the upper edge, still off
+    assert box.wasp_sensor_changed(CO2, WASP, now=0.0, state="849").reason == (
+        engine.REASON_UNCHANGED
+    )
+
+    decision = box.wasp_sensor_changed(CO2, WASP, now=1.0, state="851")
+    assert decision.reason == engine.REASON_DEBOUNCE
+    settle(box, clock, decision, "851")
+    assert box.wasp_seen and box.wasp_in_box
+
+    # Within the band above the lower edge, still on
+    assert box.wasp_sensor_changed(CO2, WASP, now=5.0, state="751").reason == (
+        engine.REASON_UNCHANGED
+    )
+
+    decision = box.wasp_sensor_changed(CO2, WASP, now=6.0, state="749")
+    settle(box, clock, decision, "749")
+    assert not box.wasp_seen
+
+
+def test_threshold_rule_edges():
+    """Both limits of a rule keep the previous state within the hysteresis."""
+    below = models.ThresholdRule(lower=10.0, hysteresis=1.0)
+    assert below.is_on(8.9, False)
+    assert not below.is_on(9.5, False)
+    assert below.is_on(10.5, True)
+    assert not below.is_on(11.1, True)
+
+    between = models.ThresholdRule(lower=10.0, upper=20.0, hysteresis=1.0)
+    assert between.is_on(15.0, False)
+    assert not between.is_on(10.5, False)
+    assert between.is_on(10.5, True)
+    assert between.is_on(19.5, True)
+    assert not between.is_on(21.5, True)
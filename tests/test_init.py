@@ -0,0 +1,211 @@
+"""Tests for the boxes imported from YAML."""
+
+from __future__ import annotations
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from homeassistant.core import HomeAssistant
+from homeassistant.data_entry_flow import FlowResultType
+from homeassistant.helpers import entity_registry as er
+from homeassistant.setup import async_setup_component
+import homeassistant.util.dt as dt_util
+import pytest
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_fire_time_changed,
+)
+import voluptuous as vol
+
+from custom_components.wasp_sensor import CONFIG_SCHEMA, async_import_yaml
+from custom_components.wasp_sensor.const import DOMAIN, SERVICE_RELOAD
+
+MOTION = "binary_sensor.motion"
+DOOR = "binary_sensor.door"
+CO2 = "sensor.co2"
+
+BOX = {
+    "name": "office",
+    "wasp_sensors": [MOTION],
+    "box_sensors": [DOOR],
+    "timeout": 60,
+    "sensor_change_delay": 0,
+}
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Load the integration from custom_components."""
+    yield
+
+
+@pytest.mark.parametrize(
+    ("thresholds", "message"),
+    [
+        ({}, "need a threshold rule: sensor.co2"),
+        (
+            {CO2: {"upper": 800}, "sensor.other": {"upper": 1}},
+            "does not use: sensor.other",
+        ),
+    ],
+)
+def test_yaml_thresholds_match_sensors(thresholds, message) -> None:
+    """Numeric sensors need a rule and every rule needs a sensor of the box."""
+    box = {**BOX, "wasp_sensors": [MOTION, CO2], "thresholds": thresholds}
+    with pytest.raises(vol.Invalid, match=message):
+        CONFIG_SCHEMA({DOMAIN: [box]})
+
+    CONFIG_SCHEMA({DOMAIN: [{**box, "thresholds": {CO2: {"upper": 800}}}]})
+
+
+async def test_import_is_idempotent(hass: HomeAssistant) -> None:
+    """Importing the same YAML again does not add entries."""
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: [BOX]})
+    await hass.async_block_till_done()
+    (entry,) = hass.config_entries.async_entries(DOMAIN)
+    assert entry.unique_id == "office"
+
+    await async_import_yaml(hass, CONFIG_SCHEMA({DOMAIN: [BOX]}))
+    await hass.async_block_till_done()
+    assert hass.config_entries.async_entries(DOMAIN) == [entry]
+
+
+async def test_changed_timeout_keeps_state_and_timeout(hass: HomeAssistant) -> None:
+    """A changed YAML timeout reconfigures the running box without a reload."""
+    hass.states.async_set(MOTION, "on")
+    hass.states.async_set(DOOR, "on")
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: [BOX]})
+    await hass.async_block_till_done()
+
+    (entry,) = hass.config_entries.async_entries(DOMAIN)
+    box = hass.data[DOMAIN][entry.entry_id].box
+
+    # The box closes while a wasp is seen, the timeout starts
+    hass.states.async_set(DOOR, "off")
+    await hass.async_block_till_done()
+    assert hass.states.get(box.entity_id).state == "off"
+    assert box.engine.pending
+
+    await async_import_yaml(hass, CONFIG_SCHEMA({DOMAIN: [{**BOX, "timeout": 120}]}))
+    await hass.async_block_till_done()
+
+    assert hass.data[DOMAIN][entry.entry_id].box is box
+    assert box.box_config.timeout == 120
+    assert box.engine.pending
+    assert hass.states.get(box.entity_id).state == "off"
+
+    # The pending timeout still elapses 60 seconds after the box closed
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=61))
+    await hass.async_block_till_done()
+    assert hass.states.get(box.entity_id).state == "on"
+
+
+async def test_group_members_are_binary_sensors(
+    hass: HomeAssistant, caplog: pytest.LogCaptureFixture
+) -> None:
+    """A numeric sensor in a group is skipped, a group can not give it a rule."""
+    hass.states.async_set("group.office", "on", {"entity_id": [MOTION, CO2]})
+    box = {**BOX, "wasp_sensors": ["group.office"]}
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: [box]})
+    await hass.async_block_till_done()
+    (entry,) = hass.config_entries.async_entries(DOMAIN)
+
+    box = hass.data[DOMAIN][entry.entry_id].box
+    assert box.sensor_config.wasp_sensors == frozenset({MOTION})
+    assert "Skipping sensor.co2 of group.office" in caplog.text
+
+
+async def test_options_of_yaml_box_are_managed_in_yaml(hass: HomeAssistant) -> None:
+    """The options flow refuses boxes in YAML, until the YAML section is removed."""
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: [BOX]})
+    await hass.async_block_till_done()
+    (entry,) = hass.config_entries.async_entries(DOMAIN)
+
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    assert result["type"] is FlowResultType.ABORT
+    assert result["reason"] == "managed_in_yaml"
+
+    with patch(
+        "custom_components.wasp_sensor.conf_util.async_hass_config_yaml",
+        return_value={},
+    ):
+        await hass.services.async_call(DOMAIN, SERVICE_RELOAD, blocking=True)
+        await hass.async_block_till_done()
+
+    assert hass.config_entries.async_entries(DOMAIN) == [entry]
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    assert result["type"] is FlowResultType.FORM
+
+
+async def test_yaml_box_keeps_its_entity(hass: HomeAssistant) -> None:
+    """The entity of the YAML platform moves to the imported entry."""
+    registry = er.async_get(hass)
+    registry.async_get_or_create(
+        "binary_sensor", DOMAIN, f"{DOMAIN}_office", suggested_object_id="legacy"
+    )
+
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: [BOX]})
+    await hass.async_block_till_done()
+    (entry,) = hass.config_entries.async_entries(DOMAIN)
+
+    entity = registry.async_get("binary_sensor.legacy")
+    assert entity.unique_id == entry.entry_id
+    assert entity.config_entry_id == entry.entry_id
+    assert hass.states.get("binary_sensor.legacy") is not None
+
+
+async def test_box_names_are_unique(hass: HomeAssistant) -> None:
+    """A box in the UI and a box in YAML can not have the same name."""
+    ui_entry = MockConfigEntry(
+        domain=DOMAIN,
+        title="office",
+        unique_id="office",
+        data={"name": "office"},
+        options={"wasp_sensors": [MOTION]},
+        minor_version=2,
+    )
+    ui_entry.add_to_hass(hass)
+
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: [BOX]})
+    await hass.async_block_till_done()
+    assert hass.config_entries.async_entries(DOMAIN) == [ui_entry]
+    assert ui_entry.options == {"wasp_sensors": [MOTION]}
+
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": "user"}, data={"name": "office"}
+    )
+    assert result["type"] is FlowResultType.ABORT
+    assert result["reason"] == "already_configured"
+
+
+async def test_migration_identifies_boxes_by_name(hass: HomeAssistant) -> None:
+    """Boxes set up in the UI before get their name as unique ID."""
+    entry = MockConfigEntry(domain=DOMAIN, title="office", data={"name": "office"})
+    entry.add_to_hass(hass)
+
+    assert await async_setup_component(hass, DOMAIN, {})
+    await hass.async_block_till_done()
+    assert entry.unique_id == "office"
+    assert entry.minor_version == 2
+
+
+async def test_attributes_are_recorded_unless_configured(hass: HomeAssistant) -> None:
+    """The attributes are only kept out of the recorder with the option."""
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: [BOX]})
+    await hass.async_block_till_done()
+    (entry,) = hass.config_entries.async_entries(DOMAIN)
+    box = hass.data[DOMAIN][entry.entry_id].box
+
+    unrecorded = hass.states.get(box.entity_id).state_info["unrecorded_attributes"]
+    assert "wasp_in_box" not in unrecorded
+    assert "sensor_change_delays" in unrecorded
+
+    # The entity class changes with the option, the entry is reloaded
+    await async_import_yaml(
+        hass, CONFIG_SCHEMA({DOMAIN: [{**BOX, "unrecorded_attributes": True}]})
+    )
+    await hass.async_block_till_done()
+    box = hass.data[DOMAIN][entry.entry_id].box
+
+    unrecorded = hass.states.get(box.entity_id).state_info["unrecorded_attributes"]
+    assert {"wasp_in_box", "box_closed", "wasp_seen", "confidence"} <= unrecorded
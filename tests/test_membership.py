@@ -0,0 +1,139 @@
+"""Tests for the members of the areas, labels and groups of a box."""
+
+from __future__ import annotations
+
+from homeassistant.components.binary_sensor import BinarySensorDeviceClass
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import (
+    area_registry as ar,
+    device_registry as dr,
+    entity_registry as er,
+    label_registry as lr,
+)
+from homeassistant.setup import async_setup_component
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.wasp_sensor.const import DOMAIN
+
+DOOR = "binary_sensor.door"
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Load the integration from custom_components."""
+    yield
+
+
+def add_sensor(
+    hass: HomeAssistant,
+    object_id: str,
+    device_class: BinarySensorDeviceClass,
+    device_id: str | None = None,
+) -> str:
+    """Register a binary sensor, return its entity_id."""
+    return (
+        er.async_get(hass)
+        .async_get_or_create(
+            "binary_sensor",
+            "test",
+            object_id,
+            suggested_object_id=object_id,
+            original_device_class=device_class,
+            device_id=device_id,
+        )
+        .entity_id
+    )
+
+
+async def async_setup_box(hass: HomeAssistant, **config):
+    """Set up a box from YAML, return the running box."""
+    box = {"name": "office", "timeout": 60, "sensor_change_delay": 0, **config}
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: [box]})
+    await hass.async_block_till_done()
+    (entry,) = hass.config_entries.async_entries(DOMAIN)
+    return hass.data[DOMAIN][entry.entry_id].box
+
+
+async def test_sensors_of_an_area(hass: HomeAssistant) -> None:
+    """The sensors of an area and of its devices with a matching device class."""
+    area = ar.async_get(hass).async_create("Office")
+    hallway = ar.async_get(hass).async_create("Hallway")
+    config_entry = MockConfigEntry(domain="test")
+    config_entry.add_to_hass(hass)
+    device = dr.async_get(hass).async_get_or_create(
+        config_entry_id=config_entry.entry_id, identifiers={("test", "multisensor")}
+    )
+    dr.async_get(hass).async_update_device(device.id, area_id=area.id)
+
+    ent_reg = er.async_get(hass)
+    motion = add_sensor(hass, "motion", BinarySensorDeviceClass.MOTION)
+    ent_reg.async_update_entity(motion, area_id=area.id)
+    presence = add_sensor(hass, "presence", BinarySensorDeviceClass.PRESENCE, device.id)
+    # A sensor with an area of its own is not in the area of its device
+    moved = add_sensor(hass, "moved", BinarySensorDeviceClass.MOTION, device.id)
+    ent_reg.async_update_entity(moved, area_id=hallway.id)
+    window = add_sensor(hass, "window", BinarySensorDeviceClass.WINDOW, device.id)
+
+    box = await async_setup_box(hass, wasp_areas=[area.id], box_areas=[area.id])
+
+    assert box.sensor_config.wasp_sensors == frozenset({motion, presence})
+    assert box.sensor_config.box_sensors == frozenset({window})
+
+
+async def test_area_changes_are_followed(hass: HomeAssistant) -> None:
+    """Sensors moving in or out of an area are followed without a reload."""
+    area = ar.async_get(hass).async_create("Office")
+    ent_reg = er.async_get(hass)
+    motion = add_sensor(hass, "motion", BinarySensorDeviceClass.MOTION)
+    box = await async_setup_box(hass, wasp_areas=[area.id], box_sensors=[DOOR])
+    assert box.sensor_config.wasp_sensors == frozenset()
+
+    ent_reg.async_update_entity(motion, area_id=area.id)
+    await hass.async_block_till_done()
+    assert box.sensor_config.wasp_sensors == frozenset({motion})
+
+    # The box gets the state changes of the new member
+    hass.states.async_set(motion, "on")
+    await hass.async_block_till_done()
+    assert box.metrics.events_received == 1
+
+    ent_reg.async_update_entity(motion, disabled_by=er.RegistryEntryDisabler.USER)
+    await hass.async_block_till_done()
+    assert box.sensor_config.wasp_sensors == frozenset()
+
+
+async def test_sensors_with_a_label(hass: HomeAssistant) -> None:
+    """The sensors with a label, also when only their device has it."""
+    label = lr.async_get(hass).async_create("Doors")
+    config_entry = MockConfigEntry(domain="test")
+    config_entry.add_to_hass(hass)
+    device = dr.async_get(hass).async_get_or_create(
+        config_entry_id=config_entry.entry_id, identifiers={("test", "contact")}
+    )
+    door = add_sensor(hass, "front_door", BinarySensorDeviceClass.DOOR, device.id)
+    garage = add_sensor(hass, "garage", BinarySensorDeviceClass.GARAGE_DOOR)
+    er.async_get(hass).async_update_entity(garage, labels={label.label_id})
+
+    box = await async_setup_box(
+        hass, wasp_sensors=["binary_sensor.motion"], box_labels=[label.label_id]
+    )
+    assert box.sensor_config.box_sensors == frozenset({garage})
+
+    dr.async_get(hass).async_update_device(device.id, labels={label.label_id})
+    await hass.async_block_till_done()
+    assert box.sensor_config.box_sensors == frozenset({garage, door})
+
+
+async def test_members_of_groups(hass: HomeAssistant) -> None:
+    """Groups in groups count as their members and are followed."""
+    hass.states.async_set("group.doors", "off", {"entity_id": [DOOR, "group.more"]})
+    hass.states.async_set("group.more", "off", {"entity_id": ["binary_sensor.back"]})
+    box = await async_setup_box(
+        hass, wasp_sensors=["binary_sensor.motion"], box_sensors=["group.doors"]
+    )
+    assert box.sensor_config.box_sensors == frozenset({DOOR, "binary_sensor.back"})
+
+    hass.states.async_set("group.more", "off", {"entity_id": ["binary_sensor.side"]})
+    await hass.async_block_till_done()
+    assert box.sensor_config.box_sensors == frozenset({DOOR, "binary_sensor.side"})
@@ -0,0 +1,55 @@
+"""Tests for the counters and latency histograms."""
+
+from __future__ import annotations
+
+from benchmarks.core import load_module
+
+metrics = load_module("metrics")
+
+# Every bucket is this much wider than the previous one
+BUCKET_WIDTH = 2**0.25
+
+
+def test_percentiles_within_a_bucket():
+    """A percentile is the upper bound of its bucket, never above the maximum."""
+    histogram = metrics.LatencyHistogram()
+    for _ in range(98):
+        histogram.record(0.001)
+    histogram.record(0.01)
+    histogram.record(1.0)
+
+    assert 0.001 <= histogram.percentile(0.5) <= 0.001 * BUCKET_WIDTH
+    assert 0.01 <= histogram.percentile(0.99) <= 0.01 * BUCKET_WIDTH
+    assert histogram.percentile(1.0) == 1.0
+
+    summary = histogram.as_dict()
+    assert summary["count"] == 100
+    assert summary["max_ms"] == 1000.0
+    assert summary["mean_ms"] == round((0.098 + 0.01 + 1.0) / 100 * 1000, 4)
+
+
+def test_empty_histogram():
+    """Without durations there are no percentiles."""
+    summary = metrics.LatencyHistogram().as_dict()
+    assert summary["count"] == 0
+    assert summary["mean_ms"] is None
+    assert summary["p99_ms"] is None
+
+
+def test_total_of_boxes():
+    """The total adds the counters and merges the latencies of all boxes."""
+    first, second = metrics.Metrics(), metrics.Metrics()
+    first.events_received = 3
+    first.writes_issued = 1
+    first.latency.record(0.002)
+    second.events_received = 2
+    second.latency.record(0.5)
+
+    total = metrics.Metrics.total([first, second])
+    assert total.events_received == 5
+    assert total.writes_issued == 1
+    assert total.latency.count == 2
+    assert total.latency.max == 0.5
+    assert total.as_dict()["latency"]["max_ms"] == 500.0
+    # The metrics of the boxes are left alone
+    assert first.latency.count == 1
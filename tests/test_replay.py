@@ -0,0 +1,116 @@
+"""Tests for replaying recorder history."""
+
+from __future__ import annotations
+
+import pytest
+
+from benchmarks import replay
+
+MOTION = "binary_sensor.motion"
+DOOR = "binary_sensor.door"
+BOX = "binary_sensor.office"
+
+CONFIG = {
+    "name": "office",
+    "wasp_sensors": [MOTION],
+    "box_sensors": [DOOR],
+    "timeout": 60,
+    "sensor_change_delay": 5,
+}
+
+HISTORY = [
+    (DOOR, "on", 50.0),
+    (MOTION, "off", 50.0),
+    (BOX, "off", 50.0),
+    (DOOR, "off", 100.0),
+    # A flap within the sensor change delay
+    (MOTION, "on", 110.0),
+    (MOTION, "off", 112.0),
+    (MOTION, "on", 120.0),
+    # Only the attributes changed
+    (MOTION, "on", 121.0),
+    (BOX, "on", 130.0),
+    (DOOR, "on", 300.0),
+    (BOX, "off", 300.0),
+    (MOTION, "off", 310.0),
+]
+
+
+def test_load_history(recorder_db):
+    """The states at the start and the changes after it, in time order."""
+    connection = replay.connect(recorder_db(HISTORY))
+    initial, events, start, end = replay.load_history(
+        connection, [MOTION, DOOR], start=105.0, end=1000.0
+    )
+
+    assert initial == {MOTION: "off", DOOR: "off"}
+    assert events == [
+        (110.0, MOTION, "on"),
+        (112.0, MOTION, "off"),
+        (120.0, MOTION, "on"),
+        (300.0, DOOR, "on"),
+        (310.0, MOTION, "off"),
+    ]
+    assert (start, end) == (105.0, 1000.0)
+
+
+def test_not_a_recorder_database(tmp_path):
+    """Databases from before Home Assistant 2023.4 are refused."""
+    path = tmp_path / "old.db"
+    replay.sqlite3.connect(path).close()
+
+    with pytest.raises(SystemExit, match="2023.4 or newer"):
+        replay.connect(str(path))
+
+
+def test_replay_and_compare(recorder_db):
+    """The replayed occupancy follows the engine and is compared with the box."""
+    config = replay.box_config(CONFIG)
+    connection = replay.connect(recorder_db(HISTORY))
+    initial, events, start, end = replay.load_history(
+        connection, [MOTION, DOOR, BOX], end=1000.0
+    )
+
+    timeline = replay.replay(
+        config, initial, [event for event in events if event[1] != BOX], start, end
+    )
+    # Occupied once the sensor change delay after the last motion passed
+    assert timeline.intervals() == [(125.0, 300.0)]
+    assert replay.summarize(timeline) == {
+        "occupied_seconds": 175.0,
+        "occupied_intervals": 1,
+        "changes": 2,
+    }
+
+    recorded = replay.recorded_timeline(
+        initial[BOX], (event for event in events if event[1] == BOX), start, end
+    )
+    assert replay.compare_timelines(timeline, recorded) == {
+        "seconds": 950.0,
+        "agreement": round(1 - 5 / 950, 6),
+        "false_on": 5.0,
+        "false_off": 0.0,
+    }
+
+
+def test_compare_without_numpy(monkeypatch):
+    """The comparison gives the same result with and without NumPy."""
+    replayed = replay.Timeline(0.0, False)
+    for when, value in ((10.0, True), (40.0, False), (70.0, True)):
+        replayed.record(when, value)
+    replayed.close(100.0)
+    recorded = replay.Timeline(5.0, False)
+    for when, value in ((20.0, True), (50.0, False)):
+        recorded.record(when, value)
+    recorded.close(90.0)
+
+    expected = {
+        "seconds": 85.0,
+        "agreement": round(1 - 40 / 85, 6),
+        "false_on": 30.0,
+        "false_off": 10.0,
+    }
+    assert replay.compare_timelines(replayed, recorded) == expected
+    monkeypatch.setattr(replay, "np", None)
+    assert replay.compare_timelines(replayed, recorded) == expected
+    assert replay.summarize(replayed)["occupied_seconds"] == 60.0
@@ -0,0 +1,101 @@
+"""Tests for the actions of Wasp Sensor."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.setup import async_setup_component
+import pytest
+
+from custom_components.wasp_sensor.const import DOMAIN, SERVICE_DUMP_TRACE
+
+MOTION = "binary_sensor.motion"
+DOOR = "binary_sensor.door"
+
+BOX = {
+    "name": "office",
+    "wasp_sensors": [MOTION],
+    "box_sensors": [DOOR],
+    "timeout": 60,
+    "sensor_change_delay": 0,
+}
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Load the integration from custom_components."""
+    yield
+
+
+@pytest.fixture
+async def traced(hass: HomeAssistant) -> str:
+    """Set up a box with tracing and one without, return the traced entity."""
+    hass.states.async_set(MOTION, "off")
+    hass.states.async_set(DOOR, "on")
+    boxes = [{**BOX, "trace_size": 10}, {**BOX, "name": "attic"}]
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: boxes})
+    await hass.async_block_till_done()
+
+    hass.states.async_set(DOOR, "off")
+    await hass.async_block_till_done()
+    return "binary_sensor.office"
+
+
+async def test_dump_trace(hass: HomeAssistant, traced: str) -> None:
+    """Only boxes with tracing enabled return their trace."""
+    response = await hass.services.async_call(
+        DOMAIN, SERVICE_DUMP_TRACE, blocking=True, return_response=True
+    )
+
+    (entry,) = response["traces"][traced]
+    assert list(response["traces"]) == [traced]
+    assert entry["sensor"] == DOOR
+    assert (entry["old_state"], entry["new_state"]) == ("on", "off")
+
+    response = await hass.services.async_call(
+        DOMAIN,
+        SERVICE_DUMP_TRACE,
+        {"entity_id": "binary_sensor.attic"},
+        blocking=True,
+        return_response=True,
+    )
+    assert response == {"traces": {}}
+
+
+async def test_dump_trace_to_file(
+    hass: HomeAssistant, traced: str, tmp_path: Path
+) -> None:
+    """The traces are written to a file in an allowed directory."""
+    hass.config.allowlist_external_dirs = {str(tmp_path)}
+    filename = tmp_path / "trace.json"
+
+    response = await hass.services.async_call(
+        DOMAIN,
+        SERVICE_DUMP_TRACE,
+        {"filename": str(filename)},
+        blocking=True,
+        return_response=True,
+    )
+
+    assert json.loads(filename.read_text()) == response["traces"]
+    assert traced in response["traces"]
+
+
+async def test_dump_trace_refuses_other_paths(
+    hass: HomeAssistant, traced: str, tmp_path: Path
+) -> None:
+    """Writing outside of allowlist_external_dirs is refused."""
+    filename = tmp_path / "trace.json"
+
+    with pytest.raises(HomeAssistantError, match="is not allowed"):
+        await hass.services.async_call(
+            DOMAIN,
+            SERVICE_DUMP_TRACE,
+            {"filename": str(filename)},
+            blocking=True,
+            return_response=True,
+        )
+    assert not filename.exists()
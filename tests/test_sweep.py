@@ -0,0 +1,80 @@
+"""Tests for the timeout and sensor change delay sweep."""
+
+from __future__ import annotations
+
+from benchmarks import sweep
+from benchmarks.replay import Timeline
+
+MOTION = "binary_sensor.motion"
+DOOR = "binary_sensor.door"
+TRUTH = "input_boolean.office_occupied"
+
+HISTORY = [
+    (DOOR, "on", 50.0),
+    (MOTION, "off", 50.0),
+    (TRUTH, "off", 50.0),
+    # A flap of the motion sensor in the empty room
+    (DOOR, "off", 100.0),
+    (MOTION, "on", 110.0),
+    (MOTION, "off", 111.0),
+    (DOOR, "on", 150.0),
+    # Someone comes in and closes the door
+    (TRUTH, "on", 200.0),
+    (DOOR, "off", 210.0),
+    (MOTION, "on", 215.0),
+    (DOOR, "on", 400.0),
+    (TRUTH, "off", 400.0),
+    (MOTION, "off", 405.0),
+]
+
+
+def timeline(start, changes, end):
+    """Return a timeline that is off at the start."""
+    result = Timeline(start, False)
+    for when, value in changes:
+        result.record(when, value)
+    result.close(end)
+    return result
+
+
+def test_score():
+    """Count the errors and the latency of a candidate against the truth."""
+    truth = timeline(
+        0.0, [(10.0, True), (50.0, False), (60.0, True), (70.0, False)], 100.0
+    )
+    replayed = timeline(
+        0.0,
+        [(12.0, True), (30.0, False), (35.0, True), (50.0, False), (80.0, True)],
+        100.0,
+    )
+
+    assert sweep.score(replayed, truth) == {
+        "false_vacancies": 1,
+        "false_occupancies": 1,
+        "missed": 1,
+        "latency_median": 2.0,
+        "latency_mean": 2.0,
+    }
+
+
+def test_evaluate_and_recommend(recorder_db):
+    """A sensor change delay that hides the flap is recommended."""
+    db = recorder_db(HISTORY)
+    config = {"name": "office", "wasp_sensors": [MOTION], "box_sensors": [DOOR]}
+    results = sweep.evaluate((db, config, TRUTH, None, 1000.0, [(60, 0), (60, 1.5)]))
+
+    assert [
+        (result["sensor_change_delay"], result["false_occupancies"])
+        for result in results
+    ] == [(0, 1), (1.5, 0)]
+    assert results[0]["latency_median"] == 15.0
+
+    best = sweep.recommendation(results)
+    assert best["yaml"] == {"timeout": 60, "sensor_change_delay": 1.5}
+    assert best["options"]["sensor_change_delay"] == {
+        "hours": 0,
+        "minutes": 0,
+        "seconds": 1,
+        "milliseconds": 500,
+    }
+    assert best["score"]["latency_median"] == 16.5
@@ -0,0 +1,116 @@
+"""Tests for the timer wheel, driven on a virtual clock without a loop."""
+
+from __future__ import annotations
+
+from benchmarks.core import load_module
+
+timer = load_module("timer")
+
+
+def make_wheel(clock, slots=8):
+    """Return a wheel with a one second tick."""
+    return timer.TimerWheel(clock=clock, resolution=1.0, slots=slots)
+
+
+def test_fires_in_deadline_order(clock):
+    """Timers due in the same advance fire in the order of their deadlines."""
+    wheel = make_wheel(clock)
+    fired = []
+    wheel.schedule_at(3.0, fired.append, "late")
+    wheel.schedule_at(2.0, fired.append, "early")
+    assert len(wheel) == 2
+
+    assert wheel.advance(1.0) == 0
+    assert wheel.advance(3.0) == 2
+    assert fired == ["early", "late"]
+    assert len(wheel) == 0
+
+
+def test_cancel(clock):
+    """A cancelled timer does not fire, cancelling it again is a no-op."""
+    wheel = make_wheel(clock)
+    fired = []
+    cancelled = wheel.schedule(2.0, fired.append, "cancelled", owner="box")
+    wheel.schedule(3.0, fired.append, "kept", owner="other")
+
+    cancelled.cancel()
+    cancelled.cancel()
+    wheel.advance(5.0)
+    assert fired == ["kept"]
+
+
+def test_cancel_owner(clock):
+    """All timers of an owner are cancelled together."""
+    wheel = make_wheel(clock)
+    fired = []
+    wheel.schedule(1.0, fired.append, 1, owner="box")
+    wheel.schedule(2.0, fired.append, 2, owner="box")
+    wheel.schedule(3.0, fired.append, 3, owner="other")
+    assert [item.args for item in wheel.pending("box")] == [(1,), (2,)]
+
+    wheel.cancel_owner("box")
+    assert wheel.pending("box") == []
+    wheel.advance(5.0)
+    assert fired == [3]
+
+
+def test_past_deadline_fires_on_next_tick(clock):
+    """A deadline that already passed fires on the next tick."""
+    clock.now = 10.0
+    wheel = make_wheel(clock)
+    fired = []
+    wheel.schedule_at(4.0, fired.append, "late")
+
+    assert wheel.next_tick() == 11
+    wheel.advance(11.0)
+    assert fired == ["late"]
+
+
+def test_next_tick_across_wrap(clock):
+    """The earliest tick is found across a wrap and beyond one revolution."""
+    clock.now = 5.0
+    wheel = make_wheel(clock)
+    fired = []
+    # Tick 10 is in slot 2, behind the cursor in slot 5
+    wheel.schedule_at(10.0, fired.append, 10)
+    # Tick 20 shares slot 4 with tick 12, more than a revolution away
+    wheel.schedule_at(20.0, fired.append, 20)
+    assert wheel.next_tick() == 10
+
+    assert wheel.advance(10.0) == 1
+    # Nothing within this revolution, check again after it
+    assert wheel.next_tick() == 18
+
+    assert wheel.advance(18.0) == 0
+    assert wheel.next_tick() == 20
+    assert wheel.advance(20.0) == 1
+    assert fired == [10, 20]
+    assert wheel.next_tick() is None
+
+
+def test_advance_beyond_revolution(clock):
+    """Advancing more than a revolution at once fires everything that is due."""
+    wheel = make_wheel(clock)
+    fired = []
+    for deadline in (1.0, 9.0, 17.0, 30.0):
+        wheel.schedule_at(deadline, fired.append, deadline)
+
+    assert wheel.advance(25.0) == 3
+    assert fired == [1.0, 9.0, 17.0]
+    assert len(wheel) == 1
+
+
+def test_timer_scheduled_while_firing(clock):
+    """A timer scheduled by a firing timer fires on a later advance."""
+    wheel = make_wheel(clock)
+    fired = []
+
+    def reschedule() -> None:
+        fired.append("first")
+        wheel.schedule_at(4.0, fired.append, "second")
+
+    wheel.schedule_at(2.0, reschedule)
+    wheel.advance(2.0)
+    assert fired == ["first"]
+    wheel.advance(4.0)
+    assert fired == ["first", "second"]
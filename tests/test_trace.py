@@ -0,0 +1,48 @@
+"""Tests for the trace ring buffer."""
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from benchmarks.core import load_module
+
+trace = load_module("trace")
+
+
+def times(buffer) -> list[float]:
+    """Return the times of the entries of a buffer."""
+    return [
+        datetime.fromisoformat(entry["time"]).timestamp()
+        for entry in buffer.as_list(0.0)
+    ]
+
+
+def test_keeps_the_most_recent_entries():
+    """A full buffer drops its oldest entry, resizing keeps the newest ones."""
+    buffer = trace.TraceBuffer(3)
+    for second in range(5):
+        buffer.record(float(second), "binary_sensor.motion", "off", "on", "seen", True)
+
+    assert len(buffer) == 3
+    assert times(buffer) == [2.0, 3.0, 4.0]
+
+    buffer.resize(2)
+    assert buffer.size == 2
+    assert times(buffer) == [3.0, 4.0]
+
+
+def test_entries_on_the_wall_clock():
+    """Entries are stamped on the wall clock and name their fields."""
+    buffer = trace.TraceBuffer(1)
+    buffer.record(10.0, "binary_sensor.door", None, "off", "box_closed", False)
+
+    assert buffer.as_list(1_700_000_000.0) == [
+        {
+            "time": "2023-11-14T22:13:30+00:00",
+            "sensor": "binary_sensor.door",
+            "old_state": None,
+            "new_state": "off",
+            "reason": "box_closed",
+            "write": False,
+        }
+    ]